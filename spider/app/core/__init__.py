@@ -2,9 +2,10 @@ from .spider import (
     BaseSpider, Spider, WebSpider
 )
 from .crawling import (
-    BaseCrawlingStrategy, CrawlerContext, BFSCrawling,
-    CrawlerContextFactory
+    BaseCrawlingStrategy, CrawlerContext, BFSCrawling, DFSCrawling, PrioritizedCrawling,
+    CrawlerContextFactory, create_url_scorer
 )
+from .frontier import PriorityFrontier, DurableFrontier
 from .parser import (
     BaseParsingStrategy, ParserContext, LinkParser,
     HTMLContentParser, ParserContextFactory
@@ -13,3 +14,18 @@ from .parse_driver import ParseDriver
 from .request_client import (
     BaseRequestClient, AsyncBrowserRequestClient, RequestClient
 )
+from .parse_plan import (
+    ParsePlan, RulePlan, ParsePlanCompiler, parse_plan_compiler
+)
+from .seen_set import (
+    BaseSeenSet, ExactSeenSet, FingerprintSeenSet, ScalableBloomFilter
+)
+from .crawl_graph import CrawlGraph, CSRGraph, stable_url_id
+from .scheduler import RecrawlScheduler, UrlHistory, HistoryStore, optimal_revisit_frequencies
+from .sharding import (
+    ShardedCrawling, ShardLocalCrawling, BaseShardTransport, LocalTransport,
+    create_sharded_crawler, shard_of, url_host, url_path_prefix
+)
+from .budget import CrawlBudget
+from .pipeline import Stage, StageMetrics, StagePipeline
+from .snapshot_store import SnapshotStore, Snapshot, fields_hash
@@ -0,0 +1,139 @@
+""" Crawl budgets
+
+A CrawlBudget limits a crawl by the number of pages fetched, the bytes downloaded, a wall
+clock deadline and the number of pages fetched from each host. The crawler asks the budget
+before scheduling every fetch. Checking and reserving a page happen in one synchronous call
+on the event loop, so concurrent fetch workers never overrun the page limits.
+
+Page sizes are only known after the fetch, so the byte limit may be exceeded by the pages
+that were in flight when it ran out.
+
+A sharded crawl keeps its budget in the coordinator, which adds up the pages and bytes the
+shards report, while each shard only enforces the per-host cap of the hosts it owns.
+"""
+
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+from typing import Any, Callable, Dict, Optional
+from ..enums import BudgetLimit
+
+
+def url_host(url: str) -> str:
+    """ Host of a url, the unit of per-host limits and of host sharding """
+    return urlsplit(url).netloc.lower()
+
+
+class CrawlBudget(object):
+    """ Limits of a crawl, None for no limit
+
+    Args:
+        max_pages: pages fetched
+        max_bytes: bytes downloaded
+        deadline: wall clock time after which no fetch is scheduled
+        max_duration: time after start() after which no fetch is scheduled
+        max_pages_per_host: pages fetched from each host, urls of a host over its cap are
+                            skipped while the rest of the crawl goes on
+    """
+
+    def __init__(self,
+                 max_pages: Optional[int] = None,
+                 max_bytes: Optional[int] = None,
+                 deadline: Optional[datetime] = None,
+                 max_duration: Optional[timedelta] = None,
+                 max_pages_per_host: Optional[int] = None,
+                 host_of: Callable = url_host,
+                 clock: Callable = time.monotonic,
+                 now: Callable = datetime.now):
+        self._max_pages = max_pages
+        self._max_bytes = max_bytes
+        self._deadline = deadline
+        self._max_duration = max_duration
+        self._max_pages_per_host = max_pages_per_host
+        self._host_of = host_of
+        self._clock = clock
+        self._now = now
+        self.start()
+
+    @classmethod
+    def from_rules(cls, rules: Any, **kwargs) -> "CrawlBudget":
+        """ Budget of the max_pages and max_size, in bytes, of ScrapeRules """
+        return cls(max_pages=rules.max_pages, max_bytes=rules.max_size, **kwargs)
+
+    def start(self) -> None:
+        """ Resets the spending, crawlers call it when a crawl starts """
+        self._pages = 0
+        self._bytes = 0
+        self._host_pages: Dict[str, int] = {}
+        self._skipped = 0
+        self._started_at = self._clock()
+        self._exhausted_by: Optional[BudgetLimit] = None
+
+    @property
+    def pages(self) -> int:
+        return self._pages
+
+    @property
+    def bytes(self) -> int:
+        return self._bytes
+
+    @property
+    def exhausted_by(self) -> Optional[BudgetLimit]:
+        """ The first limit that ran out, None while the budget lasts """
+        return self._exhausted_by
+
+    def _check(self) -> Optional[BudgetLimit]:
+        if self._max_pages is not None and self._pages >= self._max_pages:
+            return BudgetLimit.PAGES
+        if self._max_bytes is not None and self._bytes >= self._max_bytes:
+            return BudgetLimit.BYTES
+        if self._max_duration is not None and (
+                self._clock() - self._started_at >= self._max_duration.total_seconds()):
+            return BudgetLimit.DEADLINE
+        if self._deadline is not None and self._now() >= self._deadline:
+            return BudgetLimit.DEADLINE
+        return None
+
+    @property
+    def exhausted(self) -> bool:
+        if self._exhausted_by is None:
+            self._exhausted_by = self._check()
+        return self._exhausted_by is not None
+
+    def try_acquire(self, url: str) -> bool:
+        """ Reserves a page for a fetch of url, False if the budget or the host cap is spent """
+        if self.exhausted:
+            return False
+        if self._max_pages_per_host is not None:
+            host = self._host_of(url)
+            host_pages = self._host_pages.get(host, 0)
+            if host_pages >= self._max_pages_per_host:
+                self._skipped += 1
+                return False
+            self._host_pages[host] = host_pages + 1
+        self._pages += 1
+        return True
+
+    def record_bytes(self, size: int) -> None:
+        self._bytes += size
+
+    def record_progress(self, pages: int, size: int) -> None:
+        """ Sets the pages and bytes spent by crawlers reporting their totals, e.g. shards """
+        self._pages = pages
+        self._bytes = size
+
+    def host_budget(self) -> Optional["CrawlBudget"]:
+        """ A budget with only the per-host cap of this one, None if it has no cap """
+        if self._max_pages_per_host is None:
+            return None
+        return CrawlBudget(max_pages_per_host=self._max_pages_per_host, host_of=self._host_of)
+
+    def stats(self) -> dict:
+        return {
+            'pages': self._pages,
+            'bytes': self._bytes,
+            'seconds': self._clock() - self._started_at,
+            'hosts': len(self._host_pages),
+            'skipped_by_host_cap': self._skipped,
+            'exhausted_by': self._exhausted_by
+        }
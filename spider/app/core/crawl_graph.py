@@ -0,0 +1,175 @@
+""" Link graph of a crawl
+
+CrawlGraph records every link a crawler parses. Urls get dense integer ids in the order they
+are discovered, and edges are appended to growable NumPy arrays instead of per-node lists.
+Freezing the graph produces a CSRGraph, a compressed sparse row adjacency structure that
+answers degree, PageRank and shortest path queries with array operations, and that can be
+saved to a compact .npz file.
+"""
+
+import numpy as np
+from hashlib import blake2b
+from typing import Dict, Iterable, List, Optional
+
+
+def stable_url_id(url: str) -> int:
+    """ Signed 64-bit id of a url, stable across processes unlike hash(url) """
+    return int.from_bytes(blake2b(url.encode('utf-8'), digest_size=8).digest(),
+                          'little', signed=True)
+
+
+class CSRGraph(object):
+    """ An immutable directed graph in compressed sparse row form
+
+    The out-neighbors of node i are indices[indptr[i]:indptr[i + 1]].
+
+    Args:
+        indptr: np.ndarray of int64, length node_count + 1
+        indices: np.ndarray of int32, target node ids
+        urls: url of each node id
+    """
+
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray, urls: List[str]):
+        self.indptr = indptr
+        self.indices = indices
+        self.urls = urls
+
+    @property
+    def node_count(self) -> int:
+        return len(self.indptr) - 1
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.indices)
+
+    def neighbors(self, node_id: int) -> np.ndarray:
+        return self.indices[self.indptr[node_id]: self.indptr[node_id + 1]]
+
+    def out_degree(self) -> np.ndarray:
+        return np.diff(self.indptr)
+
+    def in_degree(self) -> np.ndarray:
+        return np.bincount(self.indices, minlength=self.node_count)
+
+    def pagerank(self, damping: float = 0.85,
+                 max_iterations: int = 100,
+                 tolerance: float = 1e-8) -> np.ndarray:
+        """ PageRank by power iteration, dangling nodes spread their rank uniformly """
+        node_count = self.node_count
+        if node_count == 0:
+            return np.zeros(0)
+        out_degree = self.out_degree()
+        sources = np.repeat(np.arange(node_count), out_degree)
+        dangling = out_degree == 0
+        # rank each edge passes on, dangling nodes pass nothing along edges
+        edge_share = np.zeros(node_count)
+        edge_share[~dangling] = 1.0 / out_degree[~dangling]
+
+        rank = np.full(node_count, 1.0 / node_count)
+        for _ in range(max_iterations):
+            passed = np.bincount(self.indices, weights=(rank * edge_share)[sources],
+                                 minlength=node_count)
+            next_rank = (1 - damping) / node_count + damping * (
+                passed + rank[dangling].sum() / node_count)
+            converged = np.abs(next_rank - rank).sum() < tolerance
+            rank = next_rank
+            if converged:
+                break
+        return rank
+
+    def shortest_path_lengths(self, source: int) -> np.ndarray:
+        """ Number of links from source to every node by breadth first search, -1 if unreachable """
+        distances = np.full(self.node_count, -1, dtype=np.int32)
+        distances[source] = 0
+        frontier = np.array([source])
+        distance = 0
+        while len(frontier):
+            distance += 1
+            starts, ends = self.indptr[frontier], self.indptr[frontier + 1]
+            targets = np.concatenate([self.indices[start:end] for start, end in zip(starts, ends)])
+            targets = np.unique(targets[distances[targets] < 0])
+            distances[targets] = distance
+            frontier = targets
+        return distances
+
+    def save(self, path: str) -> None:
+        """ Saves the graph to a compressed .npz file """
+        np.savez_compressed(path, indptr=self.indptr, indices=self.indices,
+                            urls=np.array(self.urls, dtype=np.str_))
+
+    @classmethod
+    def load(cls, path: str) -> "CSRGraph":
+        with np.load(path) as saved:
+            return cls(saved['indptr'], saved['indices'], saved['urls'].tolist())
+
+
+class CrawlGraph(object):
+    """ Records the link graph of a crawl with dense node ids
+
+    Args:
+        initial_capacity: initial number of edges the arrays can hold
+    """
+
+    def __init__(self, initial_capacity: int = 1024):
+        self._ids: Dict[str, int] = {}
+        self._urls: List[str] = []
+        self._sources = np.empty(initial_capacity, dtype=np.int32)
+        self._targets = np.empty(initial_capacity, dtype=np.int32)
+        self._edge_count = 0
+
+    @property
+    def node_count(self) -> int:
+        return len(self._urls)
+
+    @property
+    def edge_count(self) -> int:
+        return self._edge_count
+
+    def node_id(self, url: str) -> int:
+        """ Dense id of a url, assigned when the url is first seen """
+        node_id = self._ids.get(url)
+        if node_id is None:
+            node_id = len(self._urls)
+            self._ids[url] = node_id
+            self._urls.append(url)
+        return node_id
+
+    def find(self, url: str) -> Optional[int]:
+        return self._ids.get(url)
+
+    def url_of(self, node_id: int) -> str:
+        return self._urls[node_id]
+
+    def _reserve(self, edge_count: int) -> None:
+        capacity = len(self._sources)
+        if edge_count <= capacity:
+            return
+        while capacity < edge_count:
+            capacity *= 2
+        self._sources = np.resize(self._sources, capacity)
+        self._targets = np.resize(self._targets, capacity)
+
+    def add_edges(self, source_url: str, target_urls: Iterable[str]) -> None:
+        """ Records the links of a page """
+        source = self.node_id(source_url)
+        targets = [self.node_id(url) for url in target_urls]
+        end = self._edge_count + len(targets)
+        self._reserve(end)
+        self._sources[self._edge_count: end] = source
+        self._targets[self._edge_count: end] = targets
+        self._edge_count = end
+
+    def add_edge(self, source_url: str, target_url: str) -> None:
+        self.add_edges(source_url, [target_url])
+
+    def freeze(self) -> CSRGraph:
+        """ CSR form of the graph recorded so far, duplicate links are merged """
+        node_count = self.node_count
+        sources = self._sources[:self._edge_count].astype(np.int64)
+        targets = self._targets[:self._edge_count].astype(np.int64)
+        # sorting the combined key groups edges by source and removes duplicates
+        edges = np.unique(sources * max(1, node_count) + targets)
+        sources, targets = np.divmod(edges, max(1, node_count))
+        indptr = np.zeros(node_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=node_count), out=indptr[1:])
+        return CSRGraph(indptr, targets.astype(np.int32), list(self._urls))
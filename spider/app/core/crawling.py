@@ -1,15 +1,24 @@
 import re
 import time
+import asyncio
+import inspect
 from abc import ABC
-from typing import List, Callable, Generator
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, AsyncIterator, Dict, List, Callable, Generator, Iterable, Optional, Pattern, Sequence, Set, Tuple, Union
 from .spider import BaseSpider
-from asyncio import Queue, LifoQueue, PriorityQueue, QueueEmpty
+from asyncio import Queue, LifoQueue
 from ..models.data_models import (
-    ParseRule, ParseResult, URL, HTMLData, CrawlResult
+    ParseRule, ParseRecord, URL, HTMLData, CrawlRecord
 )
 from .parser import ParserContext, LinkParser
+from .frontier import PriorityFrontier, DurableFrontier
+from .seen_set import BaseSeenSet
+from .crawl_graph import CrawlGraph, stable_url_id
+from .budget import CrawlBudget
+from ..utils import NearDuplicateDetector
+from ..enums import DuplicateAction
 from .exceptions import QueueNotProperlyInitialized
-from ..utils import throttled
 from .request_client import BaseRequestClient, RequestClient
 
 class BaseCrawlingStrategy(ABC):
@@ -21,7 +30,7 @@ class BaseCrawlingStrategy(ABC):
                     url_filter_functions: List[Callable] = [],
                     early_stop_control_func: Callable = lambda **kwargs: True,
                     result_filter_func: Callable = lambda result, **kwargs: result,
-                    **kwargs) -> List[ParseResult]:
+                    **kwargs) -> List[ParseRecord]:
         return NotImplemented
 
 
@@ -52,7 +61,7 @@ class CrawlerContext(object):
                     url_filter_functions: List[Callable] = [],
                     early_stop_control_func: Callable = lambda **kwargs: True,
                     result_filter_func: Callable = lambda result, **kwargs: result,
-                    **kwargs) -> List[ParseResult]:
+                    **kwargs) -> List[ParseRecord]:
         return await self._crawling_strategy.crawl(
                         rules=rules, max_depth=max_depth,
                         early_stop_control_func=early_stop_control_func,
@@ -60,9 +69,44 @@ class CrawlerContext(object):
                         result_filter_func=result_filter_func,
                         **kwargs)
 
+    def iter_crawl(self, rules: List[ParseRule],
+                   max_depth: int,
+                   **kwargs) -> AsyncIterator[CrawlRecord]:
+        """ Yields crawled pages as they are parsed, see BFSCrawling.iter_crawl """
+        return self._crawling_strategy.iter_crawl(rules=rules, max_depth=max_depth, **kwargs)
+
+    def complete(self, urls: Iterable[str]) -> None:
+        """ Completes pages whose results are stored, see BFSCrawling.complete """
+        self._crawling_strategy.complete(urls)
+
 
 class BFSCrawling(BaseCrawlingStrategy):
-    """ Uses a spider to perform Breadth First crawling
+    """ Uses a pool of spiders to perform Breadth First crawling
+
+    Fetch workers take urls from the frontier (url_queue) and put fetched pages into
+    web_page_queue, parse workers take pages from there and put the links they find back
+    into the frontier. Both run concurrently, so fetching, parsing and enqueueing overlap
+    instead of advancing one page at a time.
+
+    Every url put into the frontier counts as pending until its page is parsed, or until its
+    fetch is skipped. The crawl is complete when nothing is pending.
+
+    Args:
+        max_concurrency: number of fetch workers, i.e. concurrent requests
+        parse_workers: number of parse workers, each parses pages in the parse executor
+        parse_executor: runs the link parser off the event loop, so parsing never blocks
+                        fetching. By default a thread pool of parse_workers threads is
+                        created for each crawl, lxml releases the GIL while parsing
+        seen_set_factory: creates the set of visited urls, e.g. a FingerprintSeenSet or a
+                          ScalableBloomFilter for large crawls
+        duplicate_detector: recognizes pages nearly duplicating pages crawled before
+        crawl_graph: records every parsed link, its dense ids become the node ids
+        budget: default CrawlBudget of the crawls, checked before each fetch is scheduled
+        duplicate_action: what to skip for such pages, following their links, handing
+                          them to the result sink, or both
+
+    With a DurableFrontier as url_queue, the crawl is checkpointed to disk and an interrupted
+    crawl resumes from its frontier without refetching completed pages.
     """
 
     def __init__(self,
@@ -73,7 +117,14 @@ class BFSCrawling(BaseCrawlingStrategy):
                  url_queue: Queue,
                  web_page_queue: Queue,
                  max_concurrency: int = 50,
-                 throttled_fetch: Callable = throttled,
+                 parse_workers: int = 1,
+                 parse_executor: Optional[Executor] = None,
+                 seen_set_factory: Callable = set,
+                 duplicate_detector: Optional[NearDuplicateDetector] = None,
+                 duplicate_action: DuplicateAction = DuplicateAction.SKIP_ALL,
+                 crawl_graph: Optional[CrawlGraph] = None,
+                 budget: Optional[CrawlBudget] = None,
+                 task_creator: Callable = asyncio.ensure_future,
                  re_compile: Callable = re.compile):
         self._request_client = request_client
         self._spider_class = spider_class
@@ -82,10 +133,24 @@ class BFSCrawling(BaseCrawlingStrategy):
         self._start_url_pattern = re_compile(start_url)
         self._url_queue = url_queue
         self._web_page_queue = web_page_queue
-        self._visited_urls = set()
+        self._visited_urls = seen_set_factory()
+        self._duplicate_detector = duplicate_detector
+        self._duplicate_action = duplicate_action
+        self._crawl_graph = crawl_graph
+        self._budget = budget
+        self._active_budget = budget
         self._re_comile = re_compile
         self._max_concurrency = max_concurrency
-        self._throttled_fetch = throttled_fetch
+        self._parse_workers = parse_workers
+        self._parse_executor = parse_executor
+        self._active_parse_executor: Optional[Executor] = parse_executor
+        self._task_creator = task_creator
+        self._pending = 0
+        self._fetched_pages = 0
+        self._fetched_bytes = 0
+        self._stopped = False
+        self._defer_completion = False
+        self._finished = None
         self._init_queue()
 
     @property
@@ -96,9 +161,21 @@ class BFSCrawling(BaseCrawlingStrategy):
     def spider_class(self, new_spider_class: BaseSpider):
         self._spider_class = new_spider_class
 
+    @property
+    def visited_urls(self) -> Union[Set[str], BaseSeenSet]:
+        return self._visited_urls
+
+    @property
+    def crawl_graph(self) -> Optional[CrawlGraph]:
+        return self._crawl_graph
+
+    @property
+    def fetched_pages(self) -> int:
+        return self._fetched_pages
+
     @property
     def start_url(self):
-        return self.self._start_url
+        return self._start_url
 
     @start_url.setter
     def start_url(self, url):
@@ -107,33 +184,79 @@ class BFSCrawling(BaseCrawlingStrategy):
         self._start_url_pattern = self._re_comile(url)
         self._init_queue()
 
-    async def _visit(self, url, depth, path, neighbor_id=None):
+    async def _fetch(self, url: str, depth: int, parent_id: Optional[int] = None) -> CrawlRecord:
         spider = self._spider_class(
             request_client=self._request_client,
             url_to_request=url
         )
         _, result = await spider.fetch()
-        node = CrawlResult(
-            id=hash(url),
+        node = CrawlRecord(
+            id=self._node_id(url),
             url=url,
             page_src=result,
             relative_depth=depth
         )
 
-        if neighbor_id:
-            node.neighbors.append(neighbor_id)
-            
-        await self._web_page_queue.put(node)
-        self._visited_urls.add(url)
-        path.append(node)
+        if parent_id is not None:
+            node.neighbors.append(parent_id)
+
+        return node
+
+    def _node_id(self, url: str) -> int:
+        if self._crawl_graph is not None:
+            return self._crawl_graph.node_id(url)
+        return stable_url_id(url)
+
+    def _frontier_resumed(self) -> bool:
+        """ Whether the frontier holds a crawl that was interrupted, see DurableFrontier """
+        return getattr(self._url_queue, 'resumed', False)
 
     def _init_queue(self):
+        if self._frontier_resumed():
+            # continue where the crawl stopped instead of starting over
+            for url in self._url_queue.seen_urls():
+                self._visited_urls.add(url)
         # assume queue is empty
-        if len(self._start_url):
-            self._url_queue.put_nowait((self._start_url, 0))
+        elif len(self._start_url):
+            self._visited_urls.add(self._start_url)
+            self._url_queue.put_nowait((self._start_url, 0, None))
+
+    def _enqueue(self, url: str, depth: int, parent_id: Optional[int]) -> None:
+        # urls are marked as visited when they are queued, so no url is fetched twice
+        self._visited_urls.add(url)
+        self._pending += 1
+        self._url_queue.put_nowait((url, depth, parent_id))
+
+    def _enqueue_link(self, link: ParseRecord, parent: CrawlRecord) -> None:
+        self._enqueue(link.value, parent.relative_depth + 1, parent.id)
+
+    def _unpack(self, frontier_item: Any) -> Tuple[str, int, Optional[int]]:
+        """ (url, depth, parent_id) of a frontier item """
+        return frontier_item
+
+    def _should_stop(self, early_stop_control_func: Callable, control_kwargs: dict) -> bool:
+        if self._active_budget is not None and self._active_budget.exhausted:
+            return True
+        return not early_stop_control_func(**control_kwargs)
+
+    def _admit(self, url: str) -> bool:
+        """ Reserves the budget of a fetch, checking and reserving must not be separated by an await """
+        return self._active_budget is None or self._active_budget.try_acquire(url)
 
-    def _queue_empty(self) -> bool:
-        return self._web_page_queue.empty()
+    def _complete(self, url: str) -> None:
+        # durable frontiers remember completed urls, so a resumed crawl skips them
+        complete = getattr(self._url_queue, 'complete', None)
+        if complete is not None:
+            complete(url)
+
+    def _idle(self) -> None:
+        """ Called when nothing is pending, a single process crawl is then complete """
+        self._finished.set()
+
+    def _task_done(self) -> None:
+        self._pending -= 1
+        if self._pending <= 0:
+            self._idle()
 
     def _calculate_depth(self, url) -> float:
         """ Calculate depth relative to the start url """
@@ -152,19 +275,17 @@ class BFSCrawling(BaseCrawlingStrategy):
         """ Use the url until the last slash as base """
         return url[:url.rfind('/')]
 
-    def _links_to_visit(self, parsed_links: List[ParseResult],
+    def _links_to_visit(self, parsed_links: List[ParseRecord],
                         url_filter_function: Callable,
                         max_depth: int
-                       ) -> Generator[List[str], None, None]:
+                       ) -> Generator[ParseRecord, None, None]:
         for link in parsed_links:
             is_unvisited_link = link.value not in self._visited_urls
-            link_matches_filter = url_filter_function(link.value)
-            not_exceeds_depth = self._calculate_depth(link.value) <= max_depth
             should_visit = (is_unvisited_link and
-                            link_matches_filter and
-                            not_exceeds_depth)
+                            url_filter_function(link.value) and
+                            self._calculate_depth(link.value) <= max_depth)
             if should_visit:
-                yield link.value
+                yield link
 
     def _get_url_filter_or_default(self,
                                    url_filter_functions: List[Callable],
@@ -172,124 +293,420 @@ class BFSCrawling(BaseCrawlingStrategy):
         url_filter = None
         try:
             url_filter = url_filter_functions[current_depth]
-        except IndexError:
+        except (IndexError, TypeError):
             url_filter = lambda url: True
 
         return url_filter
 
+    async def _parse_links(self, node: CrawlRecord,
+                           rules: List[ParseRule],
+                           url_filter_functions: List[Callable],
+                           max_depth: int) -> List[ParseRecord]:
+        """
+        Parse the links of a page in the parse executor, relative to the page being parsed.
+        The base url helps the parser to get the correct absolute url when dealing with
+        relative urls.
+        For example, base url changes from foo.com to foo.com/b when the crawler goes to
+        foo.com/b/c. In foo.com/b/c, there is a relative url /d which will be transformed to
+        an absolute url foo.com/b/c/d
+        The base url is passed with each call, since parses run concurrently.
+        """
+        parsed_links = await asyncio.get_event_loop().run_in_executor(
+            self._active_parse_executor,
+            partial(self._parser.parse, node.page_src, rules,
+                    base_url=self._resolve_url_base(node.url)))
+        if self._crawl_graph is not None:
+            self._crawl_graph.add_edges(node.url, (link.value for link in parsed_links))
+        url_filter = self._get_url_filter_or_default(
+            url_filter_functions, self._calculate_depth(node.url))
+        return list(self._links_to_visit(parsed_links, url_filter, max_depth))
+
+    async def _fetch_worker(self, early_stop_control_func: Callable, control_kwargs: dict) -> None:
+        while True:
+            url, depth, parent_id = self._unpack(await self._url_queue.get())
+            fetched = False
+            try:
+                if not self._stopped and self._should_stop(early_stop_control_func, control_kwargs):
+                    # stop scheduling fetches, the remaining frontier is drained
+                    self._stopped = True
+                if not self._stopped and self._admit(url):
+                    self._fetched_pages += 1
+                    node = await self._fetch(url, depth, parent_id)
+                    size = len(node.page_src.encode('utf-8'))
+                    self._fetched_bytes += size
+                    if self._active_budget is not None:
+                        self._active_budget.record_bytes(size)
+                    await self._web_page_queue.put(node)
+                    fetched = True
+            except Exception as e:
+                # failed urls stay in a durable frontier, so a resumed crawl retries them
+                print(f"failed to fetch {url}: {e}")
+            finally:
+                if not fetched:
+                    self._task_done()
+
+    def _duplicate_skips(self, node: CrawlRecord) -> Tuple[bool, bool]:
+        """ Whether to skip the links and the result of a page, as it may be a near duplicate """
+        if (self._duplicate_detector is None or
+                self._duplicate_action == DuplicateAction.KEEP or
+                self._duplicate_detector.check_page(node.url, node.page_src) is None):
+            return False, False
+        return (self._duplicate_action in (DuplicateAction.SKIP_LINKS, DuplicateAction.SKIP_ALL),
+                self._duplicate_action in (DuplicateAction.SKIP_RESULT, DuplicateAction.SKIP_ALL))
+
+    async def _emit(self, node: CrawlRecord,
+                    result_filter_func: Callable,
+                    result_sink: Callable) -> bool:
+        """ Hands a page to the result sink as soon as it is parsed, if it passes the filter
+
+        Returns:
+            whether the page was handed to the result sink
+        """
+        if not result_filter_func(node):
+            return False
+        handled = result_sink(node)
+        if inspect.isawaitable(handled):
+            await handled
+        return True
+
+    async def _parse_worker(self, rules: List[ParseRule],
+                            url_filter_functions: List[Callable],
+                            max_depth: int,
+                            result_filter_func: Callable,
+                            result_sink: Callable) -> None:
+        while True:
+            node = await self._web_page_queue.get()
+            skip_links, skip_result = self._duplicate_skips(node)
+            try:
+                if not self._stopped and not skip_links:
+                    links = await self._parse_links(node, rules, url_filter_functions, max_depth)
+                    for link in links:
+                        self._enqueue_link(link, node)
+            except Exception as e:
+                print(f"failed to parse {node.url}: {e}")
+
+            handed = False
+            try:
+                if not skip_result:
+                    handed = await self._emit(node, result_filter_func, result_sink)
+            except Exception as e:
+                print(f"failed to handle the result of {node.url}: {e}")
+            finally:
+                # results still buffered by the caller are completed by it once stored
+                if not (handed and self._defer_completion):
+                    self._complete(node.url)
+                self._task_done()
+
+    def complete(self, urls: Iterable[str]) -> None:
+        """ Completes pages whose results are stored, after a crawl deferring completion
+
+        A resumed crawl fetches a page again until it is completed, so a caller buffering
+        results completes their pages only once it has flushed them.
+        """
+        for url in urls:
+            self._complete(url)
+        checkpoint = getattr(self._url_queue, 'checkpoint', None)
+        if checkpoint is not None:
+            checkpoint()
+
     async def crawl(self, rules: List[ParseRule],
                     max_depth: int,
                     url_filter_functions: List[Callable] = [],
                     early_stop_control_func: Callable = lambda **kwargs: True, 
                     result_filter_func: Callable = lambda result, **kwargs: result,
-                    **kwargs) -> List[CrawlResult]:
+                    result_sink: Optional[Callable] = None,
+                    budget: Optional[CrawlBudget] = None,
+                    defer_completion: bool = False,
+                    **kwargs) -> List[CrawlRecord]:
         """ Crawls web pages and extracts urls in breadth-first order
         
         Args:
             rules: List of ParseRules used by parser to extract useful information
             max_depth: maximum depth of url level relative to the provided url
-            early_stop_control_func: custom control logic to end crawling loop
+            early_stop_control_func: custom control logic to end crawling loop, checked before each fetch
             url_filter_functions: list of custom url filtering logic where each function filters one level of url, must takes a str and returns a bool value
-            result_filter_func: custom result filtering logic, takes a CrawlResult and returns a bool value
+            result_filter_func: custom result filtering logic, takes a CrawlRecord and returns a bool value
+            result_sink: a function or coroutine function receiving each page that passes result_filter_func
+                         as soon as it is parsed. The crawler keeps no reference to the page afterwards,
+                         so memory tracks the pages in flight instead of the pages visited.
+            budget: overrides the default CrawlBudget for this crawl. Once it runs out no
+                    fetch is scheduled, fetched pages are still parsed and handed to the
+                    result sink and the remaining frontier is drained.
+            defer_completion: pages handed to the result sink are not completed in a durable
+                              frontier, the caller completes them with complete once their
+                              results are stored. Other pages are completed once parsed.
 
         Returns:
-            A list of CrawlResult containing all the web pages visited by the crawler
+            A list of CrawlRecord containing all the web pages visited by the crawler,
+            empty if a result sink is provided
 
         Raises:
             QueueNotProperlyInitialized
-            QueueEmpty
         """
-        try:
-            path = []
-            current_depth = 0
+        path: List[CrawlRecord] = []
+        if result_sink is None:
+            result_sink = path.append
+
+        # url queue should only contain the start url, unless the crawl is resumed
+        if self._url_queue.qsize() > 1 and not self._frontier_resumed():
+            raise QueueNotProperlyInitialized("URL queue should only contain start url")
+
+        self._pending = self._url_queue.qsize()
+        self._fetched_pages = 0
+        self._fetched_bytes = 0
+        self._stopped = False
+        self._defer_completion = defer_completion
+        self._active_budget = budget if budget is not None else self._budget
+        if self._active_budget is not None:
+            self._active_budget.start()
+        self._finished = asyncio.Event()
+        if self._pending == 0:
+            if self._frontier_resumed():
+                print("the frontier holds a finished crawl, nothing is left to crawl")
+            self._idle()
+        if self._finished.is_set():
+            return path
 
-            # url queue should only contain one element
-            if self._url_queue.qsize() > 1:
-                raise QueueNotProperlyInitialized("URL queue should only contain start url")
+        self._active_parse_executor = self._parse_executor
+        if self._active_parse_executor is None:
+            self._active_parse_executor = ThreadPoolExecutor(
+                max_workers=max(1, self._parse_workers))
+        workers = (
+            [self._task_creator(self._fetch_worker(early_stop_control_func, kwargs))
+             for _ in range(max(1, self._max_concurrency))] +
+            [self._task_creator(self._parse_worker(
+                rules, url_filter_functions, max_depth, result_filter_func, result_sink))
+             for _ in range(max(1, self._parse_workers))])
 
-            start_url, depth = self._url_queue.get_nowait()
-            await self._visit(start_url, depth, path)
-            
-            while ((not self._queue_empty()) and 
-                   early_stop_control_func(**kwargs)):
-                node = await self._web_page_queue.get()
-                
-                """
-                Update parser's url base when the crawler step one level deeper.
-                The base url helps the parser to get the correct absolute url when dealing with
-                relative urls.
-                For example, base url changes from foo.com to foo.com/b when the crawler goes to
-                foo.com/b/c. In foo.com/b/c, there is a relative url /d which will be transformed to
-                an absolute url foo.com/b/c/d
-                """
-                self._parser.base_url = self._resolve_url_base(node.url)
-                parsed_links = self._parser.parse(node.page_src, rules)
-                current_depth = self._calculate_depth(node.url)
-                url_filter = self._get_url_filter_or_default(
-                    url_filter_functions, current_depth)
-                
-                batch_visit = []
-                for link in self._links_to_visit(parsed_links, url_filter, max_depth):
-                    print(link)
-                    batch_visit.append(self._visit(
-                        link, depth+1, path, node.id))
-                        
-                await self._throttled_fetch(self._max_concurrency, tasks=batch_visit)
-            
-            return [node for node in path if result_filter_func(node)]
+        try:
+            await self._finished.wait()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            if self._parse_executor is None:
+                self._active_parse_executor.shutdown(wait=False)
+            checkpoint = getattr(self._url_queue, 'checkpoint', None)
+            if checkpoint is not None:
+                checkpoint()
+            if self._active_budget is not None and self._active_budget.exhausted_by is not None:
+                print(f"crawl budget exhausted by {self._active_budget.exhausted_by.value}: "
+                      f"{self._active_budget.stats()}")
+
+        return path
+
+    async def iter_crawl(self, rules: List[ParseRule],
+                         max_depth: int,
+                         buffer_size: Optional[int] = None,
+                         **kwargs) -> AsyncIterator[CrawlRecord]:
+        """ Crawls like crawl, but yields the pages as they are parsed
+
+        At most buffer_size pages wait for the consumer, a slow consumer slows the crawl down
+        instead of piling up pages. To stop the crawl early, close the generator with
+        `await pages.aclose()`, breaking out of the loop alone leaves the crawl running
+        until the generator is garbage collected.
 
-        except QueueEmpty:
-            return path
-        except Exception as e:
-            print(e)
-            raise e
+        Args:
+            buffer_size: pages buffered for the consumer, defaults to max_concurrency
+            kwargs: arguments of crawl, except result_sink
+        """
+        results: Queue = Queue(maxsize=buffer_size or self._max_concurrency)
+        finished = object()
+
+        async def crawl_into_results():
+            try:
+                await self.crawl(rules=rules, max_depth=max_depth,
+                                 result_sink=results.put, **kwargs)
+            except asyncio.CancelledError:
+                # the consumer closed the generator, nothing drains the results any more
+                raise
+            except Exception:
+                await results.put(finished)
+                raise
+            await results.put(finished)
+
+        crawler = self._task_creator(crawl_into_results())
+        try:
+            while True:
+                node = await results.get()
+                if node is finished:
+                    break
+                yield node
+            # surface errors of the crawl
+            await crawler
+        finally:
+            if not crawler.done():
+                crawler.cancel()
+                await asyncio.gather(crawler, return_exceptions=True)
 
 
     
-class DFSCrawling(BaseCrawlingStrategy):
+class DFSCrawling(BFSCrawling):
+    """ Uses a pool of spiders to perform Depth First crawling
 
-    def __init__(self, spider: BaseSpider, task_queue: LifoQueue):
-        self._spider = spider
-        self._task_queue = task_queue
+    The frontier is a LIFO stack, so each of the max_concurrency fetch workers keeps
+    descending along one branch while the others explore their own. The frontier only holds
+    the unvisited siblings along the current branches, i.e. depth x branching urls instead
+    of a whole level like breadth first crawling does on wide sites.
 
-    @property
-    def spider(self) -> BaseSpider:
-        return self._spider
+    Args:
+        max_branching: maximum number of links followed from each page, None for all
+    """
 
-    @spider.setter
-    def spider(self, new_spider: BaseSpider):
-        self._spider = new_spider
+    def __init__(self,
+                 request_client: BaseRequestClient,
+                 spider_class: BaseSpider,
+                 parser: ParserContext,
+                 start_url: str,
+                 url_queue: LifoQueue,
+                 web_page_queue: Queue,
+                 max_branching: Optional[int] = None,
+                 **kwargs):
+        self._max_branching = max_branching
+        super().__init__(request_client=request_client,
+                         spider_class=spider_class,
+                         parser=parser,
+                         start_url=start_url,
+                         url_queue=url_queue,
+                         web_page_queue=web_page_queue,
+                         **kwargs)
+
+    async def _parse_links(self, node: CrawlRecord,
+                           rules: List[ParseRule],
+                           url_filter_functions: List[Callable],
+                           max_depth: int) -> List[ParseRecord]:
+        links = await super()._parse_links(node, rules, url_filter_functions, max_depth)
+        if self._max_branching is not None:
+            links = links[:self._max_branching]
+        # pushed in reverse, so the first link on the page is popped first
+        return links[::-1]
+
+
+def shallow_first_score(url: str, anchor_text: Optional[str], depth: int, parent_score: float) -> float:
+    """ Default url score, shallow urls first like breadth first crawling """
+    return -depth
+
+
+def create_url_scorer(url_patterns: Sequence[Pattern] = (),
+                      url_filters: Sequence[Callable] = (),
+                      pattern_weight: float = 10.0,
+                      filter_weight: float = 1.0,
+                      depth_weight: float = 1.0,
+                      parent_weight: float = 0.5) -> Callable:
+    """ Creates a url scorer favoring target pages
+
+    Args:
+        url_patterns: patterns of target page urls, e.g. ScrapeRules.url_patterns
+        url_filters: predicates over urls, e.g. location or time range filters
+        pattern_weight: score of a url matching a target pattern
+        filter_weight: score of each filter a url passes
+        depth_weight: penalty of each level below the start url
+        parent_weight: share of the parent's score a link inherits
+    """
+    def score(url: str, anchor_text: Optional[str], depth: int, parent_score: float) -> float:
+        url_score = parent_weight * parent_score - depth_weight * depth
+        if any(pattern.search(url) for pattern in url_patterns):
+            url_score += pattern_weight
+        url_score += filter_weight * sum(1 for url_filter in url_filters if url_filter(url))
+        return url_score
+    return score
+
+
+class PrioritizedCrawling(BFSCrawling):
+    """ Best first crawling, the most valuable urls are fetched first
+
+    A url scorer rates every discovered link as
+        url_scorer(url, anchor_text, depth, parent_score) -> float
+    and the frontier serves the highest scores first. A url that is found again while it is
+    still queued is re-prioritized if the new score is higher.
+    Limit the pages fetched with a CrawlBudget, the best urls are fetched before it runs out.
+
+    Args:
+        url_scorer: default scorer of the crawls
+    """
 
-    async def crawl(self, rules: List[ParseRule],
-                    max_depth: int,
-                    url_filter_functions: List[Callable] = [],
-                    early_stop_control_func: Callable = lambda **kwargs: True,
-                    result_filter_func: Callable = lambda result, **kwargs: result,
-                    **kwargs) -> List[ParseResult]:
-        pass
+    def __init__(self,
+                 request_client: BaseRequestClient,
+                 spider_class: BaseSpider,
+                 parser: ParserContext,
+                 start_url: str,
+                 url_queue: PriorityFrontier,
+                 web_page_queue: Queue,
+                 url_scorer: Callable = shallow_first_score,
+                 **kwargs):
+        self._url_scorer = url_scorer
+        self._scores: Dict[str, float] = {}
+        super().__init__(request_client=request_client,
+                         spider_class=spider_class,
+                         parser=parser,
+                         start_url=start_url,
+                         url_queue=url_queue,
+                         web_page_queue=web_page_queue,
+                         **kwargs)
 
-    
-class PrioritizedCrawling(BaseCrawlingStrategy):
+    def _init_queue(self):
+        # assume queue is empty
+        if len(self._start_url):
+            self._visited_urls.add(self._start_url)
+            self._scores[self._start_url] = 0.0
+            self._url_queue.put_nowait((0.0, self._start_url, (0, None)))
 
-    def __init__(self, spider: BaseSpider, task_queue: PriorityQueue):
-        self._spider = spider
-        self._task_queue = task_queue
+    def _unpack(self, frontier_item: Any) -> Tuple[str, int, Optional[int]]:
+        _, url, (depth, parent_id) = frontier_item
+        return url, depth, parent_id
 
-    @property
-    def spider(self) -> BaseSpider:
-        return self._spider
+    def _links_to_visit(self, parsed_links: List[ParseRecord],
+                        url_filter_function: Callable,
+                        max_depth: int
+                       ) -> Generator[ParseRecord, None, None]:
+        for link in parsed_links:
+            # queued urls are visited again, they may deserve a higher priority
+            is_unvisited_link = (link.value not in self._visited_urls or
+                                 self._url_queue.priority_of(link.value) is not None)
+            should_visit = (is_unvisited_link and
+                            url_filter_function(link.value) and
+                            self._calculate_depth(link.value) <= max_depth)
+            if should_visit:
+                yield link
+
+    def _enqueue_link(self, link: ParseRecord, parent: CrawlRecord) -> None:
+        url, depth = link.value, parent.relative_depth + 1
+        score = self._active_scorer(url, link.name, depth, self._scores.get(parent.url, 0.0))
+        queued_priority = self._url_queue.priority_of(url)
 
-    @spider.setter
-    def spider(self, new_spider: BaseSpider):
-        self._spider = new_spider
+        if queued_priority is None:
+            self._visited_urls.add(url)
+            self._pending += 1
+        elif -score >= queued_priority:
+            return
+
+        self._scores[url] = score
+        self._url_queue.put_nowait((-score, url, (depth, parent.id)))
 
     async def crawl(self, rules: List[ParseRule],
                     max_depth: int,
                     url_filter_functions: List[Callable] = [],
                     early_stop_control_func: Callable = lambda **kwargs: True,
                     result_filter_func: Callable = lambda result, **kwargs: result,
-                    **kwargs) -> List[ParseResult]:
-        pass
+                    url_scorer: Optional[Callable] = None,
+                    **kwargs) -> List[CrawlRecord]:
+        """ Crawls web pages and extracts urls in best-first order
+
+        Args:
+            url_scorer: overrides the default url scorer for this crawl
+
+        See BFSCrawling.crawl for the other arguments.
+        """
+        self._active_scorer = url_scorer or self._url_scorer
+        try:
+            return await super().crawl(rules=rules,
+                                       max_depth=max_depth,
+                                       url_filter_functions=url_filter_functions,
+                                       early_stop_control_func=early_stop_control_func,
+                                       result_filter_func=result_filter_func,
+                                       **kwargs)
+        finally:
+            self._scores.clear()
 
 
 class CrawlerContextFactory(object):
@@ -303,7 +720,7 @@ class CrawlerContextFactory(object):
     __queues__ = {
         'bfs_crawler': Queue,
         'dfs_crawler': LifoQueue,
-        'prioritized_crawler': PriorityQueue
+        'prioritized_crawler': PriorityFrontier
     }
     __default_crawler_cls__ = BFSCrawling
     __crawler_context__ = CrawlerContext
@@ -323,6 +740,7 @@ class CrawlerContextFactory(object):
         crawler_cls = cls.__crawler_classes__.get(
             crawler_name, cls.__default_crawler_cls__)
         queue_class = cls.__queues__[crawler_name]
+        url_queue = kwargs.pop('url_queue', None)
 
         ctx = cls.__crawler_context__(
             crawling_strategy_cls=crawler_cls,
@@ -330,17 +748,40 @@ class CrawlerContextFactory(object):
             request_client=request_client,
             parser=parser_context,
             start_url=start_url,
-            url_queue=queue_class(),
-            web_page_queue=queue_class(),
+            url_queue=url_queue if url_queue is not None else queue_class(),
+            # fetched pages wait for parse workers in a bounded FIFO queue
+            web_page_queue=Queue(maxsize=kwargs.get('max_concurrency', 50)),
             **kwargs
         )
         return ctx
 
+    @classmethod
+    def create_resumable(cls,
+                         job_id: str,
+                         frontier_path: str,
+                         start_url: str,
+                         spider_class: BaseSpider,
+                         request_client: BaseRequestClient,
+                         parser_context: ParserContext,
+                         head_size: int = 1024,
+                         frontier_class: Callable = DurableFrontier,
+                         **kwargs) -> CrawlerContext:
+        """ Creates a breadth first crawler whose frontier is kept on disk per job id
+
+        Creating it again with the same job id and frontier path resumes the crawl.
+        """
+        return cls.create('bfs_crawler',
+                          start_url=start_url,
+                          spider_class=spider_class,
+                          request_client=request_client,
+                          parser_context=parser_context,
+                          url_queue=frontier_class(frontier_path, job_id, head_size=head_size),
+                          **kwargs)
+
 
 if __name__ == "__main__":
     import aiohttp
     import asyncio
-    from functools import partial
     from .spider import Spider
     from .parser import ParserContextFactory
     from .parse_driver import ParseDriver
@@ -354,7 +795,7 @@ if __name__ == "__main__":
         start_url = 'http://www.tianqihoubao.com/'
         url_queue, page_queue = Queue(), Queue()
 
-        def is_weather_page(node: CrawlResult):
+        def is_weather_page(node: CrawlRecord):
             return node.relative_depth == 1
 
         def location_code_filter(url:str, location_code: str):
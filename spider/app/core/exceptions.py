@@ -5,4 +5,7 @@ class InvalidBaseURLException(Exception):
     pass
 
 class QueueNotProperlyInitialized(Exception):
-    pass
\ No newline at end of file
+    pass
+
+class InvalidParseRuleException(Exception):
+    pass
@@ -0,0 +1,177 @@
+""" Crawl frontiers
+
+Frontiers are asyncio queues, so crawling strategies can share the same worker pool
+regardless of the order in which they visit urls, or of where the queued urls are kept.
+"""
+
+import sqlite3
+from asyncio import Queue
+from collections import deque
+from heapq import heappush, heappop
+from itertools import count
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+
+class PriorityFrontier(Queue):
+    """ A priority queue of urls that can re-prioritize queued urls
+
+    Items are (priority, url, payload) tuples and lower priorities are served first.
+    Urls with equal priorities are served in insertion order, so payloads never need
+    to be comparable.
+
+    Putting a url that is still queued replaces its entry instead of adding a second one.
+    The old heap entry is only marked as removed and skipped when it reaches the top,
+    so re-prioritization costs O(log n) like a put.
+    """
+
+    def _init(self, maxsize: int) -> None:
+        self._queue: List[list] = []
+        self._entries: Dict[str, list] = {}
+        self._counter = count()
+
+    def _put(self, item: Tuple[float, str, Any]) -> None:
+        priority, url, payload = item
+        queued_entry = self._entries.get(url)
+        if queued_entry is not None:
+            # lazy deletion, the stale entry stays in the heap until it is popped
+            queued_entry[-1] = False
+        entry = [priority, next(self._counter), url, payload, True]
+        self._entries[url] = entry
+        heappush(self._queue, entry)
+
+    def _get(self) -> Tuple[float, str, Any]:
+        while True:
+            priority, _, url, payload, alive = heappop(self._queue)
+            if alive:
+                del self._entries[url]
+                return priority, url, payload
+
+    def qsize(self) -> int:
+        return len(self._entries)
+
+    def empty(self) -> bool:
+        return not self._entries
+
+    def priority_of(self, url: str) -> Optional[float]:
+        """ Priority of a queued url, None if it is not queued """
+        entry = self._entries.get(url)
+        return None if entry is None else entry[0]
+
+
+class DurableFrontier(Queue):
+    """ A FIFO frontier persisted in SQLite that can resume a crawl
+
+    Every queued url is written to the frontier table, but only a bounded head of the queue
+    is kept in memory, the tail is loaded from disk as the head drains. A url stays in the
+    table until the crawler completes it, so the table always holds the queued and the
+    in-flight urls, and the done table holds the completed ones. Writes are committed every
+    checkpoint_interval changes and on checkpoint().
+
+    Opening the same path and job id again resumes the crawl: queued and in-flight urls are
+    queued again in their original order and completed urls are reported by seen_urls.
+
+    Items are (url, depth, parent_id) tuples like the ones of BFSCrawling.
+
+    Args:
+        path: SQLite database file
+        job_id: id of the crawl job, several jobs can share a database
+        head_size: maximum number of urls kept in memory
+        checkpoint_interval: number of changes between commits
+    """
+
+    def __init__(self, path: str, job_id: str,
+                 head_size: int = 1024,
+                 checkpoint_interval: int = 256,
+                 connect: Callable = sqlite3.connect,
+                 **kwargs):
+        self._job_id = job_id
+        self._head_size = max(2, head_size)
+        self._checkpoint_interval = checkpoint_interval
+        self._connection = connect(path)
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS frontier (
+                job_id TEXT, seq INTEGER, url TEXT, depth INTEGER, parent_id INTEGER,
+                PRIMARY KEY (job_id, seq));
+            CREATE INDEX IF NOT EXISTS frontier_url ON frontier (job_id, url);
+            CREATE TABLE IF NOT EXISTS done (
+                job_id TEXT, url TEXT, PRIMARY KEY (job_id, url));
+        """)
+        super().__init__(**kwargs)
+
+    def _init(self, maxsize: int) -> None:
+        self._queue: Deque[Tuple[int, Tuple[str, int, Optional[int]]]] = deque()
+        self._changes = 0
+        last_seq, queued = self._connection.execute(
+            "SELECT MAX(seq), COUNT(*) FROM frontier WHERE job_id = ?", (self._job_id,)).fetchone()
+        done, = self._connection.execute(
+            "SELECT COUNT(*) FROM done WHERE job_id = ?", (self._job_id,)).fetchone()
+        self._last_seq = last_seq or 0
+        self._loaded_seq = 0
+        self._spilled = queued
+        self.resumed = queued > 0 or done > 0
+        self._refill()
+
+    def _refill(self) -> None:
+        rows = self._connection.execute(
+            "SELECT seq, url, depth, parent_id FROM frontier "
+            "WHERE job_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+            (self._job_id, self._loaded_seq, self._head_size - len(self._queue))).fetchall()
+        for seq, url, depth, parent_id in rows:
+            self._queue.append((seq, (url, depth, parent_id)))
+        if rows:
+            self._loaded_seq = rows[-1][0]
+        self._spilled -= len(rows)
+
+    def _changed(self) -> None:
+        self._changes += 1
+        if self._changes >= self._checkpoint_interval:
+            self.checkpoint()
+
+    def _put(self, item: Tuple[str, int, Optional[int]]) -> None:
+        url, depth, parent_id = item
+        self._last_seq += 1
+        self._connection.execute(
+            "INSERT INTO frontier (job_id, seq, url, depth, parent_id) VALUES (?, ?, ?, ?, ?)",
+            (self._job_id, self._last_seq, url, depth, parent_id))
+        if self._spilled == 0 and len(self._queue) < self._head_size:
+            self._queue.append((self._last_seq, item))
+            self._loaded_seq = self._last_seq
+        else:
+            # the tail stays on disk until the head drains
+            self._spilled += 1
+        self._changed()
+
+    def _get(self) -> Tuple[str, int, Optional[int]]:
+        _, item = self._queue.popleft()
+        if self._spilled and len(self._queue) <= self._head_size // 2:
+            self._refill()
+        return item
+
+    def qsize(self) -> int:
+        return len(self._queue) + self._spilled
+
+    def empty(self) -> bool:
+        return self.qsize() == 0
+
+    def complete(self, url: str) -> None:
+        """ Marks a url as done, it will not be fetched again when the crawl resumes """
+        self._connection.execute(
+            "DELETE FROM frontier WHERE job_id = ? AND url = ?", (self._job_id, url))
+        self._connection.execute(
+            "INSERT OR IGNORE INTO done (job_id, url) VALUES (?, ?)", (self._job_id, url))
+        self._changed()
+
+    def seen_urls(self) -> Iterator[str]:
+        """ Urls that are completed, queued or in flight """
+        for url, in self._connection.execute(
+                "SELECT url FROM done WHERE job_id = ? UNION SELECT url FROM frontier WHERE job_id = ?",
+                (self._job_id, self._job_id)):
+            yield url
+
+    def checkpoint(self) -> None:
+        self._connection.commit()
+        self._changes = 0
+
+    def close(self) -> None:
+        self.checkpoint()
+        self._connection.close()
@@ -9,9 +9,214 @@ from bs4.element import Tag
 from lxml import etree
 from lxml.html import fromstring
 from lxml.etree import Element
-from functools import partial
-from typing import Callable, List, Any, Union, Dict, Generator
+from functools import partial, lru_cache
+from typing import Callable, List, Any, Union, Dict, Generator, NamedTuple, Optional
 from gne import GeneralNewsExtractor
+from .selector_matcher import compile_matcher
+from .regex_engine import (
+    RegexRule, VISIBLE_TEXT, RAW_TEXT, compile_scanner
+)
+from .exceptions import InvalidParseRuleException
+
+try:
+    from soupsieve import compile as compile_css
+except ImportError:
+    compile_css = None
+
+
+def _lxml_inner_html(element: Element) -> str:
+    return (element.text or "") + "".join(
+        etree.tostring(child, encoding='unicode') for child in element)
+
+
+def _lxml_attribute(element: Element, attribute_name: str) -> str:
+    return element.get(attribute_name) or ""
+
+
+def _bs4_attribute(element: Tag, attribute_name: str) -> str:
+    attribute_value = element.get(attribute_name)
+    if isinstance(attribute_value, list):
+        # multi-valued attributes like class are split by BeautifulSoup
+        return " ".join(attribute_value)
+    return attribute_value or ""
+
+
+_accessors = {
+    'lxml': {
+        'text': lambda element: element.text_content(),
+        'normalized_text': lambda element: " ".join(element.text_content().split()),
+        'href': partial(_lxml_attribute, attribute_name='href'),
+        'inner_html': _lxml_inner_html,
+        'outer_html': lambda element: etree.tostring(element, encoding='unicode', with_tail=False),
+    },
+    'bs4': {
+        'text': lambda element: element.get_text(),
+        'normalized_text': lambda element: " ".join(element.get_text().split()),
+        'href': partial(_bs4_attribute, attribute_name='href'),
+        'inner_html': lambda element: element.decode_contents(),
+        'outer_html': lambda element: str(element),
+    }
+}
+_attribute_accessors = {
+    'lxml': _lxml_attribute,
+    'bs4': _bs4_attribute
+}
+# regex rules select matched strings, their projections choose the text to scan instead
+_regex_sources = {
+    'text': VISIBLE_TEXT,
+    'normalized_text': VISIBLE_TEXT,
+    'inner_html': RAW_TEXT,
+    'outer_html': RAW_TEXT,
+    # urls are matched in the markup, e.g. inside href attributes
+    'href': RAW_TEXT
+}
+_regex_accessors = {
+    'text': lambda matched: matched,
+    'normalized_text': lambda matched: " ".join(matched.split()),
+    'inner_html': lambda matched: matched,
+    'outer_html': lambda matched: matched,
+    'href': lambda matched: matched
+}
+
+
+@lru_cache(maxsize=1024)
+def compile_xpath(expression: str) -> etree.XPath:
+    """ Compiles and caches an xpath expression, e.g. a relative rule evaluated once per row
+
+    Raises:
+        InvalidParseRuleException
+    """
+    try:
+        return etree.XPath(expression)
+    except etree.XPathSyntaxError as e:
+        raise InvalidParseRuleException(f"Invalid xpath rule {expression}: {e}")
+
+
+def rule_projection(rule: Any) -> str:
+    """ Projection requested by a parse rule, links default to href and others to text """
+    projection = getattr(rule, 'projection', None)
+    if projection:
+        return getattr(projection, 'value', projection)
+    return 'href' if rule.is_link else 'text'
+
+
+def selector_backend(selector_type: str) -> str:
+    """ xpath selects lxml elements, regex selects strings and the others BeautifulSoup tags """
+    if selector_type == 'xpath':
+        return 'lxml'
+    elif selector_type == 'regex':
+        return 'regex'
+    return 'bs4'
+
+
+def regex_rule_of(rule: Any) -> RegexRule:
+    """ Text level view of a regex ParseRule
+
+    Raises:
+        InvalidParseRuleException
+    """
+    projection = rule_projection(rule)
+    if projection not in _regex_sources:
+        raise InvalidParseRuleException(
+            f"Regex rule {rule.rule} cannot project {projection}")
+    return RegexRule(
+        pattern=rule.rule,
+        group=getattr(rule, 'capture_group', 0),
+        first_only=getattr(rule, 'match_mode', 'all') == 'first',
+        source=_regex_sources[projection])
+
+
+def compile_accessor(projection: str, backend: str) -> Callable[[Any], str]:
+    """ Compiles a projection to a direct accessor for elements of the given backend
+
+    Args:
+        projection: an AttributeProjection value or "@name" for an arbitrary attribute
+        backend: 'lxml' or 'bs4', see selector_backend
+
+    Raises:
+        InvalidParseRuleException
+    """
+    if backend == 'regex':
+        if projection not in _regex_accessors:
+            raise InvalidParseRuleException(f"Unsupported projection {projection} for regex rules")
+        return _regex_accessors[projection]
+    if projection.startswith('@') and len(projection) > 1:
+        return partial(_attribute_accessors[backend], attribute_name=projection[1:])
+    try:
+        return _accessors[backend][projection]
+    except KeyError:
+        raise InvalidParseRuleException(
+            f"Unsupported projection {projection} for {backend} elements")
+
+
+class RulePlan(NamedTuple):
+    """ A compiled ParseRule
+
+    Fields:
+        rule: Any, the original ParseRule
+        selector_type: str
+        selector: Any, compiled xpath, regex rule or css expression
+        accessor: Callable, reads the projection of a selected element
+        slice: Optional[slice], applied to the extracted text
+    """
+    rule: Any
+    selector_type: str
+    selector: Any
+    accessor: Callable[[Any], str]
+    slice: Optional[slice]
+
+    def extract(self, element: Any) -> str:
+        """ Projects, strips and slices one selected element """
+        if element is None:
+            return ""
+        value = self.accessor(element).strip()
+        return value if self.slice is None else value[self.slice]
+
+
+def _selector_type(rule: Any) -> str:
+    # rule types may be ParseRuleType members or plain strings
+    return getattr(rule.rule_type, 'value', rule.rule_type)
+
+
+def _compile_slice(rule: Any) -> Optional[slice]:
+    slice_str = getattr(rule, 'slice_str', None)
+    if not slice_str:
+        return None
+    if len(slice_str) != 2:
+        raise InvalidParseRuleException(
+            f"slice_str of {rule.field_name} should be [start, end], got {slice_str}")
+    return slice(*slice_str)
+
+
+def _compile_selector(selector_type: str, rule: Any) -> Any:
+    if selector_type == 'xpath':
+        return compile_xpath(rule.rule)
+    if selector_type == 'regex':
+        regex_rule = regex_rule_of(rule)
+        compile_scanner((regex_rule,))
+        return regex_rule
+    if selector_type == 'css_selector' and compile_css is not None:
+        try:
+            compile_css(rule.rule)
+        except Exception as e:
+            raise InvalidParseRuleException(f"Invalid css selector {rule.rule}: {e}")
+    return rule.rule
+
+
+def compile_rule(rule: Any) -> RulePlan:
+    """ Validates and compiles a ParseRule
+
+    Raises:
+        InvalidParseRuleException
+    """
+    selector_type = _selector_type(rule)
+    return RulePlan(
+        rule=rule,
+        selector_type=selector_type,
+        selector=_compile_selector(selector_type, rule),
+        accessor=compile_accessor(rule_projection(rule), selector_backend(selector_type)),
+        slice=_compile_slice(rule))
+
 
 class ParseDriver(GeneralNewsExtractor):
     """ Creates a Facade for BeautifulSoup, lxml and GeneralNewsExtractor.
@@ -22,64 +227,72 @@ class ParseDriver(GeneralNewsExtractor):
 
     def __init__(self, text: str, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.parsed_text = BeautifulSoup(text, 'lxml')
         self.text = text
+        self._parsed_text = None
+        self._lxml_root = None
+        self._visible_text = None
         self._initialize_selectors()
 
+    @property
+    def parsed_text(self) -> BeautifulSoup:
+        """ BeautifulSoup tree, only built when a non-xpath selector needs it """
+        if self._parsed_text is None:
+            self._parsed_text = BeautifulSoup(self.text, 'lxml')
+        return self._parsed_text
+
+    @property
+    def lxml_root(self) -> Element:
+        """ lxml tree, built once and shared by every xpath selection on this page """
+        if self._lxml_root is None:
+            self._lxml_root = fromstring(self.text)
+        return self._lxml_root
+
+    @property
+    def visible_text(self) -> str:
+        """ Page text without scripts and styles, scanned by regex rules """
+        if self._visible_text is None:
+            self._visible_text = "\n".join(self.lxml_root.xpath(
+                "//text()[not(ancestor::script or ancestor::style)]"))
+        return self._visible_text
+
+    def _text_of(self, source: str) -> str:
+        return self.text if source == RAW_TEXT else self.visible_text
+
     def _initialize_selectors(self):
         self._link_selector_mappings = {
-            # lxml's xpath select has to bind with an etree object during runtime
-            'xpath': None, 
+            # xpath rules are compiled once and evaluated on the lxml tree by _select_by_xpath
+            'xpath': None,
             'css_selector': BeautifulSoup.select,
-            'regex': BeautifulSoup.find_all,
+            # regex rules match text and are handled by _select_by_regex
+            'regex': None,
             'class_name': BeautifulSoup.find_all,
             'element_id': BeautifulSoup.find,
             'text_content': BeautifulSoup.find_all
         }
 
-    def _get_selector(self, selector: str, parsed_text: BeautifulSoup) -> Callable:
+    def _get_selector(self, selector: str) -> Callable:
         if selector == 'xpath':
-            self._link_selector_mappings['xpath'] = fromstring(self.text).xpath
-            return self._link_selector_mappings['xpath']
+            return self._select_by_xpath
+        elif selector == 'regex':
+            return self._select_by_regex
         else:
             return partial(
                 self._link_selector_mappings[selector],
-                parsed_text
+                self.parsed_text
             )
 
-    def _get_attribute_failed(self, attribute_value) -> bool:
-        return attribute_value is None or len(attribute_value) == 0
+    def _select_by_xpath(self, selector_expression: str) -> List[Any]:
+        return compile_xpath(selector_expression)(self.lxml_root)
+
+    def _select_by_regex(self, selector_expression: str) -> List[str]:
+        return compile_scanner((RegexRule(selector_expression),)).scan(self._text_of)[0]
 
     def _get_element_attribute(self, element: Union[Tag, Element], attribute_name: str) -> str:
-        """ Due to the poor api design and chaotic nature of html elements, we need to try many ways
-            to get attributes from an element.
-        """
-        
-        attribute_value = ""
-        # either the attribute is in element's attribute dict, or
-        # it is one of the element object's field
-        try:
-            # TODO: refactor this using an {attribute: getter} mapping.
-            if (self._get_attribute_failed(attribute_value) and
-                attribute_name == 'text' and hasattr(element, 'text_content')):
-                # special case where we need to get text content from element's children
-                attribute_value = element.text_content()
-            if self._get_attribute_failed(attribute_value) and hasattr(element, attribute_name):
-                attribute_value = getattr(element, attribute_name)
-            if self._get_attribute_failed(attribute_value) and hasattr(element, 'get'):
-                attribute_value = element.get(attribute_name)
-            if self._get_attribute_failed(attribute_value) and hasattr(element, 'attrib'):
-                attribute_value = element.attrib[attribute_name]
-            if (self._get_attribute_failed(attribute_value) and
-                hasattr(element, 'attrs') and
-                element.attrs and attribute_name in element.attrs):
-                attribute_value = element.attrs[attribute_name]
-        except KeyError as e:
-            print(KeyError(f"{e} does not exist in element.attrib"))
-        except AttributeError as e:
-            print(e)
-
-        return attribute_value
+        """ Reads text or an attribute from an lxml element or a BeautifulSoup tag """
+        backend = 'bs4' if isinstance(element, Tag) else 'lxml'
+        if attribute_name in _accessors[backend]:
+            return _accessors[backend][attribute_name](element)
+        return _attribute_accessors[backend](element, attribute_name)
 
     def select_elements_by(self, selector_type:str, selector_expression: str) -> List[Any]:
         """ Select element given html/xml text, rule and attribute
@@ -90,12 +303,80 @@ class ParseDriver(GeneralNewsExtractor):
             selector_expression: an expression of (xpath, css_selector, regex, class_name, element_id, text_content)
         """
         # get an element selector
-        selector = self._get_selector(selector_type, self.parsed_text)
+        selector = self._get_selector(selector_type)
         # select elements from the element tree
         selected_elements = selector(selector_expression)
         
         return selected_elements
 
+    def select_elements_by_rules(self,
+                                 rules: List[Any],
+                                 matcher_compiler: Callable = compile_matcher,
+                                 scanner_compiler: Callable = compile_scanner) -> List[List[Any]]:
+        """ Select elements for a list of rules with as few document traversals as possible
+
+        Simple xpath rules are answered together in one traversal by a SelectorMatcher and
+        regex rules together in one pass over the page text by a RegexRuleScanner.
+        The remaining rules fall back to select_elements_by.
+
+        Args:
+            rules: objects with rule_type and rule attributes, e.g. ParseRule
+
+        Returns:
+            a list of selected elements for each rule, matched strings for regex rules
+        """
+        regex_indices = [index for index, rule in enumerate(rules) if rule.rule_type == 'regex']
+        element_indices = [index for index, rule in enumerate(rules) if rule.rule_type != 'regex']
+        selected: List[List[Any]] = [[] for _ in rules]
+
+        if len(regex_indices):
+            scanner = scanner_compiler(tuple(regex_rule_of(rules[index]) for index in regex_indices))
+            for index, matches in zip(regex_indices, scanner.scan(self._text_of)):
+                selected[index] = matches
+
+        if len(element_indices):
+            # rule types may be ParseRuleType members or plain strings
+            selectors = tuple((getattr(rules[index].rule_type, 'value', rules[index].rule_type),
+                               rules[index].rule)
+                              for index in element_indices)
+            matcher = matcher_compiler(selectors)
+            if matcher.compiled_count == 0:
+                elements = [self.select_elements_by(*selector) for selector in selectors]
+            else:
+                elements = matcher.match(self.lxml_root, self.select_elements_by)
+            for index, selected_elements in zip(element_indices, elements):
+                selected[index] = selected_elements
+
+        return selected
+
+    def select_elements_from(self,
+                             element: Union[Tag, Element],
+                             selector_type: str,
+                             selector_expression: str) -> List[Any]:
+        """ Select elements relative to an element that was selected before
+
+        Relative xpath expressions need an lxml element (a container selected by xpath),
+        while the other selector types need a BeautifulSoup tag.
+
+        Args:
+            element: element returned by select_elements_by or select_element
+            selector_type: one of (xpath, css_selector, regex, class_name, element_id, text_content)
+            selector_expression: an expression relative to the element, e.g. ./td[1]
+        """
+        if selector_type == 'xpath':
+            return compile_xpath(selector_expression)(element)
+        if selector_type == 'regex':
+            element_text = self._get_element_attribute(element, 'text')
+            return compile_scanner((RegexRule(selector_expression),)).scan_text(element_text)[0]
+
+        selected_elements = self._link_selector_mappings[selector_type](
+            element, selector_expression)
+        if selected_elements is None:
+            return []
+        if isinstance(selected_elements, Tag):
+            return [selected_elements]
+        return selected_elements
+
     def select_element(self,
                        selector_type: str,
                        selector_expression: str) -> Generator[str, str, Union[Tag, Element]]:
@@ -110,7 +391,7 @@ class ParseDriver(GeneralNewsExtractor):
             Generator[Union[Tag, Element]]
         """
         # get an element selector
-        selector = self._get_selector(selector_type, self.parsed_text)
+        selector = self._get_selector(selector_type)
         # select elements from the element tree
         for selected_elements in selector(selector_expression):
             yield selected_elements
@@ -121,6 +402,24 @@ class ParseDriver(GeneralNewsExtractor):
         return [{attribute_name: self._get_element_attribute(element, attribute_name) for attribute_name in attribute_names}
                 for element in elements]
 
+    def get_accessor(self, projection: str, selector_type: str) -> Callable[[Any], str]:
+        """ Direct accessor for a projection on elements selected by the given selector type """
+        return compile_accessor(projection, selector_backend(selector_type))
+
+    def project(self,
+                elements: List[Union[Tag, Element]],
+                projection: str,
+                selector_type: str) -> List[str]:
+        """ Extract only the requested projection from each element
+
+        Args:
+            elements: elements selected with selector_type
+            projection: an AttributeProjection value or "@name" for an arbitrary attribute
+            selector_type: selector type used to select the elements
+        """
+        accessor = self.get_accessor(projection, selector_type)
+        return [accessor(element) for element in elements]
+
 
 class GeneralNewsParserDriver(ParseDriver, GeneralNewsExtractor):
 
@@ -0,0 +1,119 @@
+""" Compiled parsing pipelines
+
+A ParsingPipeline is only a description. ParsePlan is its executable form, compiled once when
+a job is submitted: the parsing strategy is resolved, every rule is validated and its selector,
+accessor and slice are compiled, so a broken rule fails the job before any page is fetched
+instead of on every page. The parsing strategies extract with the compiled rule plans, so
+the projection and slice of a rule are not looked up again for every page.
+
+Plans are immutable and cached by the hash of their specification, repeated and scheduled
+jobs with the same pipeline reuse the same plan.
+"""
+
+import hashlib
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+from ..models.data_models import ParseRecord
+from .parser import ParserContext, ParserContextFactory
+from .parse_driver import RulePlan, compile_rule
+from .selector_matcher import compile_matcher
+from .exceptions import InvalidParseRuleException
+
+PostProcessor = Callable[[List[ParseRecord]], List[ParseRecord]]
+
+
+class ParsePlan(NamedTuple):
+    """ An executable ParsingPipeline
+
+    Fields:
+        spec_hash: str, hash of the pipeline specification
+        name: Optional[str]
+        parser_name: str
+        parser: ParserContext, the resolved parsing strategy
+        rules: Tuple, the validated parse rules
+        rule_plans: Tuple[RulePlan, ...]
+        post_processors: Tuple[PostProcessor, ...], applied in order to the parse results
+    """
+    spec_hash: str
+    name: Optional[str]
+    parser_name: str
+    parser: ParserContext
+    rules: Tuple[Any, ...]
+    rule_plans: Tuple[RulePlan, ...]
+    post_processors: Tuple[PostProcessor, ...] = ()
+
+    def parse(self, text: str) -> List[ParseRecord]:
+        parsed_results = self.parser.parse(text, list(self.rules), rule_plans=self.rule_plans)
+        for post_processor in self.post_processors:
+            parsed_results = post_processor(parsed_results)
+        return parsed_results
+
+    def with_post_processors(self, *post_processors: PostProcessor) -> "ParsePlan":
+        """ A copy of the plan that also post-processes its results """
+        return self._replace(post_processors=self.post_processors + post_processors)
+
+
+def pipeline_hash(pipeline: Any) -> str:
+    """ Stable hash of a pipeline specification """
+    return hashlib.sha1(pipeline.json(sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class ParsePlanCompiler(object):
+    """ Compiles ParsingPipelines into ParsePlans and caches them by specification hash
+
+    Args:
+        parse_strategy_factory: resolves the parsing strategy of a pipeline
+        cache_size: maximum number of plans to keep
+    """
+
+    def __init__(self,
+                 parse_strategy_factory: ParserContextFactory = ParserContextFactory,
+                 cache_size: int = 256):
+        self._parse_strategy_factory = parse_strategy_factory
+        self._cache_size = cache_size
+        self._plans: Dict[str, ParsePlan] = {}
+
+    def _compile(self, pipeline: Any, spec_hash: str) -> ParsePlan:
+        rules = tuple(pipeline.parse_rules)
+        rule_plans = tuple(compile_rule(rule) for rule in rules)
+
+        if sum(1 for rule in rules if getattr(rule, 'is_container', False)) > 1:
+            raise InvalidParseRuleException(
+                f"Pipeline {pipeline.name} has more than one container rule")
+
+        # warm the matcher shared by every page parsed with these rules
+        element_selectors = tuple((rule_plan.selector_type, rule_plan.rule.rule)
+                                  for rule_plan in rule_plans
+                                  if rule_plan.selector_type != 'regex')
+        if len(element_selectors):
+            compile_matcher(element_selectors)
+
+        parser_name = getattr(pipeline.parser, 'value', pipeline.parser)
+        return ParsePlan(
+            spec_hash=spec_hash,
+            name=pipeline.name,
+            parser_name=parser_name,
+            parser=self._parse_strategy_factory.create(parser_name),
+            rules=rules,
+            rule_plans=rule_plans)
+
+    def compile(self, pipeline: Any) -> ParsePlan:
+        """ Compiled plan of a ParsingPipeline
+
+        Raises:
+            InvalidParseRuleException: a rule of the pipeline is invalid
+        """
+        spec_hash = pipeline_hash(pipeline)
+        plan = self._plans.get(spec_hash)
+        if plan is None:
+            plan = self._compile(pipeline, spec_hash)
+            if len(self._plans) >= self._cache_size:
+                self._plans.clear()
+            self._plans[spec_hash] = plan
+        return plan
+
+    def compile_many(self, pipelines: Sequence[Any]) -> List[ParsePlan]:
+        """ Compiles every pipeline of a ScrapeRules, e.g. at job submission """
+        return [self.compile(pipeline) for pipeline in pipelines]
+
+
+parse_plan_compiler = ParsePlanCompiler()
@@ -1,11 +1,12 @@
 import re
 from abc import ABC
-from typing import List, Callable, Generator, Any
+from typing import List, Callable, Dict, Generator, Any, Optional, Sequence
 from ..models.data_models import (
-    ParseRule, ParseResult, URL, HTMLData
+    ParseRule, ParseRecord, URL, HTMLData
 )
-from .parse_driver import ParseDriver
+from .parse_driver import ParseDriver, RulePlan, compile_rule, selector_backend
 from .exceptions import InvalidBaseURLException
+from ..utils import DatetimeNormalizer, datetime_normalizer, to_datetimes
 from itertools import zip_longest
 from urllib.parse import urljoin
 import chardet
@@ -14,9 +15,17 @@ class BaseParsingStrategy(ABC):
     """ Base strategy for parsing text
     """
 
-    def parse(self, text: str, rules: List[ParseRule]):
+    def parse(self, text: str, rules: List[ParseRule],
+              rule_plans: Optional[Sequence[RulePlan]] = None):
         return NotImplemented
 
+    def _rule_plans(self, rules: List[ParseRule],
+                    rule_plans: Optional[Sequence[RulePlan]]) -> List[RulePlan]:
+        """ The compiled plans of a ParsePlan, or plans compiled now for bare rules """
+        if rule_plans is not None:
+            return list(rule_plans)
+        return [compile_rule(rule) for rule in rules]
+
 
 class HTMLContentParser(BaseParsingStrategy):
 
@@ -26,8 +35,9 @@ class HTMLContentParser(BaseParsingStrategy):
     def _valid(self, content):
         return content and len(content)
     
-    def parse(self, text: str, rules: List[ParseRule]) -> List[ParseResult]:
-        """ Parse html and return a list of ParseResult given a list of ParseRule.
+    def parse(self, text: str, rules: List[ParseRule],
+              rule_plans: Optional[Sequence[RulePlan]] = None) -> List[ParseRecord]:
+        """ Parse html and return a list of ParseRecord given a list of ParseRule.
         Suppose you want to get title, date, author and content from this blog post [https://cuiqingcai.com/1319.html].
         You provide a list of ParseRule, which specifies the fields and rules to extract these fields.
         In this case, you provide a list of rules like
@@ -55,29 +65,28 @@ class HTMLContentParser(BaseParsingStrategy):
         Args:
             text: HTML string to parse
             rules: a list of (field_name, rule, rule_type) objects
+            rule_plans: the compiled rules, see ParsePlan
 
         Returns:
-            List[ParseResult]: a list of (field_name, field_value) objects.
+            List[ParseRecord]: a list of (field_name, field_value) objects.
         """
 
         parsed_html = self._parser(text)
         parsed_content = []
 
-        for rule in rules:
-            # match all links using provided rules
-            contents = parsed_html.select_elements_by(
-                selector_type=rule.rule_type, selector_expression=rule.rule)
+        # match all rules in as few document traversals as possible
+        for rule_plan, contents in zip(self._rule_plans(rules, rule_plans),
+                                       parsed_html.select_elements_by_rules(rules)):
+            rule = rule_plan.rule
             if len(contents) > 0:
-                for content_attributes in parsed_html.get_element_attributes(contents, ['text', 'href']):
-                    if not rule.is_link and self._valid(content_attributes['text']):
+                # only compute the projection the rule asks for
+                for content_value in map(rule_plan.accessor, contents):
+                    if self._valid(content_value):
                         parsed_content.append(
-                            ParseResult(name=rule.field_name, value=content_attributes['text'].strip()))
-                    if rule.is_link and self._valid(content_attributes['href']):
-                        parsed_content.append(
-                            ParseResult(name=rule.field_name, value=content_attributes['href'].strip()))
+                            ParseRecord(name=rule.field_name, value=content_value.strip()))
             else:
                 parsed_content.append(
-                    ParseResult(name=rule.field_name, value=''))
+                    ParseRecord(name=rule.field_name, value=''))
 
         return parsed_content
 
@@ -90,7 +99,14 @@ class ListItemParser(BaseParsingStrategy):
     def _valid(self, content):
         return content and len(content)
 
-    def parse(self, text: str, rules: List[ParseRule]) -> List[ParseResult]:
+    def _is_page_level(self, rule: ParseRule) -> bool:
+        """ Absolute xpath rules select page-level fields even in row-anchored mode """
+        expression = rule.rule.lstrip()
+        return (rule.rule_type == 'xpath' and
+                (expression.startswith('/') or expression.startswith('(/')))
+
+    def parse(self, text: str, rules: List[ParseRule],
+              rule_plans: Optional[Sequence[RulePlan]] = None) -> List[ParseRecord]:
         """ Parse a web page containing a list of items.
         The rules provided are assumed to be extraction rules of the attributes of an item.
         For example, a product on a product list contains these attributes:
@@ -114,47 +130,128 @@ class ListItemParser(BaseParsingStrategy):
             rule_type='xpath',
             rule="//tr/td[3]")]
 
+        Each rule is evaluated over the whole document and the columns are zipped into items.
+        If one of the rules is a container rule, the parser works in row-anchored mode instead:
+        rows are selected once and the other rules are evaluated relative to each row,
+        so a missing cell leaves an empty field rather than shifting the rest of the column.
+        Absolute xpath rules are treated as page-level fields and copied into every row.
+        The other field rules must select with the backend of the container rule
+        (xpath rows need xpath fields, css or class rows need bs4 fields), regex fields
+        scan the text of a row and fit both.
+
+        [ParseRule(
+            field_name='row',
+            rule_type='xpath',
+            rule='//tr',
+            is_container=True),
+         ParseRule(
+            field_name='product_name',
+            rule_type='xpath',
+            rule='./td[1]'),
+         ParseRule(
+            field_name='manufacturer',
+            rule_type='xpath',
+            rule='./td[2]')]
+
         Args:
             text: HTML string to parse
             rules: a list of (field_name, rule, rule_type) objects
+            rule_plans: the compiled rules, see ParsePlan
 
         Returns:
-            List[ParseResult]: a list of list items grouped by their attributes.
+            List[ParseRecord]: a list of list items grouped by their attributes.
+
+        Raises:
+            ValueError: a row field selects with another backend than the container
         """
 
         parsed_html = self._parser(text)
-        item_attrs = []
+        plans = self._rule_plans(rules, rule_plans)
+        container_plans = [plan for plan in plans if plan.rule.is_container]
+
+        if len(container_plans):
+            field_plans = [plan for plan in plans if not plan.rule.is_container]
+            return self._parse_rows(parsed_html, container_plans[0], field_plans)
+        else:
+            return self._parse_columns(parsed_html, plans)
+
+    def _parse_columns(self, parsed_html: ParseDriver,
+                       plans: List[RulePlan]) -> List[ParseRecord]:
+        """ Evaluates every rule over the whole document and zips the columns into items """
         parsed_content = []
 
-        for rule in rules:
-            # match all links using provided rules
-            list_item_attr = parsed_html.select_element(
-                selector_type=rule.rule_type, selector_expression=rule.rule)
-            item_attrs.append(list_item_attr)
-        
-        
+        # match all columns in as few document traversals as possible
+        item_attrs = parsed_html.select_elements_by_rules([plan.rule for plan in plans])
+
         for attrs in zip_longest(*item_attrs, fillvalue=None):
+            item = {plan.rule.field_name: ParseRecord(
+                        name=plan.rule.field_name, value=plan.extract(attr))
+                    for plan, attr in zip(plans, attrs)}
+            parsed_content.append(ParseRecord(name='item', value=item))
+
+        return parsed_content
+
+    def _select_from(self, parsed_html: ParseDriver, row: Any, plan: RulePlan) -> List[Any]:
+        if plan.selector_type == 'xpath':
+            # the compiled xpath of the plan, evaluated relative to the row
+            return plan.selector(row)
+        return parsed_html.select_elements_from(
+            row, selector_type=plan.selector_type, selector_expression=plan.rule.rule)
+
+    def _check_row_backends(self, container_plan: RulePlan, plans: List[RulePlan]):
+        """ Row fields are selected from the container's elements, so they need its backend
+
+        Raises:
+            ValueError
+        """
+        container_backend = selector_backend(container_plan.selector_type)
+        for plan in plans:
+            if self._is_page_level(plan.rule):
+                continue
+            field_backend = selector_backend(plan.selector_type)
+            if field_backend == container_backend or \
+                    (field_backend == 'regex' and container_backend != 'regex'):
+                continue
+            raise ValueError(
+                f"Field {plan.rule.field_name} selects with {plan.selector_type} ({field_backend}) "
+                f"but the container {container_plan.rule.field_name} with "
+                f"{container_plan.selector_type} ({container_backend}), "
+                f"row fields must use the selector backend of the container")
+
+    def _parse_rows(self, parsed_html: ParseDriver,
+                    container_plan: RulePlan,
+                    plans: List[RulePlan]) -> List[ParseRecord]:
+        """ Selects the rows once and evaluates the field rules relative to each row """
+        self._check_row_backends(container_plan, plans)
+        page_level_values = {}
+
+        for plan in plans:
+            if self._is_page_level(plan.rule):
+                elements = parsed_html.select_elements_by(
+                    selector_type=plan.selector_type, selector_expression=plan.rule.rule)
+                page_level_values[plan.rule.field_name] = plan.extract(
+                    elements[0] if len(elements) else None)
+
+        rows = parsed_html.select_elements_by(
+            selector_type=container_plan.selector_type,
+            selector_expression=container_plan.rule.rule)
+        parsed_content = []
+
+        for row in rows:
             item = {}
-            attr_value = ""
-            for rule, attr in zip(rules, attrs):
-                if attr is not None:
-                    if rule.is_link:
-                        attr_value = attr.get('href')
-                    else:
-                        # assume that user wants text for now
-                        attr_value = attr.text_content().strip()
-                    
-                    if rule.slice_str:
-                        start, end = rule.slice_str
-                        attr_value = attr_value[start: end]
-                    
-                    item[rule.field_name] = ParseResult(
-                        name=rule.field_name, value=attr_value)
-                else:
-                    item[rule.field_name] = ParseResult(
-                        name=rule.field_name, value="")
-            
-            parsed_content.append(ParseResult(name='item', value=item))
+            for plan in plans:
+                field_name = plan.rule.field_name
+                if field_name in page_level_values:
+                    item[field_name] = ParseRecord(
+                        name=field_name, value=page_level_values[field_name])
+                    continue
+
+                elements = self._select_from(parsed_html, row, plan)
+                item[field_name] = ParseRecord(
+                    name=field_name,
+                    value=plan.extract(elements[0] if len(elements) else None))
+
+            parsed_content.append(ParseRecord(name='item', value=item))
 
         return parsed_content
 
@@ -174,13 +271,15 @@ class GeneralNewsParser(BaseParsingStrategy):
             converted_text = str.encode(text).decode('UTF-8')
         return converted_text
 
-    def parse(self, text: str, rules: List[ParseRule], encoding_detector: Callable = chardet.detect) -> List[ParseResult]:
+    def parse(self, text: str, rules: List[ParseRule],
+              rule_plans: Optional[Sequence[RulePlan]] = None,
+              encoding_detector: Callable = chardet.detect) -> List[ParseRecord]:
         """ Parse general new content and return its title, author, date, and content
         """
         # text = self._correct_encoding(text, encoding_detector)
         parser = self._parser(text)
         parsed_news = parser.extract(text)
-        parsed_content = [ParseResult(name=field_name, value=parsed_news[field_name])
+        parsed_content = [ParseRecord(name=field_name, value=parsed_news[field_name])
                           for field_name in parsed_news]
         return parsed_content
 
@@ -224,64 +323,86 @@ class LinkParser(BaseParsingStrategy):
             raise InvalidBaseURLException("Please provide a valid base url starting with (http|https|ftp)")
     
 
-    def parse(self, text: str, rules: List[ParseRule], urljoin: Callable = urljoin) -> List[ParseResult]:
+    def parse(self, text: str, rules: List[ParseRule],
+              rule_plans: Optional[Sequence[RulePlan]] = None,
+              urljoin: Callable = urljoin,
+              base_url: Optional[str] = None) -> List[ParseRecord]:
+        """ Finds the links selected by the rules
+
+        Relative links are resolved against base_url, or against the base url of the parser
+        if none is given. Concurrent parses pass their own base url instead of setting it.
+        """
+        base_url = base_url if base_url is not None else self._base_url
         parsed_html = self._parser(text)
-        parsed_links = set()
-
-        for rule in rules:
-            # match all links using provided rules
-            links = parsed_html.select_elements_by(
-                        selector_type=rule.rule_type,selector_expression=rule.rule)
-                        
-            for link_url in parsed_html.get_element_attributes(links, ['text', 'href']):
-                if self._valid_link(link_url['href']):
-                    url = link_url['href']
-                    if not url.startswith("http") and self._base_url is not None:
+        # a dict drops duplicate links and keeps them in document order
+        parsed_links: Dict[ParseRecord, None] = {}
+
+        # match all links using provided rules
+        for rule, links in zip(rules, parsed_html.select_elements_by_rules(rules)):
+            # links are read from href unless the rule projects another attribute
+            url_accessor = parsed_html.get_accessor(
+                getattr(rule, 'projection', None) or 'href', rule.rule_type)
+            text_accessor = parsed_html.get_accessor('text', rule.rule_type)
+            for link in links:
+                url = url_accessor(link)
+                if self._valid_link(url):
+                    if not url.startswith("http") and base_url is not None:
                         # try to convert relative url to absolute url
-                        url = urljoin(self._base_url, url)
+                        url = urljoin(base_url, url)
 
-                    parsed_links.add(ParseResult(
-                        name=link_url['text'], value=url))
+                    parsed_links.setdefault(ParseRecord(
+                        name=text_accessor(link), value=url))
 
         return list(parsed_links)
 
 
 class DatetimeParser(BaseParsingStrategy):
     
-    def __init__(self, parse_driver_class: ParseDriver):
+    def __init__(self, parse_driver_class: ParseDriver,
+                 datetime_normalizer: DatetimeNormalizer = datetime_normalizer):
         self._parser = parse_driver_class
+        self._datetime_normalizer = datetime_normalizer
 
     def parse(self, text: str, rules: List[ParseRule],
-              datetime_formatter: Callable = None) -> List[ParseResult]:
+              rule_plans: Optional[Sequence[RulePlan]] = None,
+              datetime_formatter: Callable = None) -> List[ParseRecord]:
         """ Parses datetime from webpages 
 
-        Allow processing datetime text using a datetime formatter.
-        If the datetime text is not in a standard format, like "3 days ago",
-        you can write custom logic to convert it to standard format.
+        Datetime texts are normalized to datetime objects in one batch per page. Relative
+        and Chinese forms like "3天前", "昨天13:15" or "2021年6月5日" are supported, texts
+        that cannot be recognized are kept as they are.
+        If the datetime text is in some other format, you can provide a datetime formatter
+        with custom logic to convert it instead.
 
         Args:
             text
             rules
+            rule_plans: the compiled rules, see ParsePlan
             datetime_formatter
 
         Returns:
-            List[ParseResult]
+            List[ParseRecord]
         """
         
         parsed_html = self._parser(text)
         parsed_dt = []
 
-        for rule in rules:
-            # match all datetime using provided rules
-            datetimes = parsed_html.select_elements_by(
-                selector_type=rule.rule_type, selector_expression=rule.rule)
-
-            for datetime_element in parsed_html.get_element_attributes(datetimes, ['text']):
-                if datetime_element and len(datetime_element):
-                    datetime_text = datetime_element['text']
+        # match all datetime using provided rules
+        for rule_plan, datetimes in zip(self._rule_plans(rules, rule_plans),
+                                        parsed_html.select_elements_by_rules(rules)):
+            rule = rule_plan.rule
+            for datetime_text in map(rule_plan.accessor, datetimes):
+                if datetime_text and len(datetime_text):
                     if datetime_formatter:
                         datetime_text = datetime_formatter(datetime_text)
-                    parsed_dt.append(ParseResult(name=rule.field_name, value=datetime_text))
+                    parsed_dt.append(ParseRecord(name=rule.field_name, value=datetime_text))
+
+        if datetime_formatter is None and len(parsed_dt):
+            normalized = to_datetimes(self._datetime_normalizer.normalize_many(
+                [result.value for result in parsed_dt]))
+            for result, normalized_dt in zip(parsed_dt, normalized):
+                if normalized_dt is not None:
+                    result.value = normalized_dt
 
         return parsed_dt
 
@@ -311,8 +432,12 @@ class ParserContext(object):
     def parsing_strategy(self, parsing_strategy: BaseParsingStrategy) -> None:
         self._parsing_strategy = parsing_strategy
 
-    def parse(self, text: str, rules: List[ParseRule]) -> List[ParseResult]:
-        return self._parsing_strategy.parse(text, rules)
+    def parse(self, text: str, rules: List[ParseRule],
+              rule_plans: Optional[Sequence[RulePlan]] = None, **kwargs) -> List[ParseRecord]:
+        """ Parses with the current strategy, kwargs are options of the strategy """
+        if rule_plans is not None:
+            kwargs['rule_plans'] = rule_plans
+        return self._parsing_strategy.parse(text, rules, **kwargs)
 
 
 class ParserContextFactory(object):
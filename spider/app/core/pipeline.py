@@ -0,0 +1,287 @@
+""" Streaming stage pipelines
+
+A StagePipeline runs a DAG of stages, each with its own pool of workers, joined by bounded
+asyncio queues. An item moves on to the next stages as soon as it is processed, so I/O bound
+stages such as fetching overlap with CPU bound stages such as parsing instead of waiting for
+each other at barriers. A full queue makes the stages before it wait, so memory is bounded
+by the queue sizes rather than by the size of the job.
+
+By default every stage reads the output of the stage added before it, which makes a chain.
+A stage naming its inputs reads the output of all of them, and a stage read by several
+stages hands each of them every item. Services declare their crawl as such a pipeline, so
+worker counts and queue sizes can be tuned per stage from the job spec with configure.
+"""
+
+import asyncio
+import inspect
+import time
+from asyncio import Queue
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence
+from ..enums import StageKind
+
+_end_of_stream = object()
+
+
+class Stage(NamedTuple):
+    """ A step of a StagePipeline
+
+    Fields:
+        name: str, unique in its pipeline
+        handler: Callable, takes an item and returns, or awaits, an iterable of items for the
+                 next stages. An empty iterable or None drops the item, several items fan out.
+                 An async generator hands each item on as soon as it is yielded.
+        concurrency: Optional[int], number of workers running the handler, None for the
+                     default concurrency of the pipeline
+        flush: Optional[Callable], called, or awaited, once the stage has processed its last
+               item, returns the items it still holds, e.g. a last partial batch
+        queue_size: Optional[int], size of the queue in front of the stage, defaults to the
+                    queue size of the pipeline
+        kind: Optional[StageKind], what the stage does
+        inputs: Optional[Sequence[str]], names of the stages it reads from, defaults to the
+                stage added before it. Stages without inputs read the items of run.
+    """
+    name: str
+    handler: Callable[[Any], Any]
+    concurrency: Optional[int] = 1
+    flush: Optional[Callable[[], Any]] = None
+    queue_size: Optional[int] = None
+    kind: Optional[StageKind] = None
+    inputs: Optional[Sequence[str]] = None
+
+
+class StageMetrics(object):
+    """ Counters of a stage during a run
+
+    Fields:
+        processed: int, items taken from the queue
+        emitted: int, items handed to the next stages
+        failed: int, items whose handler raised
+        busy_seconds: float, time spent in the handler, summed over the workers
+        max_queued: int, highest number of items waiting in the queue
+    """
+    __slots__ = ["processed", "emitted", "failed", "busy_seconds", "max_queued"]
+
+    def __init__(self):
+        self.processed = 0
+        self.emitted = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.max_queued = 0
+
+    @property
+    def items_per_second(self) -> float:
+        """ Throughput of one worker of the stage """
+        return self.processed / self.busy_seconds if self.busy_seconds > 0 else 0.0
+
+    def to_dict(self) -> dict:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+
+async def _resolve(value: Any) -> Any:
+    if inspect.isawaitable(value):
+        return await value
+    return value
+
+
+class StagePipeline(object):
+    """ Runs a DAG of stages, streaming items through bounded queues
+
+    Args:
+        stages: the stages in order
+        queue_size: default size of the queues between stages
+        concurrency: default number of workers of a stage
+    """
+
+    def __init__(self, stages: Iterable[Stage] = (),
+                 queue_size: int = 100,
+                 concurrency: int = 1,
+                 task_creator: Callable = asyncio.ensure_future,
+                 clock: Callable = time.perf_counter):
+        self._stages: List[Stage] = list(stages)
+        self._queue_size = queue_size
+        self._default_concurrency = concurrency
+        self._task_creator = task_creator
+        self._clock = clock
+        self._metrics: Dict[str, StageMetrics] = {}
+        self._queues: Dict[str, Queue] = {}
+        self._concurrency: Dict[str, int] = {}
+        self._outputs: Dict[str, List[str]] = {}
+        self._sources: List[str] = []
+        self._open_inputs: Dict[str, int] = {}
+
+    def add_stage(self, name: str, handler: Callable, concurrency: Optional[int] = 1,
+                  flush: Optional[Callable] = None,
+                  queue_size: Optional[int] = None,
+                  kind: Optional[StageKind] = None,
+                  inputs: Optional[Sequence[str]] = None) -> "StagePipeline":
+        self._stages.append(Stage(name, handler, concurrency, flush, queue_size, kind, inputs))
+        return self
+
+    @property
+    def stages(self) -> List[Stage]:
+        return list(self._stages)
+
+    def configure(self, options: Iterable[Any]) -> "StagePipeline":
+        """ Overrides the concurrency and queue size of stages by name
+
+        Options are StageOptions of a job spec, fields left empty keep the values the
+        service declared.
+
+        Raises:
+            ValueError: an option names a stage the pipeline does not have
+        """
+        by_name = {stage.name: index for index, stage in enumerate(self._stages)}
+        for option in options:
+            if option.name not in by_name:
+                raise ValueError(f"unknown stage {option.name}, known stages: {list(by_name)}")
+            index = by_name[option.name]
+            stage = self._stages[index]
+            self._stages[index] = stage._replace(
+                concurrency=option.concurrency if option.concurrency else stage.concurrency,
+                queue_size=option.queue_size if option.queue_size else stage.queue_size)
+        return self
+
+    @property
+    def processed(self) -> Dict[str, int]:
+        """ Number of items each stage has processed """
+        return {name: metrics.processed for name, metrics in self._metrics.items()}
+
+    @property
+    def metrics(self) -> Dict[str, StageMetrics]:
+        """ Counters of each stage during the last run """
+        return dict(self._metrics)
+
+    def report(self) -> str:
+        """ One line of counters per stage """
+        return "\n".join(
+            f"{name}: processed={metrics.processed} emitted={metrics.emitted} "
+            f"failed={metrics.failed} busy={metrics.busy_seconds:.2f}s "
+            f"max_queued={metrics.max_queued}"
+            for name, metrics in self._metrics.items())
+
+    def _resolve_inputs(self) -> Dict[str, List[str]]:
+        """ Input stages of every stage, checked to form a DAG """
+        names = [stage.name for stage in self._stages]
+        if len(set(names)) != len(names):
+            raise ValueError(f"stage names must be unique: {names}")
+        inputs: Dict[str, List[str]] = {}
+        for index, stage in enumerate(self._stages):
+            if stage.inputs is None:
+                inputs[stage.name] = [names[index - 1]] if index else []
+                continue
+            # stages may only read from stages added before them, so there are no cycles
+            undefined = [name for name in stage.inputs if name not in inputs]
+            if undefined:
+                raise ValueError(
+                    f"stage {stage.name} reads from stages not added before it: {undefined}")
+            inputs[stage.name] = list(stage.inputs)
+        return inputs
+
+    async def _put_all(self, name: Optional[str], items: Any, timed: bool = False) -> None:
+        """ Hands items to the next stages
+
+        With timed, the time generators of the stage spend producing items counts as busy
+        time, the time waiting for room in the next queues is backpressure and does not.
+        """
+        if items is None:
+            return
+        # items of run go to the sources, items of a stage to the stages reading from it
+        outputs = self._outputs[name] if name is not None else self._sources
+        source = self._metrics[name] if name is not None else None
+        timed_metrics = source if timed else None
+        if hasattr(items, '__aiter__'):
+            iterator = items.__aiter__()
+            while True:
+                started = self._clock()
+                try:
+                    item = await iterator.__anext__()
+                except StopAsyncIteration:
+                    return
+                finally:
+                    if timed_metrics is not None:
+                        timed_metrics.busy_seconds += self._clock() - started
+                await self._put_item(outputs, source, item)
+        iterator = iter(items)
+        while True:
+            started = self._clock()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                if timed_metrics is not None:
+                    timed_metrics.busy_seconds += self._clock() - started
+            await self._put_item(outputs, source, item)
+
+    async def _put_item(self, outputs: List[str], source: Optional[StageMetrics],
+                        item: Any) -> None:
+        if source is not None:
+            source.emitted += 1
+        for output in outputs:
+            outbox = self._queues[output]
+            await outbox.put(item)
+            self._metrics[output].max_queued = max(self._metrics[output].max_queued,
+                                                   outbox.qsize())
+
+    async def _close_inputs_of(self, outputs: List[str]) -> None:
+        """ Ends the streams of stages whose inputs have all finished """
+        for output in outputs:
+            self._open_inputs[output] -= 1
+            if self._open_inputs[output] == 0:
+                for _ in range(self._concurrency[output]):
+                    await self._queues[output].put(_end_of_stream)
+
+    async def _work(self, stage: Stage, inbox: Queue) -> None:
+        metrics = self._metrics[stage.name]
+        while True:
+            item = await inbox.get()
+            if item is _end_of_stream:
+                return
+            started = self._clock()
+            try:
+                try:
+                    results = await _resolve(stage.handler(item))
+                finally:
+                    metrics.busy_seconds += self._clock() - started
+                await self._put_all(stage.name, results, timed=True)
+            except Exception as e:
+                metrics.failed += 1
+                print(f"stage {stage.name} failed: {e}")
+            finally:
+                metrics.processed += 1
+
+    async def _run_stage(self, stage: Stage) -> None:
+        inbox = self._queues[stage.name]
+        await asyncio.gather(*[self._work(stage, inbox)
+                               for _ in range(self._concurrency[stage.name])])
+        if stage.flush is not None:
+            await self._put_all(stage.name, await _resolve(stage.flush()))
+        await self._close_inputs_of(self._outputs[stage.name])
+
+    async def run(self, items: Iterable[Any]) -> None:
+        """ Feeds items to the stages without inputs and returns when every stage is done """
+        if not self._stages:
+            return
+        inputs = self._resolve_inputs()
+        self._metrics = {stage.name: StageMetrics() for stage in self._stages}
+        self._queues = {stage.name: Queue(maxsize=stage.queue_size or self._queue_size)
+                        for stage in self._stages}
+        self._concurrency = {stage.name: max(1, stage.concurrency or self._default_concurrency)
+                             for stage in self._stages}
+        self._outputs = {stage.name: [] for stage in self._stages}
+        for name, stage_inputs in inputs.items():
+            for stage_input in stage_inputs:
+                self._outputs[stage_input].append(name)
+        self._sources = [name for name, stage_inputs in inputs.items() if not stage_inputs]
+        # the items of run count as one more input of the sources
+        self._open_inputs = {name: max(1, len(stage_inputs))
+                             for name, stage_inputs in inputs.items()}
+        runners = [self._task_creator(self._run_stage(stage)) for stage in self._stages]
+        try:
+            await self._put_all(None, items)
+            await self._close_inputs_of(self._sources)
+            await asyncio.gather(*runners)
+        finally:
+            for runner in runners:
+                runner.cancel()
+            await asyncio.gather(*runners, return_exceptions=True)
@@ -0,0 +1,167 @@
+""" Text level regex rules
+
+Regex rules match page text, not elements. RegexRuleScanner compiles all regex rules of a
+pipeline once into a single pattern per text source, where every rule sits in its own
+lookahead group:
+
+    (?=(?P<r0>rule0))?(?=(?P<r1>rule1))?(?(r0)|(?(r1)|(?!)))
+
+The combined pattern only matches at positions where at least one rule matches, and reports
+every rule matching there, so one linear pass over the text answers all rules. Each rule then
+keeps its matches exactly like re.finditer would: leftmost first and non-overlapping.
+
+Rules with inline flags, named groups or backreferences cannot be embedded safely and are
+scanned on their own.
+"""
+
+import re
+from functools import lru_cache
+from typing import Callable, Dict, List, NamedTuple, Sequence, Tuple, Union
+from .exceptions import InvalidParseRuleException
+
+# text sources a regex rule can scan
+VISIBLE_TEXT = 'text'
+RAW_TEXT = 'html'
+
+_backreference_pattern = re.compile(r"\\[1-9]|\(\?P=")
+
+
+class RegexRule(NamedTuple):
+    """ A compiled view of a regex ParseRule
+
+    Fields:
+        pattern: str,
+        group: Union[int, str], capture group to project, 0 is the whole match
+        first_only: bool, keep only the first match
+        source: str, VISIBLE_TEXT or RAW_TEXT
+    """
+    pattern: str
+    group: Union[int, str] = 0
+    first_only: bool = False
+    source: str = VISIBLE_TEXT
+
+
+def _standalone(compiled: re.Pattern) -> bool:
+    return (compiled.flags != re.UNICODE or
+            len(compiled.groupindex) > 0 or
+            _backreference_pattern.search(compiled.pattern) is not None)
+
+
+def _combine(indexed_patterns: List[Tuple[int, str]]) -> str:
+    lookaheads = "".join(f"(?=(?P<r{index}>{pattern}))?" for index, pattern in indexed_patterns)
+    condition = "(?!)"
+    for index, _ in reversed(indexed_patterns):
+        condition = f"(?(r{index})|{condition})"
+    return lookaheads + condition
+
+
+class RegexRuleScanner(object):
+    """ Scans page text for all regex rules of a pipeline
+
+    Args:
+        regex_rules: rules to scan for, results are returned in the same order
+
+    Raises:
+        InvalidParseRuleException: a pattern does not compile or a capture group does not exist
+    """
+
+    def __init__(self, regex_rules: Sequence[RegexRule], re_compile: Callable = re.compile):
+        self._rules = list(regex_rules)
+        self._standalone: List[Tuple[int, re.Pattern]] = []
+        self._combined: Dict[str, Tuple[re.Pattern, List[Tuple[int, int]]]] = {}
+        embeddable: Dict[str, List[Tuple[int, str]]] = {}
+
+        for index, rule in enumerate(self._rules):
+            try:
+                compiled = re_compile(rule.pattern)
+            except re.error as e:
+                raise InvalidParseRuleException(f"Invalid regex rule {rule.pattern}: {e}")
+
+            group = rule.group
+            if ((isinstance(group, int) and not 0 <= group <= compiled.groups) or
+                (isinstance(group, str) and group not in compiled.groupindex)):
+                raise InvalidParseRuleException(
+                    f"Regex rule {rule.pattern} has no capture group {group}")
+
+            if _standalone(compiled):
+                self._standalone.append((index, compiled))
+            else:
+                embeddable.setdefault(rule.source, []).append((index, rule.pattern))
+
+        for source, indexed_patterns in embeddable.items():
+            combined = re_compile(_combine(indexed_patterns))
+            # absolute index of the group a rule projects inside the combined pattern
+            projected_groups = [
+                (index, combined.groupindex[f"r{index}"] + self._rules[index].group)
+                for index, _ in indexed_patterns]
+            self._combined[source] = (combined, projected_groups)
+
+    @property
+    def sources(self) -> List[str]:
+        return list(set(self._combined) | set(self._rules[index].source
+                                              for index, _ in self._standalone))
+
+    def _scan_combined(self, text: str,
+                       combined: re.Pattern,
+                       projected_groups: List[Tuple[int, int]],
+                       results: List[List[str]]) -> None:
+        rules = self._rules
+        next_start = {index: 0 for index, _ in projected_groups}
+        pending = [(index, group) for index, group in projected_groups]
+
+        for matched in combined.finditer(text):
+            position = matched.start()
+            still_pending = []
+            for index, group in pending:
+                wrapper = f"r{index}"
+                end = matched.end(wrapper)
+                if end < 0 or position < next_start[index]:
+                    # the rule does not match here, or overlaps its previous match
+                    still_pending.append((index, group))
+                    continue
+
+                results[index].append(matched.group(group) or "")
+                if rules[index].first_only:
+                    continue
+                next_start[index] = end if end > position else position + 1
+                still_pending.append((index, group))
+
+            pending = still_pending
+            if not pending:
+                break
+
+    def scan(self, text_of: Callable[[str], str]) -> List[List[str]]:
+        """ Matches every rule against its text source
+
+        Args:
+            text_of: returns the text of a source (VISIBLE_TEXT or RAW_TEXT)
+
+        Returns:
+            a list of matched strings for each rule, in rule order
+        """
+        results: List[List[str]] = [[] for _ in self._rules]
+
+        for source, (combined, projected_groups) in self._combined.items():
+            self._scan_combined(text_of(source), combined, projected_groups, results)
+
+        for index, compiled in self._standalone:
+            rule = self._rules[index]
+            text = text_of(rule.source)
+            if rule.first_only:
+                matched = compiled.search(text)
+                results[index] = [matched.group(rule.group) or ""] if matched else []
+            else:
+                results[index] = [matched.group(rule.group) or ""
+                                  for matched in compiled.finditer(text)]
+
+        return results
+
+    def scan_text(self, text: str) -> List[List[str]]:
+        """ Matches every rule against the same text, regardless of their sources """
+        return self.scan(lambda source: text)
+
+
+@lru_cache(maxsize=256)
+def compile_scanner(regex_rules: Tuple[RegexRule, ...]) -> RegexRuleScanner:
+    """ Compiles and caches a scanner for a pipeline's regex rules """
+    return RegexRuleScanner(regex_rules)
@@ -0,0 +1,302 @@
+""" Change rate aware recrawl scheduling
+
+Recurring jobs refetch every page on every run, although most pages never change, e.g. the
+AQI report of a past month. RecrawlScheduler keeps a fetch history per url, estimates how
+often each page changes and spends a fixed daily fetch budget where it keeps the most pages
+fresh.
+
+Page changes are modelled as a Poisson process with rate λ. The rate is estimated from n
+revisits of which X saw a change (Cho & Garcia-Molina):
+
+    λ = -log((n - X + 0.5) / (n + 0.5)) / mean revisit interval
+
+A page revisited f times a day is fresh on average (f / λ)(1 - exp(-λ / f)) of the time.
+Freshness summed over all pages is maximized under Σf = budget when every page has the same
+marginal gain ∂F/∂f = (1 - (1 + r)exp(-r)) / λ = μ, with r = λ / f. Pages changing much faster
+than they can be revisited get no share of the budget, like pages that never change, both
+fall back to one visit every max_interval.
+
+The fetch histories outlive a run in a HistoryStore, so the change rates of recurring jobs
+are estimated over all their runs.
+"""
+
+import math
+import sqlite3
+import numpy as np
+from datetime import datetime, timedelta
+from hashlib import blake2b
+from itertools import chain
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+_seconds_per_day = 86400.0
+
+
+def content_hash(content: str) -> str:
+    return blake2b(content.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class UrlHistory(object):
+    """ Fetch history of a url
+
+    Fields:
+        url: str
+        content_hash: str, hash of the last fetched content
+        first_check: datetime
+        last_check: datetime
+        last_change: datetime, time of the last fetch that saw new content
+        checks: int, number of fetches
+        changes: int, number of revisits that saw a change
+    """
+    __slots__ = ["url", "content_hash", "first_check", "last_check",
+                 "last_change", "checks", "changes"]
+
+    def __init__(self, url: str, content_hash: str, checked_at: datetime,
+                 first_check: Optional[datetime] = None,
+                 last_change: Optional[datetime] = None,
+                 checks: int = 1, changes: int = 0):
+        self.url = url
+        self.content_hash = content_hash
+        self.first_check = first_check or checked_at
+        self.last_check = checked_at
+        self.last_change = last_change or checked_at
+        self.checks = checks
+        self.changes = changes
+
+    def record(self, content_hash: str, checked_at: datetime) -> bool:
+        """ Records a revisit, returns whether the content changed """
+        changed = content_hash != self.content_hash
+        self.content_hash = content_hash
+        self.last_check = checked_at
+        self.checks += 1
+        if changed:
+            self.changes += 1
+            self.last_change = checked_at
+        return changed
+
+    def to_dict(self) -> dict:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "UrlHistory":
+        return cls(url=data['url'], content_hash=data['content_hash'],
+                   checked_at=data['last_check'], first_check=data['first_check'],
+                   last_change=data['last_change'], checks=data['checks'],
+                   changes=data['changes'])
+
+
+class HistoryStore(object):
+    """ Fetch histories of urls persisted in SQLite
+
+    Args:
+        path: SQLite database file
+    """
+
+    def __init__(self, path: str, connect: Callable = sqlite3.connect):
+        self._connection = connect(path)
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS url_history (
+                url TEXT PRIMARY KEY, content_hash TEXT, first_check TEXT, last_check TEXT,
+                last_change TEXT, checks INTEGER, changes INTEGER)
+        """)
+
+    def load(self) -> List[UrlHistory]:
+        rows = self._connection.execute(
+            "SELECT url, content_hash, first_check, last_check, last_change, checks, changes "
+            "FROM url_history").fetchall()
+        return [UrlHistory(url, hashed, datetime.fromisoformat(last_check),
+                           first_check=datetime.fromisoformat(first_check),
+                           last_change=datetime.fromisoformat(last_change),
+                           checks=checks, changes=changes)
+                for url, hashed, first_check, last_check, last_change, checks, changes in rows]
+
+    def save(self, histories: Iterable[UrlHistory]) -> None:
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO url_history "
+            "(url, content_hash, first_check, last_check, last_change, checks, changes) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(history.url, history.content_hash, history.first_check.isoformat(),
+              history.last_check.isoformat(), history.last_change.isoformat(),
+              history.checks, history.changes)
+             for history in histories])
+        self._connection.commit()
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+def estimate_change_rate(revisits: int, changes: int, observed_days: float) -> float:
+    """ Poisson change rate per day from revisits at about regular intervals """
+    if revisits <= 0 or observed_days <= 0:
+        return math.nan
+    changes = min(changes, revisits)
+    return -math.log((revisits - changes + 0.5) / (revisits + 0.5)) * revisits / observed_days
+
+
+def _solve_ratio(targets: np.ndarray, iterations: int = 60) -> np.ndarray:
+    """ Solves 1 - (1 + r)exp(-r) = target for r, element-wise, targets in [0, 1) """
+    low = np.zeros_like(targets)
+    high = np.full_like(targets, 64.0)
+    for _ in range(iterations):
+        middle = (low + high) / 2
+        too_low = 1 - (1 + middle) * np.exp(-middle) < targets
+        low = np.where(too_low, middle, low)
+        high = np.where(too_low, high, middle)
+    return (low + high) / 2
+
+
+def optimal_revisit_frequencies(change_rates: np.ndarray, budget: float,
+                                min_frequency: float = 0.0,
+                                iterations: int = 100) -> np.ndarray:
+    """ Revisits per day of each page maximizing the total freshness
+
+    Args:
+        change_rates: changes per day of each page
+        budget: fetches per day shared by all pages
+        min_frequency: every page is revisited at least this often
+
+    Returns:
+        np.ndarray, revisits per day summing to about the budget
+    """
+    change_rates = np.asarray(change_rates, dtype=float)
+    floor = np.full(len(change_rates), min_frequency)
+    if floor.sum() >= budget:
+        return floor * (budget / max(floor.sum(), 1e-12))
+    changing = change_rates > 0
+    if not changing.any():
+        return floor
+
+    def frequencies(mu: float) -> np.ndarray:
+        targets = mu * change_rates[changing]
+        gains = np.zeros(len(change_rates))
+        # pages whose marginal gain never reaches mu get no share
+        solvable = targets < 1
+        ratios = _solve_ratio(targets[solvable])
+        shares = np.zeros(len(targets))
+        shares[solvable] = change_rates[changing][solvable] / np.maximum(ratios, 1e-12)
+        gains[changing] = shares
+        return np.maximum(gains, floor)
+
+    # the total frequency falls as the marginal gain mu rises, bisect mu in log space
+    low, high = -30.0, math.log(1.0 / change_rates[changing].min())
+    for _ in range(iterations):
+        middle = (low + high) / 2
+        if frequencies(math.exp(middle)).sum() > budget:
+            low = middle
+        else:
+            high = middle
+    return frequencies(math.exp(high))
+
+
+class RecrawlScheduler(object):
+    """ Records fetches and decides which urls are due for a revisit
+
+    Urls never fetched before are always due. The revisit intervals of known urls are planned
+    by plan() so that revisiting every url when it is due costs about daily_budget fetches a day.
+
+    Args:
+        daily_budget: number of revisits a day
+        max_interval: longest time between two visits of a url
+        default_change_rate: changes per day assumed for urls observed for too short a time
+        min_observation: time a url must be observed before a change rate of zero is trusted
+        store: loads the histories of earlier runs and persists them on save
+    """
+
+    def __init__(self,
+                 daily_budget: int = 1000,
+                 max_interval: timedelta = timedelta(days=180),
+                 default_change_rate: float = 1.0,
+                 min_observation: timedelta = timedelta(days=7),
+                 histories: Iterable[UrlHistory] = (),
+                 hasher=content_hash,
+                 store: Optional[HistoryStore] = None):
+        self._daily_budget = daily_budget
+        self._max_interval = max_interval
+        self._default_change_rate = default_change_rate
+        self._min_observation = min_observation
+        self._hasher = hasher
+        self._store = store
+        stored = store.load() if store is not None else []
+        self._histories: Dict[str, UrlHistory] = {
+            history.url: history for history in chain(stored, histories)}
+        self._intervals: Dict[str, timedelta] = {}
+        self._unsaved: Set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self._histories)
+
+    def __contains__(self, url: str) -> bool:
+        return url in self._histories
+
+    def history_of(self, url: str) -> Optional[UrlHistory]:
+        return self._histories.get(url)
+
+    def histories(self) -> List[UrlHistory]:
+        return list(self._histories.values())
+
+    def record_fetch(self, url: str, content: str, fetched_at: Optional[datetime] = None) -> bool:
+        """ Records a fetched page, returns whether it is new or changed """
+        fetched_at = fetched_at or datetime.now()
+        digest = self._hasher(content)
+        self._unsaved.add(url)
+        history = self._histories.get(url)
+        if history is None:
+            self._histories[url] = UrlHistory(url, digest, fetched_at)
+            return True
+        return history.record(digest, fetched_at)
+
+    def save(self) -> None:
+        """ Persists the histories recorded since the last save, if there is a store """
+        if self._store is not None and self._unsaved:
+            self._store.save(self._histories[url] for url in self._unsaved)
+        self._unsaved.clear()
+
+    def change_rate(self, history: UrlHistory) -> float:
+        """ Estimated changes per day of a url """
+        observed = history.last_check - history.first_check
+        rate = estimate_change_rate(history.checks - 1, history.changes,
+                                    observed.total_seconds() / _seconds_per_day)
+        if math.isnan(rate):
+            return self._default_change_rate
+        if observed < self._min_observation:
+            # a few unchanged revisits in a row say little about a page
+            return max(rate, self._default_change_rate)
+        return rate
+
+    def plan(self) -> Dict[str, timedelta]:
+        """ Plans the revisit interval of every known url """
+        urls = list(self._histories)
+        if not urls:
+            self._intervals = {}
+            return self._intervals
+        change_rates = np.array([self.change_rate(self._histories[url]) for url in urls])
+        max_interval_days = self._max_interval.total_seconds() / _seconds_per_day
+        frequencies = optimal_revisit_frequencies(
+            change_rates, self._daily_budget, min_frequency=1.0 / max_interval_days)
+        interval_days = np.minimum(1.0 / np.maximum(frequencies, 1e-12), max_interval_days)
+        self._intervals = {url: timedelta(days=float(days))
+                           for url, days in zip(urls, interval_days)}
+        return self._intervals
+
+    def next_visit(self, url: str) -> Optional[datetime]:
+        """ When a url is due, None if it was never fetched """
+        history = self._histories.get(url)
+        if history is None:
+            return None
+        return history.last_check + self._intervals.get(url, self._max_interval)
+
+    def is_due(self, url: str, now: Optional[datetime] = None) -> bool:
+        next_visit = self.next_visit(url)
+        return next_visit is None or next_visit <= (now or datetime.now())
+
+    def due_urls(self, now: Optional[datetime] = None, limit: Optional[int] = None) -> List[str]:
+        """ Known urls that are due, the most overdue first, at most a daily budget by default """
+        now = now or datetime.now()
+        overdue = []
+        for url, history in self._histories.items():
+            interval = self._intervals.get(url, self._max_interval)
+            waited = now - history.last_check
+            if waited >= interval:
+                overdue.append((waited / interval, url))
+        overdue.sort(reverse=True)
+        limit = self._daily_budget if limit is None else limit
+        return [url for _, url in overdue[:limit]]
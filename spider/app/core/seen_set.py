@@ -0,0 +1,243 @@
+""" Memory compact sets of seen urls
+
+A Python set of url strings costs a few hundred bytes per url. Large crawls only need to know
+whether a url was seen before, so these sets keep hashes of urls instead:
+
+    FingerprintSeenSet: 64-bit fingerprints in a NumPy open addressing table, 16-32 bytes
+                        per url, false positives only on 64-bit hash collisions
+    ScalableBloomFilter: a few bytes per url for a configurable false positive rate
+
+Every seen set supports add, `in` and len like a set, and reports its memory use and its
+estimated false positive rate. A false positive makes a crawler skip an unseen url.
+"""
+
+import math
+from sys import getsizeof
+import numpy as np
+from abc import ABC, abstractmethod
+from hashlib import blake2b
+from typing import List, Set
+
+
+def url_fingerprint(url: str) -> int:
+    """ 64-bit fingerprint of a url, never 0 """
+    return int.from_bytes(blake2b(url.encode('utf-8'), digest_size=8).digest(), 'little') or 1
+
+
+class BaseSeenSet(ABC):
+    """ Base class of seen url sets """
+
+    @abstractmethod
+    def add(self, url: str) -> None:
+        return NotImplemented
+
+    @abstractmethod
+    def __contains__(self, url: str) -> bool:
+        return NotImplemented
+
+    @abstractmethod
+    def __len__(self) -> int:
+        return NotImplemented
+
+    @property
+    @abstractmethod
+    def memory_bytes(self) -> int:
+        """ Memory used by the set """
+        return NotImplemented
+
+    @property
+    @abstractmethod
+    def false_positive_rate(self) -> float:
+        """ Estimated probability that an unseen url is reported as seen """
+        return NotImplemented
+
+    def stats(self) -> dict:
+        return {
+            'size': len(self),
+            'memory_bytes': self.memory_bytes,
+            'bytes_per_url': self.memory_bytes / max(1, len(self)),
+            'false_positive_rate': self.false_positive_rate
+        }
+
+
+class ExactSeenSet(BaseSeenSet):
+    """ A set of url strings, exact but large """
+
+    def __init__(self):
+        self._urls: Set[str] = set()
+
+    def add(self, url: str) -> None:
+        self._urls.add(url)
+
+    def __contains__(self, url: str) -> bool:
+        return url in self._urls
+
+    def __len__(self) -> int:
+        return len(self._urls)
+
+    @property
+    def memory_bytes(self) -> int:
+        return getsizeof(self._urls) + sum(getsizeof(url) for url in self._urls)
+
+    @property
+    def false_positive_rate(self) -> float:
+        return 0.0
+
+
+class FingerprintSeenSet(BaseSeenSet):
+    """ 64-bit url fingerprints in a NumPy open addressing table with linear probing
+
+    Args:
+        initial_capacity: expected number of urls
+        max_load_factor: the table doubles when it is fuller than this
+    """
+
+    def __init__(self, initial_capacity: int = 1 << 10, max_load_factor: float = 0.5):
+        self._max_load_factor = max_load_factor
+        self._size = 0
+        slots = 1 << max(4, math.ceil(math.log2(initial_capacity / max_load_factor)))
+        self._table = np.zeros(slots, dtype=np.uint64)
+        self._mask = slots - 1
+
+    def _slot_of(self, fingerprint: int) -> int:
+        """ Slot holding the fingerprint, or the empty slot where it belongs """
+        table, mask = self._table, self._mask
+        slot = fingerprint & mask
+        while True:
+            stored = int(table[slot])
+            if stored == 0 or stored == fingerprint:
+                return slot
+            slot = (slot + 1) & mask
+
+    def _grow(self) -> None:
+        fingerprints = self._table[self._table != 0]
+        self._table = np.zeros(len(self._table) * 2, dtype=np.uint64)
+        self._mask = len(self._table) - 1
+        for fingerprint in fingerprints.tolist():
+            self._table[self._slot_of(fingerprint)] = fingerprint
+
+    def add(self, url: str) -> None:
+        fingerprint = url_fingerprint(url)
+        slot = self._slot_of(fingerprint)
+        if self._table[slot] == 0:
+            self._table[slot] = fingerprint
+            self._size += 1
+            if self._size > self._max_load_factor * len(self._table):
+                self._grow()
+
+    def __contains__(self, url: str) -> bool:
+        fingerprint = url_fingerprint(url)
+        return int(self._table[self._slot_of(fingerprint)]) == fingerprint
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def memory_bytes(self) -> int:
+        return self._table.nbytes
+
+    @property
+    def false_positive_rate(self) -> float:
+        # an unseen url collides with one of the stored fingerprints
+        return -math.expm1(-self._size / 2.0 ** 64)
+
+
+class _BloomFilter(object):
+    """ A fixed size Bloom filter over 128-bit url hashes with double hashing
+
+    Bits live in a bytearray, probing k positions with Python ints is much faster
+    than creating small NumPy arrays for every url.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.bits = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.count = 0
+        self.array = bytearray((self.bits + 7) // 8)
+
+    def contains(self, first_hash: int, second_hash: int) -> bool:
+        array, bits = self.array, self.bits
+        # most unseen urls miss on the first few probes
+        position, step = first_hash % bits, second_hash % bits
+        for _ in range(self.hashes):
+            if not array[position >> 3] & (1 << (position & 7)):
+                return False
+            position = (position + step) % bits
+        return True
+
+    def add(self, first_hash: int, second_hash: int) -> None:
+        array, bits = self.array, self.bits
+        position, step = first_hash % bits, second_hash % bits
+        for _ in range(self.hashes):
+            array[position >> 3] |= 1 << (position & 7)
+            position = (position + step) % bits
+        self.count += 1
+
+    @property
+    def false_positive_rate(self) -> float:
+        return (-math.expm1(-self.hashes * self.count / self.bits)) ** self.hashes
+
+
+class ScalableBloomFilter(BaseSeenSet):
+    """ A Bloom filter that grows with the number of urls
+
+    When the newest filter is full, a larger filter with a tighter error rate is added,
+    so the overall false positive rate stays below error_rate however many urls are added.
+
+    Args:
+        initial_capacity: number of urls of the first filter
+        error_rate: target false positive rate of the whole set
+        growth: capacity ratio of consecutive filters
+        tightening: error rate ratio of consecutive filters
+    """
+
+    def __init__(self,
+                 initial_capacity: int = 1 << 14,
+                 error_rate: float = 1e-4,
+                 growth: int = 2,
+                 tightening: float = 0.8):
+        self._initial_capacity = initial_capacity
+        self._error_rate = error_rate
+        self._growth = growth
+        self._tightening = tightening
+        self._filters: List[_BloomFilter] = []
+        self._add_filter()
+
+    def _add_filter(self) -> None:
+        index = len(self._filters)
+        self._filters.append(_BloomFilter(
+            capacity=self._initial_capacity * self._growth ** index,
+            # the geometric series of error rates sums to error_rate
+            error_rate=self._error_rate * (1 - self._tightening) * self._tightening ** index))
+
+    def _hashes(self, url: str):
+        digest = blake2b(url.encode('utf-8'), digest_size=16).digest()
+        return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+
+    def add(self, url: str) -> None:
+        first_hash, second_hash = self._hashes(url)
+        if any(bloom_filter.contains(first_hash, second_hash) for bloom_filter in self._filters):
+            return
+        if self._filters[-1].count >= self._filters[-1].capacity:
+            self._add_filter()
+        self._filters[-1].add(first_hash, second_hash)
+
+    def __contains__(self, url: str) -> bool:
+        first_hash, second_hash = self._hashes(url)
+        return any(bloom_filter.contains(first_hash, second_hash)
+                   for bloom_filter in self._filters)
+
+    def __len__(self) -> int:
+        return sum(bloom_filter.count for bloom_filter in self._filters)
+
+    @property
+    def memory_bytes(self) -> int:
+        return sum(len(bloom_filter.array) for bloom_filter in self._filters)
+
+    @property
+    def false_positive_rate(self) -> float:
+        true_negative_rate = 1.0
+        for bloom_filter in self._filters:
+            true_negative_rate *= 1 - bloom_filter.false_positive_rate
+        return 1 - true_negative_rate
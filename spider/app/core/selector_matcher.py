@@ -0,0 +1,226 @@
+""" Single pass matching of simple selector rules
+
+Most pipelines are made of simple xpath rules such as //h3/a, //div[contains(@class, 'c-abstract')]
+or //*[@id='content']. Evaluating them one at a time walks the whole document once per rule.
+SelectorMatcher compiles the simple rules of a pipeline into one dispatch table keyed by tag name
+and answers all of them in a single traversal. Rules it cannot compile are evaluated with xpath.
+
+Supported rules have the form //step/step/..., for example //h3/a or //*[@id='content']/h1.
+Each step is tag[predicate][predicate]..., where tag may be * and each predicate is one of
+    @attr='value'
+    contains(@attr, 'value')
+    @attr
+    not(@attr)
+"""
+
+import re
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from lxml.etree import Element
+
+Selector = Tuple[str, str]
+
+step_pattern = re.compile(
+    r"^(?P<tag>[A-Za-z_][\w\-]*|\*)(?P<predicates>(?:\[[^\[\]]*\])*)$")
+predicate_pattern = re.compile(r"\[([^\[\]]*)\]")
+# a literal may not contain quotes, so predicates with several literals such as
+# contains(@a, 'x') and contains(@b, 'y') do not compile and are evaluated with xpath
+attr_equals_pattern = re.compile(r"^\s*@([\w\-:]+)\s*=\s*(['\"])([^'\"]*)\2\s*$")
+attr_contains_pattern = re.compile(
+    r"^\s*contains\s*\(\s*@([\w\-:]+)\s*,\s*(['\"])([^'\"]*)\2\s*\)\s*$")
+attr_exists_pattern = re.compile(r"^\s*@([\w\-:]+)\s*$")
+attr_missing_pattern = re.compile(r"^\s*not\s*\(\s*@([\w\-:]+)\s*\)\s*$")
+
+
+def _attr_equals(attr: str, value: str) -> Callable:
+    return lambda element: element.get(attr) == value
+
+
+def _attr_contains(attr: str, value: str) -> Callable:
+    return lambda element: value in (element.get(attr) or "")
+
+
+def _attr_exists(attr: str) -> Callable:
+    return lambda element: element.get(attr) is not None
+
+
+def _attr_missing(attr: str) -> Callable:
+    return lambda element: element.get(attr) is None
+
+
+_predicate_compilers = [
+    (attr_equals_pattern, lambda matched: _attr_equals(matched.group(1), matched.group(3))),
+    (attr_contains_pattern, lambda matched: _attr_contains(matched.group(1), matched.group(3))),
+    (attr_exists_pattern, lambda matched: _attr_exists(matched.group(1))),
+    (attr_missing_pattern, lambda matched: _attr_missing(matched.group(1))),
+]
+
+
+def _compile_predicate(predicate: str) -> Optional[Callable]:
+    for pattern, compiler in _predicate_compilers:
+        matched = pattern.match(predicate)
+        if matched:
+            return compiler(matched)
+    return None
+
+
+def _split_steps(path: str) -> List[str]:
+    """ Splits a location path on slashes outside of predicates and string literals """
+    steps = []
+    current = []
+    depth = 0
+    quote = None
+    for char in path:
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif char == '[':
+            depth += 1
+        elif char == ']':
+            depth -= 1
+        elif char == '/' and depth == 0:
+            steps.append("".join(current))
+            current = []
+            continue
+        current.append(char)
+    steps.append("".join(current))
+    return steps
+
+
+def _compile_step(step: str) -> Optional[Tuple[str, Tuple[Callable, ...]]]:
+    matched = step_pattern.match(step.strip())
+    if matched is None:
+        return None
+
+    checks = []
+    for predicate in predicate_pattern.findall(matched.group('predicates')):
+        check = _compile_predicate(predicate)
+        if check is None:
+            return None
+        checks.append(check)
+
+    return matched.group('tag'), tuple(checks)
+
+
+def compile_simple_xpath(expression: str) -> Optional[List[Tuple[str, Tuple[Callable, ...]]]]:
+    """ Compiles a simple xpath expression to a list of (tag, predicate checks) steps
+
+    Returns:
+        None if the expression is not simple enough to be matched by tag dispatch
+    """
+    expression = expression.strip()
+    if not expression.startswith('//') or expression.startswith('///'):
+        return None
+
+    steps = []
+    for step in _split_steps(expression[2:]):
+        compiled_step = _compile_step(step)
+        if compiled_step is None:
+            return None
+        steps.append(compiled_step)
+
+    return steps
+
+
+def _step_matches(element: Element, tag: str, checks: Tuple[Callable, ...]) -> bool:
+    return ((tag == '*' or element.tag == tag) and
+            all(check(element) for check in checks))
+
+
+def _ancestors_match(element: Element,
+                     ancestor_steps: Tuple[Tuple[str, Tuple[Callable, ...]], ...]) -> bool:
+    """ Checks the parent chain against the leading steps of a child-axis path """
+    for tag, checks in ancestor_steps:
+        element = element.getparent()
+        if element is None or not _step_matches(element, tag, checks):
+            return False
+    return True
+
+
+class SelectorMatcher(object):
+    """ Answers a list of selector rules in one traversal of an lxml document
+
+    Args:
+        selectors: a list of (selector_type, selector_expression) pairs
+    """
+
+    def __init__(self, selectors: Sequence[Selector]):
+        self._selectors = list(selectors)
+        self._dispatch: Dict[str, List[Tuple[int, Tuple[Callable, ...], Tuple[Any, ...]]]] = {}
+        self._fallback_indices = []
+
+        for index, (selector_type, selector_expression) in enumerate(self._selectors):
+            steps = None
+            if selector_type == 'xpath':
+                steps = compile_simple_xpath(selector_expression)
+
+            if steps is None:
+                self._fallback_indices.append(index)
+            else:
+                # dispatch on the last step, then walk up the parent chain for the others
+                tag, checks = steps[-1]
+                ancestor_steps = tuple(reversed(steps[:-1]))
+                self._dispatch.setdefault(tag, []).append((index, checks, ancestor_steps))
+
+        self._wildcard = self._dispatch.pop('*', [])
+
+    @property
+    def compiled_count(self) -> int:
+        return len(self._selectors) - len(self._fallback_indices)
+
+    @property
+    def fallback_selectors(self) -> List[Selector]:
+        return [self._selectors[index] for index in self._fallback_indices]
+
+    def _traverse(self, root: Element, results: List[List[Any]]) -> None:
+        dispatch = self._dispatch
+        wildcard = self._wildcard
+        if len(wildcard):
+            elements = root.iter()
+        else:
+            # let lxml skip irrelevant tags in C
+            elements = root.iter(*dispatch.keys())
+
+        for element in elements:
+            tag = element.tag
+            if not isinstance(tag, str):
+                # comments and processing instructions
+                continue
+            for index, checks, ancestor_steps in dispatch.get(tag, ()):
+                if (all(check(element) for check in checks) and
+                    _ancestors_match(element, ancestor_steps)):
+                    results[index].append(element)
+            for index, checks, ancestor_steps in wildcard:
+                if (all(check(element) for check in checks) and
+                    _ancestors_match(element, ancestor_steps)):
+                    results[index].append(element)
+
+    def match(self, root: Element,
+              fallback_selector: Callable[[str, str], List[Any]]) -> List[List[Any]]:
+        """ Select elements for every selector
+
+        Args:
+            root: any element of the lxml document; the whole document is traversed
+            fallback_selector: evaluates selectors which could not be compiled,
+                               takes (selector_type, selector_expression)
+
+        Returns:
+            a list of selected elements for each selector, in document order
+        """
+        results: List[List[Any]] = [[] for _ in self._selectors]
+
+        if len(self._dispatch) or len(self._wildcard):
+            self._traverse(root.getroottree().getroot(), results)
+
+        for index in self._fallback_indices:
+            results[index] = fallback_selector(*self._selectors[index])
+
+        return results
+
+
+@lru_cache(maxsize=256)
+def compile_matcher(selectors: Tuple[Selector, ...]) -> SelectorMatcher:
+    """ Compiles and caches a matcher for a pipeline's selectors """
+    return SelectorMatcher(selectors)
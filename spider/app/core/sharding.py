@@ -0,0 +1,462 @@
+""" Multi-process sharded crawling
+
+One event loop saturates one core once pages are parsed in the crawl. ShardedCrawling runs
+shard_count worker processes instead, each with its own event loop, request client and
+breadth first crawler. Urls are partitioned by a hash of their partition key, by default
+their host, so every url has exactly one owning shard: only the owner fetches it and keeps
+it in its seen set, and per-host politeness state stays local to one shard. Links found by
+a shard are routed to their owners through a transport.
+
+The coordinator, running in the calling process, merges the results and the progress of the
+shards and detects when the crawl is complete. A shard being idle is not enough, links may
+still be on their way to it, so the coordinator counts the links every shard sent and
+received and waits for two consecutive rounds of status reports in which every shard is idle
+and the counts agree (the four counter method).
+
+Transports are pluggable. LocalTransport uses multiprocessing queues, a transport over the
+network only has to implement send and receive to spread the shards over several nodes.
+"""
+
+import queue
+import asyncio
+import inspect
+import multiprocessing
+from abc import ABC, abstractmethod
+from asyncio import Queue
+from contextlib import asynccontextmanager
+from hashlib import blake2b
+from urllib.parse import urlsplit
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from .spider import BaseSpider
+from .parser import ParserContextFactory
+from .crawling import BaseCrawlingStrategy, BFSCrawling, CrawlerContext
+from .budget import CrawlBudget, url_host
+from ..models.data_models import ParseRule, ParseRecord, CrawlRecord
+
+COORDINATOR = -1
+
+
+def url_path_prefix(url: str, segments: int = 1) -> str:
+    """ Partition key of the host and the first path segments
+
+    Crawls confined to the host of their start url, like the ones of BFSCrawling, need it
+    to spread over several shards. Politeness towards the host is then shared by all shards,
+    so max_concurrency should be divided by the number of shards.
+    """
+    parts = urlsplit(url)
+    path = [segment for segment in parts.path.split("/") if len(segment)]
+    return "/".join([parts.netloc.lower()] + path[:segments])
+
+
+def shard_of(url: str, shard_count: int, partition_key: Callable = url_host) -> int:
+    """ Owning shard of a url, the same in every process unlike hash() """
+    digest = blake2b(partition_key(url).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') % shard_count
+
+
+class BaseShardTransport(ABC):
+    """ Carries messages between the shards and the coordinator
+
+    Destinations are shard ids, or COORDINATOR. Messages are tuples of picklable values.
+    """
+
+    @abstractmethod
+    def send(self, destination: int, message: Tuple) -> None:
+        return NotImplemented
+
+    @abstractmethod
+    def receive(self, destination: int, timeout: float) -> Optional[Tuple]:
+        """ Next message for destination, None if none arrived within timeout seconds """
+        return NotImplemented
+
+    def close(self) -> None:
+        pass
+
+
+class LocalTransport(BaseShardTransport):
+    """ One multiprocessing queue per destination, for shards on the same machine """
+
+    def __init__(self, shard_count: int, queue_factory: Callable = multiprocessing.Queue):
+        self._inboxes = {destination: queue_factory()
+                         for destination in [COORDINATOR] + list(range(shard_count))}
+
+    def send(self, destination: int, message: Tuple) -> None:
+        self._inboxes[destination].put(message)
+
+    def receive(self, destination: int, timeout: float) -> Optional[Tuple]:
+        try:
+            return self._inboxes[destination].get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self) -> None:
+        for inbox in self._inboxes.values():
+            inbox.close()
+
+
+class ShardLocalCrawling(BFSCrawling):
+    """ Breadth first crawling of the urls owned by one shard
+
+    Links owned by other shards are sent to them instead of being queued, links received
+    from other shards are queued like the ones found locally. Running out of pending urls
+    only reports the shard as idle, the crawl ends when the coordinator says so.
+
+    Args:
+        shard_id: id of this shard
+        shard_count: number of shards
+        transport: carries links and status reports
+        partition_key: maps urls to the key shards are assigned by
+        result_mapper: maps each result to what is sent to the coordinator
+        receive_timeout: seconds between progress reports
+    """
+
+    def __init__(self,
+                 shard_id: int,
+                 shard_count: int,
+                 transport: BaseShardTransport,
+                 partition_key: Callable = url_host,
+                 result_mapper: Callable = lambda node: node,
+                 receive_timeout: float = 0.5,
+                 event_loop_getter: Callable = asyncio.get_event_loop,
+                 **kwargs):
+        self._shard_id = shard_id
+        self._shard_count = shard_count
+        self._transport = transport
+        self._partition_key = partition_key
+        self._result_mapper = result_mapper
+        self._receive_timeout = receive_timeout
+        self._event_loop_getter = event_loop_getter
+        self._sent = 0
+        self._received = 0
+        super().__init__(**kwargs)
+
+    def _owns(self, url: str) -> bool:
+        return shard_of(url, self._shard_count, self._partition_key) == self._shard_id
+
+    def _init_queue(self):
+        if len(self._start_url) == 0 or self._owns(self._start_url):
+            super()._init_queue()
+
+    def _enqueue_link(self, link: ParseRecord, parent: CrawlRecord) -> None:
+        if self._owns(link.value):
+            super()._enqueue_link(link, parent)
+            return
+        # remembered locally as well, so a link found on many pages is sent once
+        self._visited_urls.add(link.value)
+        self._sent += 1
+        self._transport.send(shard_of(link.value, self._shard_count, self._partition_key),
+                             ('link', link.value, parent.relative_depth + 1, parent.id))
+
+    def _report(self, probe_round: Optional[int] = None) -> None:
+        self._transport.send(COORDINATOR, (
+            'status', self._shard_id, probe_round, self._sent, self._received,
+            self._fetched_pages, self._fetched_bytes, self._pending <= 0))
+
+    def _idle(self) -> None:
+        self._report()
+
+    def send_result(self, node: CrawlRecord) -> None:
+        self._transport.send(COORDINATOR, ('result', self._shard_id, self._result_mapper(node)))
+
+    async def _receive(self) -> None:
+        loop = self._event_loop_getter()
+        while True:
+            message = await loop.run_in_executor(
+                None, self._transport.receive, self._shard_id, self._receive_timeout)
+            if message is None:
+                self._report()
+                continue
+            kind = message[0]
+            if kind == 'link':
+                _, url, depth, parent_id = message
+                self._received += 1
+                if url not in self._visited_urls:
+                    self._enqueue(url, depth, parent_id)
+            elif kind == 'probe':
+                self._report(probe_round=message[1])
+            elif kind == 'halt':
+                # stop scheduling fetches, like an early stop of a single process crawl
+                self._stopped = True
+            elif kind == 'stop':
+                self._finished.set()
+                return
+
+    async def crawl(self, rules: List[ParseRule],
+                    max_depth: int,
+                    **kwargs) -> List[CrawlRecord]:
+        """ Crawls until the coordinator stops the shard, results are sent to the coordinator """
+        self._sent = 0
+        self._received = 0
+        receiver = self._task_creator(self._receive())
+        try:
+            return await super().crawl(rules=rules, max_depth=max_depth,
+                                       result_sink=self.send_result, **kwargs)
+        finally:
+            receiver.cancel()
+            await asyncio.gather(receiver, return_exceptions=True)
+
+
+@asynccontextmanager
+async def _open_request_client(request_client_factory: Callable):
+    request_client = request_client_factory()
+    if inspect.isawaitable(request_client):
+        request_client = await request_client
+    if hasattr(request_client, '__aenter__'):
+        async with request_client as opened_client:
+            yield opened_client
+    else:
+        yield request_client
+
+
+async def _crawl_shard(shard_id: int, shard_count: int, transport: BaseShardTransport,
+                       spider_class: BaseSpider, request_client_factory: Callable,
+                       link_finder: str, start_url: str,
+                       crawler_kwargs: dict, crawl_kwargs: dict) -> None:
+    async with _open_request_client(request_client_factory) as request_client:
+        crawler = ShardLocalCrawling(
+            shard_id=shard_id,
+            shard_count=shard_count,
+            transport=transport,
+            request_client=request_client,
+            spider_class=spider_class,
+            parser=ParserContextFactory.create(link_finder, base_url=''),
+            start_url='',
+            url_queue=Queue(),
+            web_page_queue=Queue(maxsize=crawler_kwargs.get('max_concurrency', 50)),
+            **crawler_kwargs)
+        crawler.start_url = start_url
+        await crawler.crawl(**crawl_kwargs)
+
+
+def run_shard(*args) -> None:
+    """ Entry point of a shard process, see _crawl_shard for the arguments """
+    asyncio.run(_crawl_shard(*args))
+
+
+class ShardedCrawling(BaseCrawlingStrategy):
+    """ Coordinates a crawl over several shard processes
+
+    The spider class, the request client factory, the partition key, the result mapper and
+    the crawl arguments are handed to the shard processes, so with the spawn start method
+    they must be picklable, i.e. module level functions and classes or partials of them,
+    including result_filter_func whose default is a lambda. With the fork start method,
+    the default on Linux, nothing is pickled.
+
+    Args:
+        spider_class: spider used by every shard
+        request_client_factory: creates the request client of a shard in its process, e.g.
+                                partial(RequestClient, headers=headers)
+        start_url: str
+        shard_count: number of shard processes
+        link_finder: name of the parser finding links
+        partition_key: maps urls to the key shards are assigned by, url_host by default
+        result_mapper: maps each result before it is sent to the coordinator, e.g. to
+                       drop page sources that are not needed
+        transport_factory: creates the transport for shard_count shards
+        process_factory: creates the shard processes
+        receive_timeout: seconds between progress reports of the shards
+        budget: default CrawlBudget of the crawls, see crawl
+        crawler_kwargs: arguments of the BFSCrawling of each shard, e.g. max_concurrency
+    """
+
+    def __init__(self,
+                 spider_class: BaseSpider,
+                 request_client_factory: Callable,
+                 start_url: str = '',
+                 shard_count: int = multiprocessing.cpu_count(),
+                 link_finder: str = 'link_parser',
+                 partition_key: Callable = url_host,
+                 result_mapper: Optional[Callable] = None,
+                 transport_factory: Callable = LocalTransport,
+                 process_factory: Callable = multiprocessing.Process,
+                 receive_timeout: float = 0.5,
+                 max_concurrency: int = 50,
+                 budget: Optional[CrawlBudget] = None,
+                 task_creator: Callable = asyncio.ensure_future,
+                 event_loop_getter: Callable = asyncio.get_event_loop,
+                 **crawler_kwargs):
+        self._spider_class = spider_class
+        self._request_client_factory = request_client_factory
+        self._start_url = start_url
+        self._shard_count = shard_count
+        self._link_finder = link_finder
+        self._partition_key = partition_key
+        self._result_mapper = result_mapper
+        self._transport_factory = transport_factory
+        self._process_factory = process_factory
+        self._receive_timeout = receive_timeout
+        self._max_concurrency = max_concurrency
+        self._budget = budget
+        self._task_creator = task_creator
+        self._event_loop_getter = event_loop_getter
+        self._crawler_kwargs = crawler_kwargs
+        self._shard_progress: Dict[int, int] = {}
+        self._shard_bytes: Dict[int, int] = {}
+
+    @property
+    def start_url(self) -> str:
+        return self._start_url
+
+    @start_url.setter
+    def start_url(self, url: str) -> None:
+        self._start_url = url
+
+    @property
+    def shard_progress(self) -> Dict[int, int]:
+        """ Pages fetched by each shard """
+        return dict(self._shard_progress)
+
+    @property
+    def fetched_pages(self) -> int:
+        return sum(self._shard_progress.values())
+
+    def _start_shards(self, transport: BaseShardTransport, crawl_kwargs: dict) -> list:
+        crawler_kwargs = dict(self._crawler_kwargs,
+                              max_concurrency=self._max_concurrency,
+                              partition_key=self._partition_key,
+                              receive_timeout=self._receive_timeout)
+        if self._result_mapper is not None:
+            crawler_kwargs['result_mapper'] = self._result_mapper
+        processes = [self._process_factory(
+            target=run_shard,
+            args=(shard_id, self._shard_count, transport, self._spider_class,
+                  self._request_client_factory, self._link_finder, self._start_url,
+                  crawler_kwargs, crawl_kwargs),
+            daemon=True) for shard_id in range(self._shard_count)]
+        for process in processes:
+            process.start()
+        return processes
+
+    def _broadcast(self, transport: BaseShardTransport, message: Tuple) -> None:
+        for shard_id in range(self._shard_count):
+            transport.send(shard_id, message)
+
+    async def crawl(self, rules: List[ParseRule],
+                    max_depth: int,
+                    url_filter_functions: List[Callable] = [],
+                    early_stop_control_func: Callable = lambda **kwargs: True,
+                    result_filter_func: Callable = lambda result, **kwargs: result,
+                    result_sink: Optional[Callable] = None,
+                    progress_callback: Optional[Callable] = None,
+                    budget: Optional[CrawlBudget] = None,
+                    **kwargs) -> List[Any]:
+        """ Crawls with every shard and merges their results
+
+        early_stop_control_func is checked by the coordinator whenever a shard reports its
+        progress, once it returns False the shards stop scheduling fetches. The other
+        arguments are those of BFSCrawling.crawl.
+
+        Args:
+            progress_callback: receives the pages fetched by each shard, a dict of shard ids
+                               to page counts, whenever a shard reports its progress
+            budget: overrides the default CrawlBudget for this crawl. The coordinator checks
+                    it against the pages and bytes of all shards whenever a shard reports,
+                    and halts the shards once it runs out, so the pages fetched between two
+                    reports may exceed it. Per-host caps are enforced by the shards, exactly
+                    when urls are partitioned by host.
+
+        Returns:
+            the results of all shards in the order they arrived, empty if a result sink is
+            provided
+        """
+        path: List[Any] = []
+        if result_sink is None:
+            result_sink = path.append
+        self._shard_progress = {shard_id: 0 for shard_id in range(self._shard_count)}
+        self._shard_bytes = {shard_id: 0 for shard_id in range(self._shard_count)}
+        if len(self._start_url) == 0:
+            return path
+
+        active_budget = budget if budget is not None else self._budget
+        shard_crawl_kwargs = dict(rules=rules, max_depth=max_depth,
+                                  url_filter_functions=url_filter_functions,
+                                  result_filter_func=result_filter_func)
+        if active_budget is not None:
+            active_budget.start()
+            # the shards own disjoint hosts, so they only need the per-host cap
+            shard_crawl_kwargs['budget'] = active_budget.host_budget()
+        transport = self._transport_factory(self._shard_count)
+        processes = self._start_shards(transport, shard_crawl_kwargs)
+        loop = self._event_loop_getter()
+
+        reports: Dict[int, Tuple[int, int, bool]] = {}
+        probe_round, probe_counts, probe_answers = 0, None, {}
+        halted = False
+        try:
+            while True:
+                message = await loop.run_in_executor(
+                    None, transport.receive, COORDINATOR, self._receive_timeout)
+                if message is None:
+                    if any(not process.is_alive() for process in processes):
+                        print("a shard process exited before the crawl was complete")
+                        break
+                    continue
+
+                if message[0] == 'result':
+                    handled = result_sink(message[2])
+                    if inspect.isawaitable(handled):
+                        await handled
+                    continue
+
+                _, shard_id, answered_round, sent, received, fetched, fetched_bytes, idle = message
+                reports[shard_id] = (sent, received, idle)
+                self._shard_progress[shard_id] = fetched
+                self._shard_bytes[shard_id] = fetched_bytes
+                if progress_callback is not None:
+                    progress_callback(self.shard_progress)
+                if active_budget is not None:
+                    active_budget.record_progress(self.fetched_pages,
+                                                  sum(self._shard_bytes.values()))
+                if not halted and ((active_budget is not None and active_budget.exhausted) or
+                                   not early_stop_control_func(**kwargs)):
+                    halted = True
+                    self._broadcast(transport, ('halt',))
+
+                if probe_counts is not None and answered_round == probe_round:
+                    probe_answers[shard_id] = (sent, received, idle)
+                    if len(probe_answers) == self._shard_count:
+                        answers = list(probe_answers.values())
+                        counts = (sum(answer[0] for answer in answers),
+                                  sum(answer[1] for answer in answers))
+                        if all(answer[2] for answer in answers) and counts == probe_counts:
+                            break
+                        probe_counts = None
+
+                # every shard looks idle with no link in transit, confirm with a second round
+                if (probe_counts is None and len(reports) == self._shard_count and
+                        all(report[2] for report in reports.values())):
+                    counts = (sum(report[0] for report in reports.values()),
+                              sum(report[1] for report in reports.values()))
+                    if counts[0] == counts[1]:
+                        probe_round += 1
+                        probe_counts, probe_answers = counts, {}
+                        self._broadcast(transport, ('probe', probe_round))
+        finally:
+            self._broadcast(transport, ('stop',))
+            for process in processes:
+                await loop.run_in_executor(None, process.join, self._receive_timeout * 10)
+                if process.is_alive():
+                    process.terminate()
+            transport.close()
+            if active_budget is not None and active_budget.exhausted_by is not None:
+                print(f"crawl budget exhausted by {active_budget.exhausted_by.value}: "
+                      f"{active_budget.stats()}")
+
+        return path
+
+    # yields results as they arrive, sharing the implementation of BFSCrawling
+    iter_crawl = BFSCrawling.iter_crawl
+
+
+def create_sharded_crawler(spider_class: BaseSpider,
+                           request_client_factory: Callable,
+                           start_url: str = '',
+                           shard_count: int = multiprocessing.cpu_count(),
+                           **kwargs) -> CrawlerContext:
+    """ Creates a CrawlerContext crawling with shard_count processes, see ShardedCrawling """
+    return CrawlerContext(crawling_strategy_cls=ShardedCrawling,
+                          spider_class=spider_class,
+                          request_client_factory=request_client_factory,
+                          start_url=start_url,
+                          shard_count=shard_count,
+                          **kwargs)
@@ -0,0 +1,136 @@
+""" Snapshot stores of periodic reports
+
+Report services such as BaiduCOVIDSpider refetch the same reports on every run, although a
+report only changes when its source republishes it. SnapshotStore keeps the latest known
+version of every (region, report type) in memory, persisted in SQLite, so a run writes only
+the reports that changed since the last one.
+
+A report is unchanged when its last_update is the one of the latest snapshot. Otherwise its
+fields are hashed, and a report republished with the same values is unchanged as well. A
+changed report gets the next version number of its region and report type.
+"""
+
+import json
+import sqlite3
+from datetime import datetime
+from hashlib import blake2b
+from typing import Any, Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+
+def _plain(value: Any) -> Any:
+    if hasattr(value, 'to_model'):
+        value = value.to_model()
+    if hasattr(value, 'dict'):
+        return value.dict()
+    return str(value)
+
+
+def fields_hash(fields: Dict[str, Any], ignore_fields: Sequence[str] = ()) -> str:
+    """ Hash of report fields, independent of their order """
+    values = {name: value for name, value in fields.items() if name not in ignore_fields}
+    serialized = json.dumps(values, sort_keys=True, ensure_ascii=False, default=_plain)
+    return blake2b(serialized.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class Snapshot(object):
+    """ The latest known version of a report
+
+    Fields:
+        region: str
+        report_type: str
+        last_update: str, last update time given by the report
+        fields_hash: str, hash of the report fields other than last_update
+        version: int, starts at 1 and grows with every change
+        updated_at: datetime, time the version was seen first
+    """
+    __slots__ = ["region", "report_type", "last_update", "fields_hash", "version", "updated_at"]
+
+    def __init__(self, region: str, report_type: str, last_update: str,
+                 fields_hash: str, version: int, updated_at: datetime):
+        self.region = region
+        self.report_type = report_type
+        self.last_update = last_update
+        self.fields_hash = fields_hash
+        self.version = version
+        self.updated_at = updated_at
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return self.region, self.report_type
+
+    def __repr__(self):
+        return (f"Snapshot(region={self.region!r}, report_type={self.report_type!r}, "
+                f"last_update={self.last_update!r}, version={self.version})")
+
+
+class SnapshotStore(object):
+    """ Latest report versions by region and report type, persisted in SQLite
+
+    diff compares a new parse with the latest snapshot and returns the snapshot of its next
+    version, or None if it has not changed. Nothing is stored until commit, so a caller can
+    write the changed reports first and commit their snapshots only when the write succeeds.
+
+    Args:
+        path: SQLite database file, ":memory:" keeps the snapshots for the process only
+        ignore_fields: fields left out of the hash, e.g. the update time itself
+    """
+
+    def __init__(self, path: str = ":memory:",
+                 ignore_fields: Sequence[str] = ('last_update',),
+                 connect: Callable = sqlite3.connect,
+                 hasher: Callable = fields_hash,
+                 clock: Callable = datetime.now):
+        self._ignore_fields = tuple(ignore_fields)
+        self._hasher = hasher
+        self._clock = clock
+        self._connection = connect(path)
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS snapshot (
+                region TEXT, report_type TEXT, last_update TEXT, fields_hash TEXT,
+                version INTEGER, updated_at TEXT, PRIMARY KEY (region, report_type))
+        """)
+        self._snapshots: Dict[Tuple[str, str], Snapshot] = {}
+        rows = self._connection.execute(
+            "SELECT region, report_type, last_update, fields_hash, version, updated_at "
+            "FROM snapshot").fetchall()
+        for region, report_type, last_update, hashed, version, updated_at in rows:
+            snapshot = Snapshot(region, report_type, last_update, hashed, version,
+                                datetime.fromisoformat(updated_at))
+            self._snapshots[snapshot.key] = snapshot
+
+    def __len__(self) -> int:
+        return len(self._snapshots)
+
+    def get(self, region: str, report_type: str) -> Optional[Snapshot]:
+        return self._snapshots.get((region, report_type))
+
+    def diff(self, region: str, report_type: str, last_update: str,
+             fields: Dict[str, Any]) -> Optional[Snapshot]:
+        """ The snapshot of the next version of a report, None if it has not changed """
+        last_update = str(last_update)
+        latest = self._snapshots.get((region, report_type))
+        if latest is not None and latest.last_update == last_update:
+            return None
+        hashed = self._hasher(fields, self._ignore_fields)
+        if latest is not None and latest.fields_hash == hashed:
+            return None
+        return Snapshot(region, report_type, last_update, hashed,
+                        version=latest.version + 1 if latest is not None else 1,
+                        updated_at=self._clock())
+
+    def commit(self, snapshots: Iterable[Snapshot]) -> None:
+        """ Makes snapshots the latest versions and persists them """
+        snapshots = list(snapshots)
+        for snapshot in snapshots:
+            self._snapshots[snapshot.key] = snapshot
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO snapshot "
+            "(region, report_type, last_update, fields_hash, version, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(snapshot.region, snapshot.report_type, snapshot.last_update,
+              snapshot.fields_hash, snapshot.version, snapshot.updated_at.isoformat())
+             for snapshot in snapshots])
+        self._connection.commit()
+
+    def close(self) -> None:
+        self._connection.close()
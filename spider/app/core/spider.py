@@ -7,7 +7,7 @@ from ..enums import RequestStatus
 from asyncio import TimeoutError
 from .parser import ParserContext
 from ..models.data_models import (
-    ParseRule, ParseResult
+    ParseRule, ParseRecord
 )
 from concurrent.futures import ProcessPoolExecutor
 
@@ -16,7 +16,7 @@ class BaseSpider(ABC):
     def fetch(self, url: str, params: dict = {}):
         return NotImplemented
 
-    def parse(self, text: str, rules: List[ParseRule]) -> List[ParseResult]:
+    def parse(self, text: str, rules: List[ParseRule]) -> List[ParseRecord]:
         return NotImplemented
 
 SpiderInstance = TypeVar("SpiderInstance")
@@ -180,7 +180,7 @@ class WebSpider(BaseSpider):
 
         return url, self._result
 
-    async def parse(self, text: str, rules: List[ParseRule]) -> List[ParseResult]:
+    async def parse(self, text: str, rules: List[ParseRule]) -> List[ParseRecord]:
         return self._parser.parse(text, rules)
     
 
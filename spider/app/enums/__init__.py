@@ -4,5 +4,11 @@ from .enum_classes import (
     JobType,
     RequestStatus,
     ParseRuleType,
+    AttributeProjection,
+    MatchMode,
+    DuplicateAction,
+    BudgetLimit,
+    StageKind,
+    ResultFormat,
     Parser
 )
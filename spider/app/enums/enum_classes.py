@@ -70,6 +70,87 @@ class ParseRuleType(str, Enum):
     TEXT_CONTENT: str = 'text_content'
 
 
+class MatchMode(str, Enum):
+    """ How many matches a regex parse rule keeps
+
+    One of:
+        FIRST,
+        ALL
+    """
+    FIRST: str = 'first'
+    ALL: str = 'all'
+
+
+class AttributeProjection(str, Enum):
+    """ Values a parse rule can extract from a selected element
+
+    Besides these, a rule can project any html attribute with the "@name" form, e.g. "@title".
+
+    One of:
+        TEXT,
+        NORMALIZED_TEXT,
+        HREF,
+        INNER_HTML,
+        OUTER_HTML
+    """
+    TEXT: str = 'text'
+    NORMALIZED_TEXT: str = 'normalized_text'
+    HREF: str = 'href'
+    INNER_HTML: str = 'inner_html'
+    OUTER_HTML: str = 'outer_html'
+
+
+class DuplicateAction(str, Enum):
+    """ What a crawler skips for a page that nearly duplicates a page it has seen
+
+    One of:
+        KEEP,
+        SKIP_LINKS,
+        SKIP_RESULT,
+        SKIP_ALL
+    """
+    KEEP: str = 'keep'
+    SKIP_LINKS: str = 'skip_links'
+    SKIP_RESULT: str = 'skip_result'
+    SKIP_ALL: str = 'skip_all'
+
+
+class BudgetLimit(str, Enum):
+    """ The limit of a crawl budget that ran out
+
+    One of:
+        PAGES,
+        BYTES,
+        DEADLINE
+    """
+    PAGES: str = 'pages'
+    BYTES: str = 'bytes'
+    DEADLINE: str = 'deadline'
+
+
+class StageKind(str, Enum):
+    """ What a pipeline stage does
+
+    One of:
+        FETCH,
+        RENDER,
+        PARSE,
+        FILTER,
+        NORMALIZE,
+        DEDUPE,
+        ENUMERATE,
+        STORE
+    """
+    FETCH: str = 'fetch'
+    RENDER: str = 'render'
+    PARSE: str = 'parse'
+    FILTER: str = 'filter'
+    NORMALIZE: str = 'normalize'
+    DEDUPE: str = 'dedupe'
+    ENUMERATE: str = 'enumerate'
+    STORE: str = 'store'
+
+
 class Parser(str, Enum):
     """ supported parser types
 
@@ -102,3 +183,16 @@ class JobType(str, Enum):
     SEARCH_RESULT_AGGREGATION: str = 'search_result_aggregation'
     WEB_CRAWLING: str = 'web_crawling'
     BAIDU_NEWS_SCRAPING: str = 'baidu_news_scraping'
+
+
+class ResultFormat(str, Enum):
+    """ How tabular results are stored
+
+    One of:
+        ROWS: a Result document for every table row
+        CITY_MONTH: a Result document of typed columns for every city and month
+        PARQUET: one Parquet file of typed columns for the job
+    """
+    ROWS: str = 'rows'
+    CITY_MONTH: str = 'city_month'
+    PARQUET: str = 'parquet'
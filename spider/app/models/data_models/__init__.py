@@ -9,3 +9,9 @@ from .data_models import (
     ParseResult,
     CrawlResult
 )
+from .records import (
+    ParseRecord,
+    CrawlRecord,
+    to_model,
+    to_models
+)
@@ -0,0 +1,122 @@
+""" Lightweight records for the crawling and parsing hot path
+
+Parsers and crawlers produce one object per extracted value and per visited page.
+Building pydantic models for each of them means running validation millions of times
+for values that never leave the process, so the core uses these `__slots__` records
+internally and converts them to pydantic models only at API and DB boundaries.
+
+Records expose the same attributes as their pydantic counterparts, so code that reads
+or updates `.name`, `.value`, `.url` or `.page_src` works with both.
+"""
+
+from typing import Any, Iterable, List, Optional
+from .data_models import ParseResult, CrawlResult
+
+
+class ParseRecord(object):
+    """ Internal counterpart of ParseResult
+
+    Fields:
+        name: str,
+        value: Any
+    """
+    __slots__ = ('name', 'value')
+
+    def __init__(self, name: str, value: Any):
+        self.name = name
+        self.value = value
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, (ParseRecord, ParseResult)):
+            return NotImplemented
+        return self.name == other.name and self.value == other.value
+
+    def __hash__(self):
+        value = self.value
+        if isinstance(value, dict):
+            value = tuple(value.items())
+        elif isinstance(value, list):
+            value = tuple(value)
+        return hash((self.name, value))
+
+    def __repr__(self):
+        return f"ParseRecord(name={self.name!r}, value={self.value!r})"
+
+    def to_model(self) -> ParseResult:
+        """ Builds a ParseResult, converting nested records of list items as well.
+
+        Values were already validated when they were extracted, so the model is
+        constructed without running pydantic validation again.
+        """
+        value = self.value
+        if isinstance(value, dict):
+            value = {key: to_model(item) for key, item in value.items()}
+        return ParseResult.construct(name=self.name, value=value)
+
+    @classmethod
+    def from_model(cls, model: ParseResult) -> "ParseRecord":
+        value = model.value
+        if isinstance(value, dict):
+            value = {key: (cls.from_model(item) if isinstance(item, ParseResult) else item)
+                     for key, item in value.items()}
+        return cls(model.name, value)
+
+
+class CrawlRecord(object):
+    """ Internal counterpart of CrawlResult
+
+    Fields:
+        id: int,
+        name: Optional[str],
+        url: str,
+        page_src: str,
+        relative_depth: int,
+        neighbors: List[int]
+    """
+    __slots__ = ('id', 'name', 'url', 'page_src', 'relative_depth', 'neighbors')
+
+    def __init__(self, id: int, url: str, page_src: str,
+                 relative_depth: int, name: Optional[str] = None,
+                 neighbors: Optional[List[int]] = None):
+        self.id = id
+        self.name = name
+        self.url = url
+        self.page_src = page_src
+        self.relative_depth = relative_depth
+        self.neighbors = neighbors if neighbors is not None else []
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, (CrawlRecord, CrawlResult)):
+            return NotImplemented
+        return self.id == other.id and self.url == other.url
+
+    def __hash__(self):
+        return hash((self.id, self.url))
+
+    def __repr__(self):
+        page_src = self.page_src[:30] if self.page_src else self.page_src
+        return (f"CrawlRecord(id={self.id}, url={self.url!r}, "
+                f"relative_depth={self.relative_depth}, page_src={page_src!r})")
+
+    def to_model(self) -> CrawlResult:
+        return CrawlResult.construct(
+            id=self.id, name=self.name, url=self.url, page_src=self.page_src,
+            relative_depth=self.relative_depth, neighbors=list(self.neighbors))
+
+    @classmethod
+    def from_model(cls, model: CrawlResult) -> "CrawlRecord":
+        return cls(id=model.id, name=model.name, url=model.url,
+                   page_src=model.page_src, relative_depth=model.relative_depth,
+                   neighbors=list(model.neighbors))
+
+
+def to_model(record: Any) -> Any:
+    """ Converts a record to its pydantic model, leaving other values untouched """
+    if isinstance(record, (ParseRecord, CrawlRecord)):
+        return record.to_model()
+    return record
+
+
+def to_models(records: Iterable[Any]) -> List[Any]:
+    """ Converts records to pydantic models at API and DB boundaries """
+    return [to_model(record) for record in records]
@@ -16,6 +16,7 @@ class Result(MongoModel):
         description: str = "",
         data: object,
         create_dt: datetime,
+        version: Optional[int], version of a periodic report
         job_id: Optional[UUID],
         user_id: Optional[UUID],
         project_id: Optional[UUID],
@@ -30,6 +31,7 @@ class Result(MongoModel):
     create_dt: datetime
 
     result_id: Optional[UUID]
+    version: Optional[int]
     job_id: Optional[UUID]
     user_id: Optional[UUID]
     project_id: Optional[UUID]
@@ -1,4 +1,4 @@
 from .request_models import (
     JobSpecification, ResultQuery, ScrapeRules, ParsingPipeline,
-    ParseRule, KeywordRules, TimeRange
+    ParseRule, KeywordRules, TimeRange, StageOptions
 )
@@ -1,7 +1,7 @@
-from typing import Optional, List, Tuple
+from typing import Optional, List, Tuple, Union
 from pydantic import BaseModel
 from datetime import date, datetime
-from ...enums import ContentType, JobType, Parser, ParseRuleType
+from ...enums import ContentType, JobType, Parser, ParseRuleType, MatchMode
 
 
 class KeywordRules(BaseModel):
@@ -33,12 +33,32 @@ class ParseRule(BaseModel):
         rule: str,
         rule_type: ParseRuleType   
         slice_str: Optional[Tuple[int, int]]
+        is_container: bool = False
+        projection: Optional[str]
+        capture_group: Union[int, str] = 0
+        match_mode: MatchMode = MatchMode.ALL
+
+    A container rule selects the rows of a list page. When a list item parser
+    receives one, the other rules are evaluated relative to each row instead of
+    against the whole document.
+
+    projection chooses what to extract from each selected element: one of the
+    AttributeProjection values or "@name" for an arbitrary attribute. If it is not
+    provided, links extract href and other rules extract text.
+
+    Regex rules match page text instead of elements. They scan the visible text of
+    the page, or the raw html if projection is inner_html or outer_html, and extract
+    capture_group of each match, keeping the first or all matches as match_mode says.
     """
     field_name: Optional[str]
     rule: str
     rule_type: ParseRuleType
     is_link: bool = False
     slice_str: Optional[List[int]]
+    is_container: bool = False
+    projection: Optional[str]
+    capture_group: Union[int, str] = 0
+    match_mode: MatchMode = MatchMode.ALL
 
 class ParsingPipeline(BaseModel):
     """ Describes how the parser should parse the webpage
@@ -53,6 +73,19 @@ class ParsingPipeline(BaseModel):
     parse_rules: List[ParseRule]
 
 
+class StageOptions(BaseModel):
+    """ Tunes a stage of the pipeline a service runs
+
+    Fields:
+        name: str
+        concurrency: Optional[int]
+        queue_size: Optional[int]
+    """
+    name: str
+    concurrency: Optional[int]
+    queue_size: Optional[int]
+
+
 class ScrapeRules(BaseModel):
     """ Describes rules a spider should follow
 
@@ -67,6 +100,7 @@ class ScrapeRules(BaseModel):
         max_retry: Optional[int] = 1
         max_concurrency: Optional[int] = 50
         request_params: dict = {}
+        stages: List[StageOptions] = []
     """
     keywords: Optional[KeywordRules]
     max_pages: Optional[int]
@@ -78,6 +112,7 @@ class ScrapeRules(BaseModel):
     max_retry: Optional[int] = 1
     max_concurrency: Optional[int] = 50
     request_params: dict = {}
+    stages: List[StageOptions] = []
 
 
 
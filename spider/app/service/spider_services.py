@@ -1,9 +1,11 @@
 import re
+import json
 import asyncio
+from hashlib import blake2b
 from uuid import uuid5, NAMESPACE_OID
 from functools import partial
 from datetime import datetime, timedelta
-from typing import List, Any, Tuple, Callable, TypeVar
+from typing import List, Any, AsyncIterator, Set, Tuple, Callable, TypeVar, Optional
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from concurrent.futures import ProcessPoolExecutor
 from .base_services import BaseSpiderService, BaseServiceFactory
@@ -11,17 +13,23 @@ from ..models.data_models import (
     RequestHeader,
     URL,
     HTMLData,
-    CrawlResult
+    CrawlRecord,
+    ParseRecord,
+    to_models
 )
 from ..models.request_models import ScrapeRules, ParseRule
 from ..models.db_models import Result
-from ..enums import JobType
+from ..enums import JobType, ResultFormat, StageKind
 from ..core import (
     BaseSpider, CrawlerContext, ParserContextFactory,
     BaseRequestClient, AsyncBrowserRequestClient, RequestClient,
-    CrawlerContextFactory
+    CrawlerContextFactory, ParsePlanCompiler, parse_plan_compiler, create_url_scorer,
+    RecrawlScheduler, HistoryStore, CrawlBudget, StagePipeline, ParsePlan, SnapshotStore, Snapshot
+)
+from ..utils import (
+    throttled, DatetimeNormalizer, datetime_normalizer, to_datetimes, KeywordMatcher,
+    UrlTemplate, ColumnarBuffer, ParquetSink, to_document_values
 )
-from ..utils import throttled
 from itertools import chain
 
 """ Defines all spider services
@@ -47,6 +55,7 @@ class HTMLSpiderService(BaseSpiderService):
                  table_id_generator: Callable = partial(uuid5, NAMESPACE_OID),
                  coroutine_runner: Callable = asyncio.gather,
                  throttled_fetch: Callable = throttled,
+                 pipeline_class: Callable = StagePipeline,
                  **kwargs) -> None:
         self._request_client = request_client
         self._spider_class = spider_class
@@ -56,25 +65,41 @@ class HTMLSpiderService(BaseSpiderService):
         self._table_id_generator = table_id_generator
         self._coroutine_runner = coroutine_runner
         self._throttled_fetch = throttled_fetch
+        self._pipeline_class = pipeline_class
 
     async def crawl(self, urls: List[str], rules: ScrapeRules) -> None:
         """ Get html data given the data source
 
+        The crawl is a pipeline of a page_fetch and a page_store stage, tuned by the stages
+        of the rules.
+
         Args: 
             data_src: List[str]
             rules: ScrapeRules
         """
-        # try create many spiders
-        spiders = self._spider_class.create_from_urls(urls, self._request_client)
+        html_pages = []
+
+        async def fetch_page(indexed_url: Tuple[int, str]):
+            index, url = indexed_url
+            spider = self._spider_class(request_client=self._request_client, url_to_request=url)
+            return [(index, await spider.fetch())]
 
-        html_pages = await self._throttled_fetch(
-            rules.max_concurrency, *[spider.fetch() for spider in spiders])
+        def store_page(indexed_page: Tuple[int, Tuple[str, str]]):
+            html_pages.append(indexed_page)
 
+        pipeline = self._pipeline_class()
+        pipeline.add_stage("page_fetch", fetch_page, concurrency=rules.max_concurrency,
+                           kind=StageKind.FETCH)
+        pipeline.add_stage("page_store", store_page, kind=StageKind.STORE)
+        await pipeline.configure(rules.stages).run(enumerate(urls))
+
+        # pages are fetched concurrently, but stored in the order of their urls
+        html_pages.sort(key=lambda indexed_page: indexed_page[0])
         result_dt = datetime.now()
         html_data = [
             self._html_data_model(
                 url=page[0], html=page[1], create_dt=result_dt)
-            for page in html_pages
+            for _, page in html_pages
         ]
         result_name = f"result_{result_dt}"
         crawl_result = self._result_db_model(
@@ -94,7 +119,9 @@ class BaiduNewsSpider(BaseSpiderService):
     You can crawl search engine pages with this service if the result page has a paging parameter.
     Provide the paging parameter and the link result url pattern to crawl raw results.
     If extraction rules are provided, this service will try to extract information from raw results.
-    
+
+    Near duplicate articles, e.g. syndicated copies, are only dropped when a
+    duplicate_detector_factory such as NearDuplicateDetector is given.
     """
 
     def __init__(self,
@@ -107,6 +134,11 @@ class BaiduNewsSpider(BaseSpiderService):
                  event_loop_getter: Callable = asyncio.get_event_loop,
                  process_pool_executor: ProcessPoolExecutorClass = ProcessPoolExecutor,
                  throttled_fetch: Callable = throttled,
+                 datetime_normalizer: DatetimeNormalizer = datetime_normalizer,
+                 keyword_matcher_factory: Callable = KeywordMatcher.exclude_only,
+                 parse_plan_compiler: ParsePlanCompiler = parse_plan_compiler,
+                 duplicate_detector_factory: Optional[Callable] = None,
+                 pipeline_class: Callable = StagePipeline,
                  **kwargs) -> None:
         self._request_client = request_client
         self._spider_class = spider_class
@@ -117,39 +149,11 @@ class BaiduNewsSpider(BaseSpiderService):
         self._event_loop_getter = event_loop_getter
         self._process_pool_executor = process_pool_executor
         self._throttled_fetch = throttled_fetch
-        self._create_time_string_extractors()
-
-    def _create_time_string_extractors(self):
-        self._cn_time_string_extractors = {
-            re.compile('\d{1,2}秒前'):
-                lambda now, time_str: now -
-                timedelta(seconds=int(re.search('\d+', time_str).group(0))),
-            re.compile('\d{1,2}分钟前'):
-                lambda now, time_str: now -
-                timedelta(minutes=int(re.search('\d+', time_str).group(0))),
-            re.compile('\d{1,2}小时前'):
-                lambda now, time_str: now -
-                timedelta(hours=int(re.search('\d+', time_str).group(0))),
-            re.compile('\d{1,2}天前'):
-                lambda now, time_str: now -
-                timedelta(days=int(re.search('\d+', time_str).group(0))),
-            re.compile('昨天\d{1,2}:\d{1,2}'):
-                lambda now, time_str: datetime(
-                    now.year, now.month, now.day-1,
-                    int(re.findall('\d+', time_str)[0]),
-                    int(re.findall('\d+', time_str)[1])
-            ),
-            re.compile('\d{1,2}月\d{1,2}日'):
-                lambda now, time_str: datetime(
-                    now.year,
-                    int(re.findall('\d+', time_str)[0]),
-                int(re.findall('\d+', time_str)[1])),
-
-            re.compile('\d{1,2}年\d{1,2}月\d{1,2}日'):
-                lambda now, time_str: datetime(
-                    *(re.findall('\d+', time_str))
-            )
-        }
+        self._datetime_normalizer = datetime_normalizer
+        self._keyword_matcher_factory = keyword_matcher_factory
+        self._duplicate_detector_factory = duplicate_detector_factory
+        self._pipeline_class = pipeline_class
+        self._parse_plan_compiler = parse_plan_compiler
 
     def _standardize_datetime(self, time_str):
         """ Convert non standard format time string to standard datetime format
@@ -162,147 +166,254 @@ class BaiduNewsSpider(BaseSpiderService):
         5. 5天前
         
         """
-        today = datetime.now()
-        converted = datetime(today.year, today.month, today.day)
-
-        if len(time_str) == 0:
-            return converted
-
-        for pattern in self._cn_time_string_extractors:
-            if pattern.match(time_str):
-                converted = self._cn_time_string_extractors[pattern](
-                    today, time_str)
-                return converted
-
-        return converted
+        return self._standardize_datetimes([time_str])[0]
+
+    def _standardize_datetimes(self, time_strs: List[str]) -> List[datetime]:
+        """ Convert a batch of time strings, falling back to today for unrecognized strings """
+        now = datetime.now()
+        today = datetime(now.year, now.month, now.day)
+        converted = to_datetimes(self._datetime_normalizer.normalize_many(time_strs, now=now))
+        return [dt if dt is not None else today for dt in converted]
     
+    def _field_text(self, result: ParseRecord, field_name: str) -> str:
+        """ Text of a field in a list item, empty if the field was not extracted """
+        field = result.value.get(field_name)
+        return field.value if field is not None else ""
+
     def _group_fields_by(self, columns: List[str]):
         pass
 
+    def _in_time_range(self, result: ParseRecord, time_range: Any, now: datetime) -> bool:
+        """ Whether the date of a search result is within the time range of the rules """
+        if not time_range:
+            return True
+        if not (time_range.past_days or time_range.start_date or time_range.end_date):
+            return True
+        if 'date' not in result.value:
+            return False
+        date = result.value['date'].value
+        if time_range.past_days:
+            return date >= now - timedelta(days=time_range.past_days)
+        if time_range.start_date and date < time_range.start_date:
+            return False
+        # the end date is inclusive, results published later that day are still in range
+        if time_range.end_date and date.date() > time_range.end_date.date():
+            return False
+        return True
+
+    def _earliest_date(self, time_range: Any, now: datetime) -> Optional[datetime]:
+        """ Lower bound of the time range of the rules, None if it has none """
+        if not time_range:
+            return None
+        if time_range.past_days:
+            return now - timedelta(days=time_range.past_days)
+        return time_range.start_date
+
+    def _parse_search_page(self, search_page_plan: ParsePlan, raw_page: str) -> List[ParseRecord]:
+        # produces ParseRecord(name=item, value={'attribute': ParseRecord(...)})
+        search_results = search_page_plan.parse(raw_page)
+
+        # standardize datetime of the whole page in one batch
+        dated_results = [result.value['date'] for result in search_results
+                         if 'date' in result.value]
+        for date_result, standardized in zip(
+                dated_results,
+                self._standardize_datetimes([result.value for result in dated_results])):
+            date_result.value = standardized
+        return search_results
+
+    def _is_last_search_page(self, search_results: List[ParseRecord],
+                             previous_links: Set[str],
+                             earliest_date: Optional[datetime]) -> bool:
+        """ Whether a search result page ends its keyword's pagination
+
+        Results are sorted newest first, so the pages after a page that is empty, repeats
+        the previous page, or only has results older than the time range are not needed.
+        """
+        if len(search_results) == 0:
+            return True
+        links = set(self._field_text(result, 'href') for result in search_results)
+        if links == previous_links:
+            return True
+        dates = [result.value['date'].value for result in search_results
+                 if 'date' in result.value]
+        return (earliest_date is not None and len(dates) > 0 and
+                all(date < earliest_date for date in dates))
+
+    async def _paginate(self, search_url: str,
+                        max_pages: int,
+                        paging_param: str,
+                        search_page_plan: ParsePlan,
+                        earliest_date: Optional[datetime]) -> AsyncIterator[ParseRecord]:
+        """ Walks the search result pages of one keyword in order, yielding their results """
+        previous_links: Set[str] = set()
+        for page_number in range(max_pages):
+            spider = self._spider_class(
+                request_client=self._request_client,
+                url_to_request=f"{search_url}&{paging_param}={page_number}")
+            _, raw_page = await spider.fetch()
+            search_results = self._parse_search_page(search_page_plan, raw_page)
+            last_page = self._is_last_search_page(search_results, previous_links, earliest_date)
+            for result in search_results:
+                yield result
+            if last_page:
+                return
+            previous_links = set(self._field_text(result, 'href') for result in search_results)
+
     async def crawl(self, urls: List[str], 
                     rules: ScrapeRules,
-                    paging_param: str = "pn") -> None:
+                    paging_param: str = "pn",
+                    batch_size: int = 100,
+                    queue_size: int = 100,
+                    parse_workers: int = 1) -> None:
         """ Crawl search results within given rules like time range, keywords, and etc.
         
         User will provide the search page url of Baidu News (https://www.baidu.com/s?tn=news&ie=utf-8).
         This spider will automatically generate the actual search urls.
 
+        The crawl is a pipeline of stages joined by bounded queues:
+            search page fetch and parse -> date and keyword filter
+            -> article fetch -> article parse -> near duplicate filter -> batched store
+        Articles are fetched as soon as the first search page is parsed, while the other
+        search pages are still being fetched.
+
+        The stages are search_pages, search_result_filter, article_fetch, article_parse,
+        article_dedupe and result_store. Their workers and queue sizes can be tuned with the
+        stages of the rules.
+
+        Keywords are searched in parallel, but each keyword walks its result pages in order
+        and stops at the first page that is empty, repeats the previous page or only has
+        results older than the time range, instead of always fetching max_pages pages.
+
         Args:
             urls: baidu news url
             rules: rules the spider should follow. This mode expects keywords and size from users.
+            batch_size: number of results stored with one insert_many
+            queue_size: size of the queues between stages
+            parse_workers: number of workers of the article parse stage
         """
-        # if user provides no url, use default url
-        spiders = []
-
         # require the user to provide url, max_pages and keywords
         assert (len(urls) > 0 and 
                 type(rules.max_pages) is int and 
                 len(rules.keywords.include) > 0)
 
-        # generate search page urls given keywords and page limit
-        for search_base_url in urls:
-            search_urls = [f"{search_base_url}&word={kw}&{paging_param}={page_number}"
-                           for page_number in range(rules.max_pages)
-                           for kw in rules.keywords.include]
-            spiders.extend(self._spider_class.create_from_urls(search_urls, self._request_client))
-
-        # concurrently fetch search results with a concurrency limit
-        # TODO: could boost parallelism by running parsers at the same time
-        search_result_pages = await self._throttled_fetch(
-            rules.max_concurrency, *[spider.fetch() for spider in spiders])
-
-        # for now, the pipeline is fixed to the following
-        # 1. extract all search result blocks from search result pages (title, href, abstract, date)
-        # step 1 will produce a list of List[ParseResult], and have to assume the order to work correctly
-        # collect search results from parser, which has the form ParseResult(name=item, value={'attribute': ParseResult(name='attribute', value='...')})
-        parsed_search_result = []
-        search_page_parser = self._parse_strategy_factory.create(
-            rules.parsing_pipeline[0].parser)
-        for _, raw_page in search_result_pages:
-            search_results = search_page_parser.parse(
-                raw_page, rules.parsing_pipeline[0].parse_rules)
-
-            # standardize datetime
-            for result in search_results:
-                result_attributes = result.value
-                if 'date' in result_attributes:
-                    result_attributes['date'].value = self._standardize_datetime(
-                        result_attributes['date'].value)
-
-            parsed_search_result.extend(search_results)
-        
-        # 2. if date is provided, parse date strings and include those pages within date range
-        if (len(parsed_search_result) > 0 and rules.time_range):
-            if rules.time_range.past_days:
-                last_date = datetime.now() - timedelta(days=rules.time_range.past_days)
-                parsed_search_result = [result for result in parsed_search_result
-                                        if 'date' in result.value and result.value['date'].value >= last_date]
-            elif rules.time_range.date_before and rules.time_range.date_after:
-                parsed_search_result = [result for result in parsed_search_result
-                                        if ('date' in result.value and 
-                                            rules.time_range.date_after <= result.value['date'].value < rules.time_range.date_before)]
-            elif rules.time_range.date_before:
-                parsed_search_result = [result for result in parsed_search_result
-                                        if ('date' in result.value and
-                                            rules.time_range.date_after <= result.value['date'].value)]
-            elif rules.time_range.date_before and rules.time_range.date_after:
-                parsed_search_result = [result for result in parsed_search_result
-                                        if ('date' in result.value and
-                                            result.value['date'].value < rules.time_range.date_before)]
-                            
-        # 3. if keyword exclude is provided, exclude all pages having those keywords
-        if (len(parsed_search_result) > 0 and rules.keywords and rules.keywords.exclude):
-            exclude_kws = "|".join(rules.keywords.exclude)
-            exclude_patterns = re.compile(f'^((?!{exclude_kws}).)*$')
-            parsed_search_result = [result for result in parsed_search_result
-                                    if ('abstract' in result.value and 
-                                        'title' in result.value and 
-                                        re.finditer(exclude_patterns, result.value['abstract']) and
-                                        re.finditer(exclude_patterns, result.value['title']))]
-        
-        # 4. fetch remaining pages
-        if (len(parsed_search_result) > 0):
-            content_urls = [result.value['href'].value for result in parsed_search_result]
-            content_spiders = self._spider_class.create_from_urls(content_urls, self._request_client)
-            content_pages = await self._throttled_fetch(
-                rules.max_concurrency, *[spider.fetch() for spider in content_spiders])
-        
-        # 5. use the last pipeline and extract contents. (title, content, url)
-        content_parser = self._parse_strategy_factory.create(
-            rules.parsing_pipeline[1].parser)
-        parsed_content_results = []
-        for content_url, content_page in content_pages:
+        # compile both pipelines up front so invalid rules fail before fetching
+        search_page_plan, content_plan = self._parse_plan_compiler.compile_many(
+            rules.parsing_pipeline[:2])
+
+        # one stream of search result pages for each keyword
+        search_urls = [f"{search_base_url}&word={kw}"
+                       for search_base_url in urls
+                       for kw in rules.keywords.include]
+
+        # included keywords are the search terms, so only exclusion applies here
+        keyword_matcher = (self._keyword_matcher_factory(rules.keywords)
+                           if rules.keywords and rules.keywords.exclude else None)
+        # syndicated copies of an article are not stored again, if a detector is given
+        duplicate_detector = (self._duplicate_detector_factory()
+                              if self._duplicate_detector_factory is not None else None)
+        queued_articles = set()
+        stored_results = []
+        now = datetime.now()
+        earliest_date = self._earliest_date(rules.time_range, now)
+
+        def paginate(search_url: str):
+            # 1. fetch and parse the search result pages of a keyword
+            return self._paginate(search_url, rules.max_pages, paging_param,
+                                  search_page_plan, earliest_date)
+
+        async def fetch_page(url: str):
+            spider = self._spider_class(request_client=self._request_client, url_to_request=url)
+            return [await spider.fetch()]
+
+        def filter_search_result(result: ParseRecord):
+            # 2. include results within the date range
+            # 3. exclude results having excluded keywords
+            href = self._field_text(result, 'href')
+            if (len(href) == 0 or href in queued_articles or
+                    not self._in_time_range(result, rules.time_range, now)):
+                return None
+            if keyword_matcher is not None and not keyword_matcher.accepts(
+                    self._field_text(result, 'title'), self._field_text(result, 'abstract')):
+                return None
+            # the same article is often found with several keywords
+            queued_articles.add(href)
+            return [href]
+
+        def parse_article(article: Tuple[str, str]):
+            # 5. use the last pipeline and extract contents. (title, content, url)
+            content_url, content_page = article
             if len(content_page) == 0:
                 print(f"failed to fetch url: {content_url}")
-            else:
-                parsed_contents = {content.name: content
-                                for content in content_parser.parse(
-                                content_page, rules.parsing_pipeline[1].parse_rules)}
-                
-                if any((len(parse_result.value) > 0
-                      for parse_result in parsed_contents.values())):
-                    parsed_contents['url'] = content_url
-                    parsed_content_results.append(parsed_contents)
-            
-        # 6. finally save results to db
-        result_dt = datetime.now()
-        results = [
-            self._result_db_model(
-                result_id=self._table_id_generator(result['title'].name),
-                name=result['title'].value,
-                description="",
-                data=result.values(),
-                create_dt=result_dt
-            )
-            for result in parsed_content_results
-        ]
-        await self._result_db_model.insert_many(results)
+                return None
+            parsed_contents = {content.name: content
+                               for content in content_plan.parse(content_page)}
+            if not any((len(parse_result.value) > 0
+                        for parse_result in parsed_contents.values())):
+                return None
+            parsed_contents['url'] = content_url
+            return [parsed_contents]
+
+        def dedupe_article(parsed_contents: dict):
+            # articles are compared by their extracted content, not by the whole page
+            content = parsed_contents.get('content')
+            if (duplicate_detector is not None and content is not None and
+                    duplicate_detector.check_text(parsed_contents['url'],
+                                                  str(content.value)) is not None):
+                return None
+            return [parsed_contents]
+
+        async def store_results():
+            # 6. save results to db in batches
+            if len(stored_results) == 0:
+                return
+            result_dt = datetime.now()
+            results = [
+                self._result_db_model(
+                    result_id=self._table_id_generator(result['title'].name),
+                    name=result['title'].value,
+                    description="",
+                    data=to_models(result.values()),
+                    create_dt=result_dt
+                )
+                for result in stored_results
+            ]
+            stored_results.clear()
+            await self._result_db_model.insert_many(results)
+
+        async def store_result(parsed_contents: dict):
+            stored_results.append(parsed_contents)
+            if len(stored_results) >= batch_size:
+                await store_results()
+
+        pipeline = self._pipeline_class(queue_size=queue_size)
+        # without a max_concurrency the stages run the default concurrency of the pipeline
+        pipeline.add_stage("search_pages", paginate,
+                           concurrency=(min(rules.max_concurrency, len(search_urls))
+                                        if rules.max_concurrency else None),
+                           kind=StageKind.ENUMERATE)
+        pipeline.add_stage("search_result_filter", filter_search_result, kind=StageKind.FILTER)
+        # 4. fetch the remaining articles
+        pipeline.add_stage("article_fetch", fetch_page, concurrency=rules.max_concurrency,
+                           kind=StageKind.FETCH)
+        pipeline.add_stage("article_parse", parse_article, concurrency=parse_workers,
+                           kind=StageKind.PARSE)
+        pipeline.add_stage("article_dedupe", dedupe_article, kind=StageKind.DEDUPE)
+        pipeline.add_stage("result_store", store_result, flush=store_results,
+                           kind=StageKind.STORE)
+        await pipeline.configure(rules.stages).run(search_urls)
+        print(pipeline.report())
         print("Done!")
 
 
 class BaiduCOVIDSpider(BaseSpiderService):
     """ A spider for crawling COVID-19 reports from Baidu
-    
+
+    Args:
+        snapshot_store: latest known report versions, only changed reports are stored
+        snapshot_path: SQLite database of the snapshot store created when none is given.
+                       With a path the versions outlive the process and the next run skips
+                       unchanged reports, without one they only last for the process.
     """
 
     def __init__(self,
@@ -316,17 +427,28 @@ class BaiduCOVIDSpider(BaseSpiderService):
                  event_loop_getter: Callable = asyncio.get_event_loop,
                  process_pool_executor: ProcessPoolExecutorClass = ProcessPoolExecutor,
                  throttled_fetch: Callable = throttled,
+                 parse_plan_compiler: ParsePlanCompiler = parse_plan_compiler,
+                 snapshot_store: Optional[SnapshotStore] = None,
+                 snapshot_path: Optional[str] = None,
+                 snapshot_store_class: Callable = SnapshotStore,
+                 pipeline_class: Callable = StagePipeline,
                  **kwargs) -> None:
         self._request_client = request_client
         self._spider_class = spider_class
         self._parse_strategy_factory = parse_strategy_factory
         self._result_db_model = result_db_model
         self._html_data_model = html_data_model
+        if snapshot_store is None:
+            snapshot_store = (snapshot_store_class(snapshot_path) if snapshot_path is not None
+                              else snapshot_store_class())
+        self._snapshot_store = snapshot_store
+        self._pipeline_class = pipeline_class
         self._table_id_generator = table_id_generator
         self._coroutine_runner = coroutine_runner
         self._event_loop_getter = event_loop_getter
         self._process_pool_executor = process_pool_executor
         self._throttled_fetch = throttled_fetch
+        self._parse_plan_compiler = parse_plan_compiler
         self._create_report_classifier()
 
     def _required_fields_included(self, 
@@ -339,21 +461,34 @@ class BaiduCOVIDSpider(BaseSpiderService):
         
         return True
 
-    def _create_report_classifier(self, pattern_compiler: Callable = re.compile):
-        self._classifier = {
-            pattern_compiler("#tab4"): 'world',
-            pattern_compiler("国内各地区疫情统计汇总"): 'domestic',
-            pattern_compiler("病死率"): 'foreign_country',
-            pattern_compiler("国外疫情"): 'world',
-            pattern_compiler("市|区"): 'domestic_city',
-        }
+    def _create_report_classifier(self, pattern_compiler: Callable = re.compile,
+                                  head_size: int = 65536):
+        # patterns in order of priority, joined into one alternation of numbered groups
+        report_patterns = [
+            ("#tab4", 'world'),
+            ("国内各地区疫情统计汇总", 'domestic'),
+            ("病死率", 'foreign_country'),
+            ("国外疫情", 'world'),
+            ("市|区", 'domestic_city'),
+        ]
+        self._report_types = [report_type for _, report_type in report_patterns]
+        self._classifier = pattern_compiler("|".join(
+            f"(?P<p{priority}>{pattern})" for priority, (pattern, _) in enumerate(report_patterns)))
+        self._classifier_head_size = head_size
 
     def _classify_report_type(self, url: str, page_text: str):
-        """ Guess report type for page text """
-        for report_pattern in self._classifier:
-            if report_pattern.search(url) or report_pattern.search(page_text):
-                return self._classifier[report_pattern]
-        return 'domestic'
+        """ Guess report type from the url and the head of the page text
+
+        One scan finds the matches of every pattern, the first pattern in order of priority
+        that matches anywhere wins.
+        """
+        best = len(self._report_types)
+        scanned = f"{url}\n{page_text[:self._classifier_head_size]}"
+        for matched in self._classifier.finditer(scanned):
+            best = min(best, int(matched.lastgroup[1:]))
+            if best == 0:
+                break
+        return self._report_types[best] if best < len(self._report_types) else 'domestic'
 
     async def crawl(self, 
                     urls: List[str],
@@ -381,6 +516,12 @@ class BaiduCOVIDSpider(BaseSpiderService):
         3. world report pipeline  (pipeline_name: world)
         4. foreign countries' reports pipeline (pipeline_name: foreign_country)
 
+        The crawl is a pipeline of the stages report_fetch, report_parse, report_dedupe and
+        report_store, tuned by the stages of the rules.
+
+        Only reports that changed since the last run are stored, each with the next version
+        number of its region and report type, see SnapshotStore.
+
         Args:
             urls: baidu news url
             rules: 
@@ -398,6 +539,12 @@ class BaiduCOVIDSpider(BaseSpiderService):
             list(chain(*[rule.parse_rules for rule in rules.parsing_pipeline])),
             ['domestic_city', 'last_update', 'world', 'domestic', 'foreign_country'])
         
+        # compile the report pipelines once, keyed by the report type they parse
+        report_plans = {
+            plan.rules[0].field_name: plan
+            for plan in self._parse_plan_compiler.compile_many(rules.parsing_pipeline)
+        }
+
         # use the first one as base url and ignore the rest
         base_url = urls[0]
         covid_report_urls = [base_url, f"{base_url}#tab4"]
@@ -410,46 +557,75 @@ class BaiduCOVIDSpider(BaseSpiderService):
                                   for city in cities
                                   if city_param_pattern.match(city)]
         
-        # create spiders from urls
-        report_spiders = self._spider_class.create_from_urls(covid_report_urls, self._request_client)
-        
-        # fetch report pages
-        report_pages = await self._throttled_fetch(
-            max_concurrency=rules.max_concurrency,
-            tasks=[spider.fetch() for spider in report_spiders])
-        
-        # create report parser and parse report
         parsed_reports = []
-        parsing_pipelines = {
-            pipeline.parse_rules[0].field_name: pipeline
-            for pipeline in rules.parsing_pipeline
-        }
-        # create parser by guessing its type
-        for url, raw_page in report_pages:
+        snapshots = {}
+
+        async def fetch_report(url: str):
+            spider = self._spider_class(request_client=self._request_client, url_to_request=url)
+            return [await spider.fetch()]
+
+        def parse_report(report_page: Tuple[str, str]):
+            # pick the plan by guessing the report type
+            url, raw_page = report_page
             report_type = self._classify_report_type(url, raw_page)
-            pipeline = parsing_pipelines[report_type]
-            parser = self._parse_strategy_factory.create(pipeline.parser)
-            parsed_result = parser.parse(raw_page, rules=pipeline.parse_rules)[0]
+            return [(report_type, report_plans[report_type].parse(raw_page)[0])]
+
+        def dedupe_report(parsed_report: Tuple[str, ParseRecord]):
+            # skip reports that have not changed since the last run
+            report_type, parsed_result = parsed_report
+            snapshot = self._snapshot_store.diff(
+                parsed_result.value[report_type].value, report_type,
+                parsed_result.value['last_update'].value, parsed_result.value)
+            if snapshot is None or snapshot.key in snapshots:
+                return None
+            snapshots[snapshot.key] = snapshot
+            return [(snapshot, parsed_result)]
+
+        def store_report(changed_report: Tuple[Snapshot, ParseRecord]):
+            snapshot, parsed_result = changed_report
             result_dt = datetime.now()
-            covid_report_summary = self._result_db_model(
+            parsed_reports.append(self._result_db_model(
                 result_id=self._table_id_generator(
-                    f"COVID-{parsed_result.value[report_type].value}-{parsed_result.value['last_update'].value}"),
-                name=f"{parsed_result.value[report_type].value}实时疫情报告",
+                    f"COVID-{snapshot.region}-{snapshot.last_update}-{snapshot.version}"),
+                name=f"{snapshot.region}实时疫情报告",
                 description="新型冠状病毒肺炎疫情实时大数据报告",
-                data=parsed_result.value.values(),
-                create_dt=result_dt
-            )
-            parsed_reports.append(covid_report_summary)
+                data=to_models(parsed_result.value.values()),
+                create_dt=result_dt,
+                version=snapshot.version
+            ))
 
-        # save reports to db
-        await self._result_db_model.insert_many(parsed_reports)
-        print("Done!")
+        async def store_reports():
+            # save changed reports to db, then remember their versions
+            if len(parsed_reports):
+                await self._result_db_model.insert_many(parsed_reports)
+                self._snapshot_store.commit(snapshots.values())
+
+        pipeline = self._pipeline_class()
+        pipeline.add_stage("report_fetch", fetch_report, concurrency=rules.max_concurrency,
+                           kind=StageKind.FETCH)
+        pipeline.add_stage("report_parse", parse_report, kind=StageKind.PARSE)
+        pipeline.add_stage("report_dedupe", dedupe_report, kind=StageKind.DEDUPE)
+        pipeline.add_stage("report_store", store_report, flush=store_reports,
+                           kind=StageKind.STORE)
+        await pipeline.configure(rules.stages).run(covid_report_urls)
+        print(f"Done! {len(parsed_reports)} of {len(covid_report_urls)} reports changed")
 
 
 
 class WeatherSpiderService(BaseSpiderService):
     """ A spider for crawling historical weather reports
-    
+
+    Args:
+        frontier_path: SQLite database keeping the frontier of the crawl, see DurableFrontier.
+                       An interrupted crawl then resumes without refetching the weather
+                       pages already stored. Such crawls are breadth first, whatever the
+                       crawl method.
+        frontier_job_id: id of the crawl in the frontier database, derived from the start
+                         urls, keywords and time range of each crawl by default. A finished
+                         job is not crawled again.
+        recrawl_history_path: SQLite database keeping the fetch histories of a recrawl
+                              scheduler across runs, see HistoryStore. Used when no
+                              recrawl_scheduler is given.
     """
 
     def __init__(self,
@@ -465,10 +641,37 @@ class WeatherSpiderService(BaseSpiderService):
                  event_loop_getter: Callable = asyncio.get_event_loop,
                  process_pool_executor: ProcessPoolExecutorClass = ProcessPoolExecutor,
                  throttled_fetch: Callable = throttled,
+                 parse_plan_compiler: ParsePlanCompiler = parse_plan_compiler,
+                 url_scorer_factory: Callable = create_url_scorer,
+                 recrawl_scheduler: Optional[RecrawlScheduler] = None,
+                 budget_factory: Callable = CrawlBudget.from_rules,
+                 pipeline_class: Callable = StagePipeline,
+                 url_template_class: Callable = UrlTemplate,
+                 columnar_buffer_class: Callable = ColumnarBuffer,
+                 parquet_sink_class: Callable = ParquetSink,
+                 frontier_path: Optional[str] = None,
+                 frontier_job_id: Optional[str] = None,
+                 recrawl_history_path: Optional[str] = None,
+                 history_store_class: Callable = HistoryStore,
                  **kwargs) -> None:
         self._request_client = request_client
         self._spider_class = spider_class
         self._parse_strategy_factory = parse_strategy_factory
+        self._parse_plan_compiler = parse_plan_compiler
+        self._url_scorer_factory = url_scorer_factory
+        if recrawl_scheduler is None and recrawl_history_path is not None:
+            recrawl_scheduler = RecrawlScheduler(
+                store=history_store_class(recrawl_history_path))
+        self._recrawl_scheduler = recrawl_scheduler
+        self._budget_factory = budget_factory
+        self._pipeline_class = pipeline_class
+        self._url_template_class = url_template_class
+        self._columnar_buffer_class = columnar_buffer_class
+        self._parquet_sink_class = parquet_sink_class
+        self._link_finder = link_finder
+        self._crawling_strategy_factory = crawling_strategy_factory
+        self._frontier_path = frontier_path
+        self._frontier_job_id = frontier_job_id
         self._crawler_context = crawling_strategy_factory.create(
             crawl_method, spider_class=spider_class,
             request_client=request_client,
@@ -493,24 +696,40 @@ class WeatherSpiderService(BaseSpiderService):
         
         return True
 
+    def _job_id(self, urls: List[str], rules: ScrapeRules) -> str:
+        """ Id of a crawl in the frontier database, from its urls, keywords and time range """
+        job = json.dumps({'urls': urls,
+                          'keywords': rules.keywords.dict() if rules.keywords else None,
+                          'time_range': rules.time_range.dict() if rules.time_range else None},
+                         sort_keys=True, default=str)
+        return f"weather_report-{blake2b(job.encode('utf-8'), digest_size=8).hexdigest()}"
+
+    def _create_crawler_context(self, urls: List[str], rules: ScrapeRules) -> CrawlerContext:
+        """ The crawler of a crawl, resumable from the frontier database if there is one """
+        if self._frontier_path is None:
+            return self._crawler_context
+        return self._crawling_strategy_factory.create_resumable(
+            self._frontier_job_id or self._job_id(urls, rules), self._frontier_path,
+            spider_class=self._spider_class,
+            request_client=self._request_client,
+            start_url='',
+            parser_context=self._parse_strategy_factory.create(
+                parser_name=self._link_finder, base_url=''))
+
     def _get_weather_page_classifier(
         self,
         weather_page_url_pattern: re.Pattern = re.compile("\/lishi\/(\w+)\/month\/(\w+).html"),
         partial: Callable = partial
     ) -> Callable:
-        def filter_result_by_pattern(node: CrawlResult, pattern: re.Pattern):
+        def filter_result_by_pattern(node: CrawlRecord, pattern: re.Pattern):
             return len(pattern.findall(node.url)) > 0
         return partial(filter_result_by_pattern, pattern=weather_page_url_pattern)
 
     def _get_location_filter(self, 
                              location_names: List[str],
-                             pattern_compiler: Callable = re.compile,
-                             partial: Callable = partial) -> Callable:
-        def location_filter(url: str, pattern: re.Pattern):
-            return len(pattern.findall(url)) > 0
-        
-        location_pattern = pattern_compiler("|".join(location_names))
-        return partial(location_filter, pattern=location_pattern)
+                             matcher_class: KeywordMatcher = KeywordMatcher) -> Callable:
+        location_matcher = matcher_class(include=location_names, ignore_case=False)
+        return location_matcher.accepts
 
     def _get_time_range_filter(self, start_time: datetime, end_time: datetime,
                                datetime_class: datetime = datetime,
@@ -538,11 +757,24 @@ class WeatherSpiderService(BaseSpiderService):
                        datetime_class=datetime_class,
                        datetime_pattern='\d{6,8}')
 
+    def _get_recrawl_filter(self, url_filter: Callable, target_pattern: re.Pattern) -> Callable:
+        """ Skips weather pages the recrawl scheduler does not consider due """
+        def recrawl_filter(url: str) -> bool:
+            if not url_filter(url):
+                return False
+            return (len(target_pattern.findall(url)) == 0 or
+                    self._recrawl_scheduler.is_due(url))
+        return recrawl_filter
+
     async def crawl(self,
                     urls: List[str],
                     rules: ScrapeRules,
                     compile: Callable = re.compile,
-                    chain: Callable = chain) -> None:
+                    chain: Callable = chain,
+                    batch_size: int = 1000,
+                    url_templates: Optional[List[str]] = None,
+                    result_format: ResultFormat = ResultFormat.ROWS,
+                    parquet_path: Optional[str] = None) -> None:
         """ Crawls weather report site in the given manner
         
         This spider expects users to provide city names to scrape weather
@@ -552,6 +784,20 @@ class WeatherSpiderService(BaseSpiderService):
         This spider also expects users to provide a time range. If not provided, it will
         crawl all the weather reports.
 
+        With a recrawl scheduler, weather pages fetched before are only fetched again
+        when the scheduler considers them due, e.g. reports of past months almost never.
+
+        With url templates, e.g. "http://www.tianqihoubao.com/aqi/{city}-{yyyymm}.html",
+        the weather pages are enumerated from the keywords and the time range and fetched
+        directly, without crawling the index pages. See UrlTemplate. They are fetched by a
+        pipeline of the stages weather_page_fetch and weather_page_store, tuned by the stages
+        of the rules.
+
+        result_format chooses how the rows are stored: a Result for every row, a Result of
+        typed columns for every city and month, or a Parquet file at parquet_path, which
+        requires pyarrow. Column formats convert the AQI and pollutant columns to numbers
+        and the date column to datetimes.
+
         Users will provide two pipelines:
         1. Location filter pipeline for finding weather page links of specific locations
         2. Weather page pipeline for parsing weather information
@@ -572,65 +818,260 @@ class WeatherSpiderService(BaseSpiderService):
             rules=list(chain(*[rule.parse_rules for rule in rules.parsing_pipeline])),
             fields_to_include=['province', 'city'])
         
-        self._crawler_context.start_url = urls[0]
+        # compile the pipelines before crawling so invalid rules fail early
+        weather_plan = self._parse_plan_compiler.compile_many(rules.parsing_pipeline)[1]
+
+        if url_templates:
+            store_weather_page, close_store = self._create_weather_store(
+                weather_plan, result_format, batch_size, parquet_path)
+            await self._crawl_by_templates(urls, rules, weather_plan, url_templates,
+                                           store_weather_page, close_store)
+            if self._recrawl_scheduler is not None:
+                self._recrawl_scheduler.save()
+            print("Done!")
+            return
+
+        crawler_context = self._create_crawler_context(urls, rules)
+        crawler_context.start_url = urls[0]
 
         result_filter = self._get_weather_page_classifier()
+        weather_page_pattern = compile("\/lishi\/(\w+)\/month\/(\w+).html")
+        target_patterns = []
 
         if rules.url_patterns and len(rules.url_patterns) > 0:
             pattern = compile(rules.url_patterns[0])
+            weather_page_pattern = pattern
             result_filter = self._get_weather_page_classifier(weather_page_url_pattern=pattern)
+            target_patterns = [compile(url_pattern) for url_pattern in rules.url_patterns]
 
         location_filter = self._get_location_filter(location_names=rules.keywords.include)
         time_range_filter = self._get_time_range_filter(
             start_time=rules.time_range.start_date,
             end_time=rules.time_range.end_date
         )
-
-        weather_pages = await self._crawler_context.crawl(
+        url_filters = [location_filter, time_range_filter]
+        if self._recrawl_scheduler is not None:
+            self._recrawl_scheduler.plan()
+            url_filters = [self._get_recrawl_filter(url_filter, weather_page_pattern)
+                           for url_filter in url_filters]
+
+        # weather pages are parsed and stored while the crawl goes on,
+        # so only the pages in flight and one batch of records are held in memory
+        weather_pages = crawler_context.iter_crawl(
             rules=rules.parsing_pipeline[0].parse_rules,
-            url_filter_functions=[
-                location_filter,
-                time_range_filter
-            ],
+            url_filter_functions=url_filters,
             max_depth=rules.max_depth,
-            result_filter_func=result_filter
+            result_filter_func=result_filter,
+            # only used by the prioritized crawler
+            url_scorer=self._url_scorer_factory(
+                url_patterns=target_patterns,
+                url_filters=[location_filter, time_range_filter]),
+            # max_pages and max_size of the rules
+            budget=self._budget_factory(rules),
+            # weather pages are completed in a durable frontier once their rows are stored
+            defer_completion=True
         )
         
-        parsed_weather_history = []
-        pipeline = rules.parsing_pipeline[1]
-        weather_parser = self._parse_strategy_factory.create(pipeline.parser)
-        for weather_page in weather_pages:
-            page_text = weather_page.page_src
-            parsed_results = weather_parser.parse(
-                page_text, rules=pipeline.parse_rules)
-            weather_table_title = parsed_results[0]
-            title = weather_table_title.value['title'].value
-            province = weather_table_title.value['province'].value
-            city = weather_table_title.value['city'].value
-            for row in parsed_results[1:]:
-                row_values = row.value
-                row_values['title'].value = title
-                row_values['province'].value = province
-                row_values['city'].value = city
-
-                for parsed_result in row_values.values():
-                    parsed_result.value = parsed_result.value.replace("\r\n ", "").replace(" ", "")
+        store_weather_page, close_store = self._create_weather_store(
+            weather_plan, result_format, batch_size, parquet_path,
+            complete=crawler_context.complete)
+        async for weather_page in weather_pages:
+            if self._recrawl_scheduler is not None:
+                self._recrawl_scheduler.record_fetch(weather_page.url, weather_page.page_src)
+            await store_weather_page(weather_page.page_src, weather_page.url)
+
+        await close_store()
+        if self._recrawl_scheduler is not None:
+            self._recrawl_scheduler.save()
+        print("Done!")
 
-            result_dt = datetime.now()
-            for daily_weather in parsed_results:
-                weather_record = self._result_db_model(
-                    result_id=self._table_id_generator(
-                        f"{daily_weather.value['title'].value}-{result_dt}"),
-                    name=f"{daily_weather.value['title'].value}",
-                    description="天气历史数据",
-                    data=daily_weather.value.values(),
-                    create_dt=result_dt
-                )
-                parsed_weather_history.append(weather_record)
+    def _weather_rows(self, weather_plan: ParsePlan, page_src: str) -> List[ParseRecord]:
+        """ Daily weather rows of a weather page, each with the title, province and city """
+        parsed_results = weather_plan.parse(page_src)
+        weather_table_title = parsed_results[0]
+        title = weather_table_title.value['title'].value
+        province = weather_table_title.value['province'].value
+        city = weather_table_title.value['city'].value
+        for row in parsed_results[1:]:
+            row_values = row.value
+            row_values['title'].value = title
+            row_values['province'].value = province
+            row_values['city'].value = city
+        return parsed_results
+
+    def _weather_records(self, weather_plan: ParsePlan, page_src: str) -> List[Result]:
+        """ Result records of the daily weather in a weather page """
+        parsed_results = self._weather_rows(weather_plan, page_src)
+        for row in parsed_results[1:]:
+            for parsed_result in row.value.values():
+                parsed_result.value = parsed_result.value.replace("\r\n ", "").replace(" ", "")
 
-        await self._result_db_model.insert_many(parsed_weather_history)
-        print(parsed_weather_history)
-        print("Done!")
+        result_dt = datetime.now()
+        return [
+            self._result_db_model(
+                result_id=self._table_id_generator(
+                    f"{daily_weather.value['title'].value}-{result_dt}"),
+                name=f"{daily_weather.value['title'].value}",
+                description="天气历史数据",
+                data=to_models(daily_weather.value.values()),
+                create_dt=result_dt
+            )
+            for daily_weather in parsed_results
+        ]
+
+    def _city_month_records(self, columns_buffer: ColumnarBuffer) -> List[Result]:
+        """ A Result of typed columns for every city and month in the buffer """
+        result_dt = datetime.now()
+        records = []
+        for (city, month), columns in columns_buffer.groups(by=['city', 'date']):
+            name = f"{city}-{month}"
+            records.append(self._result_db_model(
+                result_id=self._table_id_generator(f"{name}-{result_dt}"),
+                name=name,
+                description="天气历史数据",
+                data={column_name: to_document_values(column)
+                      for column_name, column in columns.items()},
+                create_dt=result_dt
+            ))
+        return records
+
+    def _create_weather_store(self, weather_plan: ParsePlan,
+                              result_format: ResultFormat,
+                              batch_size: int,
+                              parquet_path: Optional[str] = None,
+                              complete: Callable = lambda urls: None) -> Tuple[Callable, Callable]:
+        """ Creates the coroutine functions storing a weather page and flushing the rest
+
+        Rows are stored as Result documents in batches of batch_size, or buffered in columns
+        and flushed as batch documents or Parquet row groups every batch_size rows. Pages are
+        never split across flushes, so a city-month always ends up in one document.
+        complete receives the urls of the pages stored by each flush.
+        """
+        stored_urls: List[str] = []
+
+        def complete_stored():
+            complete(list(stored_urls))
+            stored_urls.clear()
+
+        if result_format == ResultFormat.ROWS:
+            weather_records = []
+
+            async def flush():
+                if len(weather_records):
+                    await self._result_db_model.insert_many(list(weather_records))
+                    weather_records.clear()
+                complete_stored()
+
+            async def store(page_src: str, url: Optional[str] = None):
+                weather_records.extend(self._weather_records(weather_plan, page_src))
+                if url is not None:
+                    stored_urls.append(url)
+                if len(weather_records) >= batch_size:
+                    await flush()
+            return store, flush
+
+        if result_format == ResultFormat.PARQUET and parquet_path is None:
+            raise ValueError("storing weather results as Parquet needs a parquet_path")
+        columns_buffer = self._columnar_buffer_class()
+        parquet_sink = (self._parquet_sink_class(parquet_path)
+                        if result_format == ResultFormat.PARQUET else None)
+
+        async def flush_columns():
+            if len(columns_buffer):
+                if parquet_sink is not None:
+                    parquet_sink.write(columns_buffer.columns())
+                else:
+                    await self._result_db_model.insert_many(
+                        self._city_month_records(columns_buffer))
+                columns_buffer.clear()
+            complete_stored()
+
+        async def store_columns(page_src: str, url: Optional[str] = None):
+            # the first record is the title of the table, not a weather row
+            columns_buffer.append_records(self._weather_rows(weather_plan, page_src)[1:])
+            if url is not None:
+                stored_urls.append(url)
+            if len(columns_buffer) >= batch_size:
+                await flush_columns()
+
+        async def close():
+            await flush_columns()
+            if parquet_sink is not None:
+                parquet_sink.close()
+        return store_columns, close
+
+    async def _learn_keywords(self, index_url: str,
+                              link_rules: List[ParseRule],
+                              url_template: UrlTemplate) -> List[str]:
+        """ Keyword values, e.g. city codes, linked from an index page, fetched once """
+        spider = self._spider_class(request_client=self._request_client, url_to_request=index_url)
+        _, index_page = await spider.fetch()
+        link_parser = self._parse_strategy_factory.create(
+            parser_name=self._link_finder, base_url=index_url)
+        links = [link.value for link in link_parser.parse(index_page, link_rules)]
+        return url_template.learn_keywords(links)
+
+    async def _crawl_by_templates(self,
+                                  urls: List[str],
+                                  rules: ScrapeRules,
+                                  weather_plan: ParsePlan,
+                                  url_templates: List[str],
+                                  store_weather_page: Callable,
+                                  close_store: Callable) -> None:
+        """ Fetches the weather pages of url templates directly instead of crawling for them
+
+        Templates are expanded over the keywords of the rules and the time range. Without
+        keywords, they are learned from the links of the first url, e.g. the city codes
+        linked from an index page.
+        """
+        assert rules.time_range and rules.time_range.start_date
+        templates = [self._url_template_class(url_template) for url_template in url_templates]
+        keywords = list(rules.keywords.include) if rules.keywords else []
+        if len(keywords) == 0:
+            keywords = await self._learn_keywords(
+                urls[0], rules.parsing_pipeline[0].parse_rules, templates[0])
+
+        budget = self._budget_factory(rules)
+        start_date = rules.time_range.start_date
+        end_date = rules.time_range.end_date or datetime.now()
+        if self._recrawl_scheduler is not None:
+            self._recrawl_scheduler.plan()
+
+        def weather_page_urls():
+            # urls are generated as the fetch stage asks for them
+            for template in templates:
+                axes = {field: keywords for field in template.keyword_fields}
+                for url in template.expand(start_date, end_date, **axes):
+                    if (self._recrawl_scheduler is not None and
+                            not self._recrawl_scheduler.is_due(url)):
+                        continue
+                    if budget.exhausted:
+                        return
+                    if budget.try_acquire(url):
+                        yield url
+
+        async def fetch_weather_page(url: str):
+            spider = self._spider_class(request_client=self._request_client, url_to_request=url)
+            _, weather_page = await spider.fetch()
+            if len(weather_page) == 0:
+                print(f"failed to fetch url: {url}")
+                return None
+            budget.record_bytes(len(weather_page.encode('utf-8')))
+            return [(url, weather_page)]
+
+        async def store_weather_history(weather_page: Tuple[str, str]):
+            url, page_src = weather_page
+            if self._recrawl_scheduler is not None:
+                self._recrawl_scheduler.record_fetch(url, page_src)
+            await store_weather_page(page_src)
+
+        pipeline = self._pipeline_class()
+        pipeline.add_stage("weather_page_fetch", fetch_weather_page,
+                           concurrency=rules.max_concurrency, kind=StageKind.FETCH)
+        pipeline.add_stage("weather_page_store", store_weather_history, flush=close_store,
+                           kind=StageKind.STORE)
+        await pipeline.configure(rules.stages).run(weather_page_urls())
+        print(pipeline.report())
 
 
 
@@ -2,3 +2,8 @@ from .async_iterator import AsyncIterator
 from .regex_patterns import *
 from .async_timer import timeit
 from .throttled_fetch import throttled
+from .datetime_normalizer import DatetimeNormalizer, datetime_normalizer, to_datetimes
+from .keyword_matcher import KeywordMatcher
+from .simhash import NearDuplicateDetector, SimHashIndex, simhash, visible_text, main_text
+from .url_template import UrlTemplate, day_range, month_range, year_range
+from .columnar import ColumnarBuffer, ParquetSink, to_document_values
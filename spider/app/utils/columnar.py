@@ -0,0 +1,162 @@
+""" Columnar buffers of tabular extraction results
+
+List item parsers turn every table row into a dict of ParseRecords. Storing each row as its
+own document produces millions of tiny documents of untyped strings. ColumnarBuffer appends
+the cells of each row to one list per column instead, and cleans whole columns at once:
+whitespace is removed with vectorized string operations, numeric columns become float arrays
+and date columns are parsed in one batch. The typed columns can be written as batch
+documents, one per group of rows, or as a Parquet file when pyarrow is installed.
+"""
+
+import numpy as np
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from .datetime_normalizer import DatetimeNormalizer, datetime_normalizer
+
+try:
+    import pyarrow
+    import pyarrow.parquet as parquet
+except ImportError:
+    pyarrow = None
+    parquet = None
+
+
+AQI_NUMERIC_COLUMNS = ('AQI', 'AQI_rank', 'PM2.5', 'PM10', 'SO2', 'NO2', 'Co', 'CO', 'O3')
+
+
+def to_numeric(values: np.ndarray) -> np.ndarray:
+    """ Converts a string column to floats, NaN where a cell is not a number """
+    try:
+        return np.where(values == "", "nan", values).astype(float)
+    except ValueError:
+        numbers = np.full(len(values), np.nan)
+        for index, value in enumerate(values.tolist()):
+            try:
+                numbers[index] = float(value)
+            except ValueError:
+                pass
+        return numbers
+
+
+class ColumnarBuffer(object):
+    """ Appends table rows column by column
+
+    Args:
+        numeric_columns: columns converted to float arrays
+        date_columns: columns converted to datetime64 arrays
+        strip_chars: characters removed from every cell
+    """
+
+    def __init__(self,
+                 numeric_columns: Sequence[str] = AQI_NUMERIC_COLUMNS,
+                 date_columns: Sequence[str] = ('date',),
+                 strip_chars: Sequence[str] = ("\r", "\n", "\t", " "),
+                 normalizer: DatetimeNormalizer = datetime_normalizer):
+        self._numeric_columns = set(numeric_columns)
+        self._date_columns = set(date_columns)
+        self._strip_chars = strip_chars
+        self._normalizer = normalizer
+        self._columns: Dict[str, List[Any]] = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def column_names(self) -> List[str]:
+        return list(self._columns)
+
+    def append_row(self, row: Dict[str, Any]) -> None:
+        """ Appends a row of cell values, ParseRecords are unwrapped to their values """
+        for name in row:
+            if name not in self._columns:
+                # a column first seen now has no cells in the earlier rows
+                self._columns[name] = [""] * self._size
+        for name, cells in self._columns.items():
+            cell = row.get(name, "")
+            cells.append(getattr(cell, 'value', cell))
+        self._size += 1
+
+    def append_records(self, records: Iterable[Any]) -> None:
+        """ Appends the rows of list item parser results, ParseRecords of dicts """
+        for record in records:
+            self.append_row(record.value)
+
+    def clear(self) -> None:
+        self._columns = {}
+        self._size = 0
+
+    def _clean(self, name: str, cells: List[Any]) -> np.ndarray:
+        values = np.array([cell if cell is not None else "" for cell in cells], dtype=str)
+        for char in self._strip_chars:
+            values = np.char.replace(values, char, "")
+        if name in self._numeric_columns:
+            return to_numeric(values)
+        if name in self._date_columns:
+            return self._normalizer.normalize_many(values.tolist())
+        return values
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        """ The cleaned and typed columns """
+        return {name: self._clean(name, cells) for name, cells in self._columns.items()}
+
+    def groups(self, by: Sequence[str],
+               columns: Optional[Dict[str, np.ndarray]] = None
+               ) -> Iterator[Tuple[Tuple[str, ...], Dict[str, np.ndarray]]]:
+        """ Splits the columns into groups of rows with the same values of the by columns
+
+        Date columns in by are grouped by month.
+        """
+        columns = columns if columns is not None else self.columns()
+        if self._size == 0:
+            return
+        keys = np.full(self._size, "", dtype=object)
+        for index, name in enumerate(by):
+            column = columns[name]
+            if np.issubdtype(column.dtype, np.datetime64):
+                column = column.astype('datetime64[M]')
+            keys = keys + ("|" if index else "") + column.astype(str).astype(object)
+        group_keys, inverse = np.unique(keys.astype(str), return_inverse=True)
+        order = np.argsort(inverse, kind='stable')
+        bounds = np.concatenate([[0], np.cumsum(np.bincount(inverse))])
+        for group, key in enumerate(group_keys.tolist()):
+            rows = order[bounds[group]: bounds[group + 1]]
+            yield tuple(key.split("|")), {name: column[rows] for name, column in columns.items()}
+
+
+def to_document_values(column: np.ndarray) -> List[Any]:
+    """ Plain Python values of a column that document databases can store """
+    if np.issubdtype(column.dtype, np.datetime64):
+        return column.astype('datetime64[ms]').tolist()
+    return column.tolist()
+
+
+class ParquetSink(object):
+    """ Writes columns to one Parquet file, a row group for each write
+
+    Args:
+        path: the Parquet file
+    """
+
+    def __init__(self, path: str):
+        if pyarrow is None:
+            raise ImportError("Writing Parquet files requires pyarrow, pip install pyarrow")
+        self._path = path
+        self._writer = None
+
+    def write(self, columns: Dict[str, np.ndarray]) -> None:
+        table = pyarrow.table({name: pyarrow.array(column) for name, column in columns.items()})
+        if self._writer is None:
+            self._writer = parquet.ParquetWriter(self._path, table.schema)
+        elif table.schema != self._writer.schema:
+            # the file keeps the columns of the first batch, missing ones become nulls
+            schema = self._writer.schema
+            table = pyarrow.Table.from_arrays(
+                [table.column(field.name).cast(field.type) if field.name in table.column_names
+                 else pyarrow.nulls(len(table), field.type) for field in schema],
+                schema=schema)
+        self._writer.write_table(table)
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
@@ -0,0 +1,180 @@
+""" Normalizes relative and absolute Chinese datetime strings
+
+Search result pages show dates like "58分钟前", "昨天13:15", "6月5日" or "2021年6月5日".
+DatetimeNormalizer recognizes all supported forms with one combined regex, memoizes the
+result per distinct string and converts a whole batch to datetime64 values at once.
+
+Relative forms are memoized as (anchor, months, seconds) offsets rather than datetimes,
+so a cached string stays correct when it is normalized again later against a new "now".
+"""
+
+import re
+import numpy as np
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# anchors of a normalized string
+INVALID, NOW, TODAY, YEAR, EPOCH = range(5)
+
+Offset = Tuple[int, int, int]
+_invalid: Offset = (INVALID, 0, 0)
+
+cn_datetime_pattern = re.compile(
+    r"\s*(?:"
+    r"(?P<iso_y>\d{4})[-/.](?P<iso_m>\d{1,2})[-/.](?P<iso_d>\d{1,2})"
+    r"(?:[T\s]+(?P<iso_H>\d{1,2}):(?P<iso_M>\d{1,2})(?::(?P<iso_S>\d{1,2}))?)?"
+    r"|(?P<ymd_y>\d{2,4})年(?P<ymd_m>\d{1,2})月(?P<ymd_d>\d{1,2})日"
+    r"(?:\s*(?P<ymd_H>\d{1,2}):(?P<ymd_M>\d{1,2}))?"
+    r"|(?P<md_m>\d{1,2})月(?P<md_d>\d{1,2})日(?:\s*(?P<md_H>\d{1,2}):(?P<md_M>\d{1,2}))?"
+    r"|(?P<seconds_ago>\d+)\s*秒前"
+    r"|(?P<minutes_ago>\d+)\s*分钟前"
+    r"|(?P<hours_ago>\d+)\s*小时前"
+    r"|(?P<days_ago>\d+)\s*天前"
+    r"|(?P<day_word>今天|昨天|前天)\s*(?:(?P<word_H>\d{1,2}):(?P<word_M>\d{1,2}))?"
+    r"|(?P<time_H>\d{1,2}):(?P<time_M>\d{2})"
+    r")")
+
+_days_before_today = {'今天': 0, '昨天': 1, '前天': 2}
+# longest possible month lengths, the year of a M月D日 string is only known at normalization,
+# where days past the end of the month in that year (2月29日 of a common year) become NaT
+_max_days_in_month = (31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+_relative_units = (('seconds_ago', 1), ('minutes_ago', 60),
+                   ('hours_ago', 3600), ('days_ago', 86400))
+
+
+def _int(value: Optional[str]) -> int:
+    return int(value) if value else 0
+
+
+def _clock(hour: Optional[str], minute: Optional[str], second: Optional[str] = None) -> int:
+    """ Seconds since midnight, -1 if the clock time is out of range """
+    hour, minute, second = _int(hour), _int(minute), _int(second)
+    if hour > 23 or minute > 59 or second > 59:
+        return -1
+    return hour * 3600 + minute * 60 + second
+
+
+def _absolute(year: int, month: int, day: int, seconds: int) -> Offset:
+    if year < 100:
+        year += 2000
+    try:
+        date = np.datetime64(f"{year:04d}-{month:02d}-{day:02d}", 's')
+    except ValueError:
+        return _invalid
+    return (EPOCH, 0, int(date.astype(np.int64)) + seconds)
+
+
+class DatetimeNormalizer(object):
+    """ Batch normalizer for Chinese relative and absolute datetime strings
+
+    Supported forms:
+        N秒前, N分钟前, N小时前, N天前,
+        今天/昨天/前天 (optionally followed by HH:MM), HH:MM,
+        M月D日, YYYY年M月D日 (both optionally followed by HH:MM),
+        YYYY-MM-DD, YYYY/MM/DD, YYYY.MM.DD (optionally followed by HH:MM[:SS])
+
+    Args:
+        pattern: combined pattern with the named groups used by _offset
+        cache_size: maximum number of distinct strings to memoize
+    """
+
+    def __init__(self, pattern: re.Pattern = cn_datetime_pattern, cache_size: int = 65536):
+        self._pattern = pattern
+        self._cache_size = cache_size
+        self._cache: Dict[str, Offset] = {}
+
+    def _offset(self, text: str) -> Offset:
+        matched = self._pattern.match(text)
+        if matched is None:
+            return _invalid
+
+        groups = matched.groupdict()
+
+        for group_name, unit in _relative_units:
+            if groups[group_name]:
+                return (NOW, 0, -int(groups[group_name]) * unit)
+
+        if groups['day_word']:
+            seconds = _clock(groups['word_H'], groups['word_M'])
+            if seconds < 0:
+                return _invalid
+            return (TODAY, 0, seconds - _days_before_today[groups['day_word']] * 86400)
+
+        if groups['time_H']:
+            seconds = _clock(groups['time_H'], groups['time_M'])
+            return _invalid if seconds < 0 else (TODAY, 0, seconds)
+
+        if groups['md_m']:
+            month, day = int(groups['md_m']), int(groups['md_d'])
+            seconds = _clock(groups['md_H'], groups['md_M'])
+            if (not (1 <= month <= 12 and 1 <= day <= _max_days_in_month[month - 1]) or
+                seconds < 0):
+                return _invalid
+            return (YEAR, month - 1, (day - 1) * 86400 + seconds)
+
+        if groups['ymd_y']:
+            seconds = _clock(groups['ymd_H'], groups['ymd_M'])
+            if seconds < 0:
+                return _invalid
+            return _absolute(int(groups['ymd_y']), int(groups['ymd_m']),
+                             int(groups['ymd_d']), seconds)
+
+        seconds = _clock(groups['iso_H'], groups['iso_M'], groups['iso_S'])
+        if seconds < 0:
+            return _invalid
+        return _absolute(int(groups['iso_y']), int(groups['iso_m']),
+                         int(groups['iso_d']), seconds)
+
+    def _lookup(self, text: str) -> Offset:
+        offset = self._cache.get(text)
+        if offset is None:
+            offset = self._offset(text)
+            if len(self._cache) >= self._cache_size:
+                self._cache.clear()
+            self._cache[text] = offset
+        return offset
+
+    def normalize_many(self, texts: Iterable[str], now: Optional[datetime] = None) -> np.ndarray:
+        """ Normalizes a batch of datetime strings
+
+        Args:
+            texts: datetime strings, None or empty strings are allowed
+            now: reference time for relative forms, defaults to datetime.now()
+
+        Returns:
+            np.ndarray of datetime64[s], NaT where a string could not be recognized
+        """
+        offsets = np.array([self._lookup(text) if text else _invalid for text in texts],
+                           dtype=np.int64).reshape(-1, 3)
+        anchors, months, seconds = offsets[:, 0], offsets[:, 1], offsets[:, 2]
+
+        current = np.datetime64(now or datetime.now(), 's')
+        today = current.astype('datetime64[D]').astype('datetime64[s]')
+        this_year = current.astype('datetime64[Y]').astype('datetime64[M]')
+
+        bases = np.full(len(offsets), np.datetime64('NaT'), dtype='datetime64[s]')
+        bases[anchors == NOW] = current
+        bases[anchors == TODAY] = today
+        bases[anchors == EPOCH] = np.datetime64(0, 's')
+        year_anchored = anchors == YEAR
+        month_starts = (this_year + months[year_anchored]).astype('datetime64[s]')
+        next_month_starts = (this_year + months[year_anchored] + 1).astype('datetime64[s]')
+        # a day that does not exist in the month of this year, like 2月29日 of a common year
+        past_month_end = month_starts + seconds[year_anchored].astype('timedelta64[s]') >= \
+            next_month_starts
+        month_starts[past_month_end] = np.datetime64('NaT')
+        bases[year_anchored] = month_starts
+
+        return bases + seconds.astype('timedelta64[s]')
+
+    def normalize(self, text: str, now: Optional[datetime] = None) -> Optional[datetime]:
+        """ Normalizes one datetime string, None if it could not be recognized """
+        return to_datetimes(self.normalize_many([text], now=now))[0]
+
+
+def to_datetimes(values: np.ndarray) -> List[Optional[datetime]]:
+    """ Converts datetime64 values to datetime objects, NaT becomes None """
+    return values.astype('datetime64[us]').tolist()
+
+
+datetime_normalizer = DatetimeNormalizer()
@@ -0,0 +1,173 @@
+""" Multi-pattern keyword matching for include/exclude rules
+
+Filtering with one regex alternation per keyword list, or worse a negative lookahead like
+^((?!kw1|kw2).)*$, costs O(len(text) x keywords). KeywordMatcher builds an Aho-Corasick
+automaton once per KeywordRules and finds every keyword in a single pass over each text.
+"""
+
+from collections import deque
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set
+
+
+class AhoCorasickAutomaton(object):
+    """ Finds all occurrences of a set of patterns in one pass over a text
+
+    Args:
+        patterns: non-empty strings to search for, ids are their list indices
+    """
+
+    def __init__(self, patterns: Sequence[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[int]] = [[]]
+
+        for pattern_id, pattern in enumerate(patterns):
+            if len(pattern):
+                self._add(pattern, pattern_id)
+        self._build_failure_links()
+
+    def _add(self, pattern: str, pattern_id: int) -> None:
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append(pattern_id)
+
+    def _build_failure_links(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                # a state also reports every pattern that ends at its failure state
+                self._output[next_state] = (self._output[next_state] +
+                                            self._output[self._fail[next_state]])
+
+    def iter_matches(self, text: str) -> Iterator[int]:
+        """ Yields pattern ids in the order their occurrences end in the text """
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for pattern_id in output[state]:
+                yield pattern_id
+
+
+class KeywordMatcher(object):
+    """ Applies include and exclude keyword rules to texts
+
+    A group of texts, e.g. the title and the abstract of a search result, is accepted when
+    none of them contains an excluded keyword, and
+        - include_all=False: some text contains at least one included keyword
+        - include_all=True: every included keyword appears in some text
+    With no included keywords, every group without excluded keywords is accepted.
+
+    Args:
+        include: keywords to include
+        exclude: keywords to exclude
+        include_all: require every included keyword instead of any
+        ignore_case: match case-insensitively
+    """
+
+    def __init__(self,
+                 include: Sequence[str] = (),
+                 exclude: Sequence[str] = (),
+                 include_all: bool = False,
+                 ignore_case: bool = True):
+        self._ignore_case = ignore_case
+        self._include_all = include_all
+        include = [self._fold(keyword) for keyword in include if len(keyword)]
+        exclude = [self._fold(keyword) for keyword in exclude if len(keyword)]
+
+        # deduplicate while keeping a stable id per keyword
+        keywords = list(dict.fromkeys(include + exclude))
+        keyword_ids = {keyword: keyword_id for keyword_id, keyword in enumerate(keywords)}
+        self._include_ids = frozenset(keyword_ids[keyword] for keyword in include)
+        self._exclude_ids = frozenset(keyword_ids[keyword] for keyword in exclude)
+        self._automaton = AhoCorasickAutomaton(keywords)
+
+    @classmethod
+    def from_rules(cls, keyword_rules: Any, include_all: bool = False,
+                   ignore_case: bool = True) -> "KeywordMatcher":
+        """ Shared matcher for a KeywordRules object, built once per distinct rule set """
+        if keyword_rules is None:
+            return _cached_matcher((), (), include_all, ignore_case)
+        return _cached_matcher(tuple(keyword_rules.include),
+                               tuple(keyword_rules.exclude),
+                               include_all, ignore_case)
+
+    @classmethod
+    def exclude_only(cls, keyword_rules: Any, ignore_case: bool = True) -> "KeywordMatcher":
+        """ Shared matcher that only applies the excluded keywords of a KeywordRules object """
+        exclude = () if keyword_rules is None else tuple(keyword_rules.exclude)
+        return _cached_matcher((), exclude, False, ignore_case)
+
+    def _fold(self, text: str) -> str:
+        return text.casefold() if self._ignore_case else text
+
+    def find(self, *texts: Optional[str]) -> Set[int]:
+        """ Ids of the keywords found in any of the texts """
+        found: Set[int] = set()
+        for text in texts:
+            if text:
+                found.update(self._automaton.iter_matches(self._fold(text)))
+        return found
+
+    def accepts(self, *texts: Optional[str]) -> bool:
+        """ Whether a group of texts passes the include and exclude rules """
+        include_ids, exclude_ids = self._include_ids, self._exclude_ids
+        if not include_ids and not exclude_ids:
+            return True
+
+        included: Set[int] = set()
+        for text in texts:
+            if not text:
+                continue
+            for keyword_id in self._automaton.iter_matches(self._fold(text)):
+                if keyword_id in exclude_ids:
+                    return False
+                if keyword_id in include_ids:
+                    included.add(keyword_id)
+                    if not exclude_ids and not self._include_all:
+                        # the first included keyword settles include-any
+                        return True
+
+        if not include_ids:
+            return True
+        if self._include_all:
+            return included == include_ids
+        return len(included) > 0
+
+    def accept_many(self, text_groups: Iterable[Sequence[Optional[str]]]) -> List[bool]:
+        """ Batch version of accepts, e.g. over the (title, abstract) pairs of a result page """
+        return [self.accepts(*texts) for texts in text_groups]
+
+    def filter(self, items: Iterable[Any], *text_getters: Any) -> List[Any]:
+        """ Keeps the items whose texts pass the rules
+
+        Args:
+            items: objects to filter
+            text_getters: callables extracting the texts to check from an item
+        """
+        return [item for item in items
+                if self.accepts(*(get_text(item) for get_text in text_getters))]
+
+
+@lru_cache(maxsize=128)
+def _cached_matcher(include: tuple, exclude: tuple, include_all: bool,
+                    ignore_case: bool) -> KeywordMatcher:
+    return KeywordMatcher(include=include, exclude=exclude, include_all=include_all,
+                          ignore_case=ignore_case)
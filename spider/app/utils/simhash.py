@@ -0,0 +1,152 @@
+""" Near duplicate detection with SimHash
+
+Print views, urls with tracking parameters and syndicated articles serve almost the same
+text. SimHash maps a text to a 64-bit fingerprint such that similar texts differ in only a
+few bits, so near duplicates are pages whose fingerprints are within k bits of each other.
+
+SimHashIndex finds such fingerprints without comparing against every page seen: the 64 bits
+are split into k + 1 blocks and, by the pigeonhole principle, two fingerprints within k bits
+agree exactly on at least one block. Each block has its own table, so a lookup only compares
+against fingerprints sharing a block value.
+
+Pages are fingerprinted over their main text, so the navigation, sidebars and footers that
+the pages of a site share do not make different pages look alike.
+"""
+
+import re
+import numpy as np
+from collections import Counter
+from gne import GeneralNewsExtractor
+from hashlib import blake2b
+from lxml.html import fromstring
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+_whitespace_pattern = re.compile(r"\s+")
+_bit_weights = np.uint64(1) << np.arange(64, dtype=np.uint64)
+
+
+def visible_text(html: str) -> str:
+    """ Text of a html page without scripts and styles, whitespace collapsed """
+    if not html:
+        return ""
+    try:
+        root = fromstring(html)
+    except Exception:
+        return ""
+    text = " ".join(root.xpath("//text()[not(ancestor::script or ancestor::style)]"))
+    return _whitespace_pattern.sub(" ", text).strip()
+
+
+def main_text(html: str, extractor_class: Callable = GeneralNewsExtractor) -> str:
+    """ Main text of a html page found by gne, e.g. the body of an article
+
+    Falls back to the visible text of pages without one.
+    """
+    if not html:
+        return ""
+    try:
+        content = extractor_class().extract(html).get('content') or ""
+    except Exception:
+        content = ""
+    return _whitespace_pattern.sub(" ", content).strip() or visible_text(html)
+
+
+def _shingle_hash(shingle: str) -> int:
+    return int.from_bytes(blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def simhash(text: str, shingle_size: int = 4) -> int:
+    """ 64-bit SimHash of a text over its character shingles, weighted by their counts
+
+    Character shingles work for Chinese texts, which have no spaces between words.
+    """
+    text = _whitespace_pattern.sub(" ", text).strip()
+    if len(text) < shingle_size:
+        shingles = Counter([text]) if text else Counter()
+    else:
+        shingles = Counter(text[start: start + shingle_size]
+                           for start in range(len(text) - shingle_size + 1))
+    if not shingles:
+        return 0
+
+    hashes = np.array([_shingle_hash(shingle) for shingle in shingles], dtype=np.uint64)
+    weights = np.array(list(shingles.values()), dtype=np.int64)
+    # bit matrix of the shingle hashes, one row per shingle
+    bits = (hashes[:, None] & _bit_weights) != 0
+    votes = weights @ np.where(bits, 1, -1)
+    return int(_bit_weights[votes > 0].sum())
+
+
+def hamming_distance(first: int, second: int) -> int:
+    return bin(first ^ second).count("1")
+
+
+class SimHashIndex(object):
+    """ Finds stored fingerprints within max_distance bits of a fingerprint
+
+    Args:
+        max_distance: k, the largest Hamming distance of near duplicates
+    """
+
+    def __init__(self, max_distance: int = 3):
+        self._max_distance = max_distance
+        blocks = max_distance + 1
+        bounds = np.linspace(0, 64, blocks + 1).astype(int).tolist()
+        self._blocks: List[Tuple[int, int]] = [
+            (start, (1 << (end - start)) - 1) for start, end in zip(bounds, bounds[1:])]
+        self._tables: List[Dict[int, List[Tuple[int, Hashable]]]] = [{} for _ in self._blocks]
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, fingerprint: int, key: Hashable) -> None:
+        for (shift, mask), table in zip(self._blocks, self._tables):
+            table.setdefault((fingerprint >> shift) & mask, []).append((fingerprint, key))
+        self._size += 1
+
+    def find(self, fingerprint: int) -> Optional[Hashable]:
+        """ Key of a stored fingerprint within max_distance bits, None if there is none """
+        for (shift, mask), table in zip(self._blocks, self._tables):
+            for candidate, key in table.get((fingerprint >> shift) & mask, ()):
+                if hamming_distance(fingerprint, candidate) <= self._max_distance:
+                    return key
+        return None
+
+
+class NearDuplicateDetector(object):
+    """ Remembers the pages it has seen and recognizes near copies of them
+
+    Args:
+        max_distance: pages whose fingerprints differ in at most this many bits are duplicates
+        min_text_length: shorter texts are never considered duplicates, e.g. error pages
+        shingle_size: length of the character shingles
+        text_extractor: extracts the text of a page that is fingerprinted
+    """
+
+    def __init__(self, max_distance: int = 3, min_text_length: int = 200, shingle_size: int = 4,
+                 text_extractor: Callable = main_text):
+        self._index = SimHashIndex(max_distance)
+        self._min_text_length = min_text_length
+        self._shingle_size = shingle_size
+        self._text_extractor = text_extractor
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def check_text(self, key: Hashable, text: str) -> Optional[Hashable]:
+        """ Key of an earlier near duplicate of the text, or None after remembering the text """
+        if len(text) < self._min_text_length:
+            return None
+        fingerprint = simhash(text, self._shingle_size)
+        duplicate_of = self._index.find(fingerprint)
+        if duplicate_of is None:
+            self._index.add(fingerprint, key)
+        return duplicate_of
+
+    def check_page(self, key: Hashable, html: str) -> Optional[Hashable]:
+        """ Like check_text, over the main text of a html page """
+        return self.check_text(key, self._text_extractor(html))
+
+    def is_duplicate(self, key: Hashable, html: str) -> bool:
+        return self.check_page(key, html) is not None
@@ -0,0 +1,133 @@
+""" Url templates of archive pages
+
+Sites like tianqihoubao.com keep their archives under predictable urls, e.g.
+/aqi/{city}-{yyyymm}.html. Expanding such a template over its axes gives every archive url
+directly, without crawling the index pages to discover them.
+
+Date fields are expanded over a date range:
+    yyyymmdd: every day, e.g. 20210315
+    yyyymm: every month, e.g. 202103
+    yyyy: every year, e.g. 2021
+Any other field is a keyword axis, expanded over a list of values such as city codes.
+"""
+
+import re
+from datetime import datetime, timedelta
+from itertools import product
+from string import Formatter
+from typing import Dict, Iterator, List, Optional, Pattern, Sequence, Set
+
+
+def day_range(start: datetime, end: datetime) -> Iterator[datetime]:
+    """ Every day from start to end, both included """
+    day = datetime(start.year, start.month, start.day)
+    while day <= end:
+        yield day
+        day += timedelta(days=1)
+
+
+def month_range(start: datetime, end: datetime) -> Iterator[datetime]:
+    """ The first day of every month from the month of start to the month of end """
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        yield datetime(year, month, 1)
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def year_range(start: datetime, end: datetime) -> Iterator[datetime]:
+    for year in range(start.year, end.year + 1):
+        yield datetime(year, 1, 1)
+
+
+class UrlTemplate(object):
+    """ A url template with keyword and date fields
+
+    Args:
+        template: e.g. "http://www.tianqihoubao.com/aqi/{city}-{yyyymm}.html"
+    """
+
+    __date_fields__ = {
+        'yyyymmdd': ('%Y%m%d', day_range),
+        'yyyymm': ('%Y%m', month_range),
+        'yyyy': ('%Y', year_range),
+    }
+
+    def __init__(self, template: str, formatter: Formatter = Formatter()):
+        self._template = template
+        self._formatter = formatter
+        self._fields: List[str] = []
+        for _, field_name, _, _ in formatter.parse(template):
+            if field_name and field_name not in self._fields:
+                self._fields.append(field_name)
+        date_fields = [field for field in self._fields if field in self.__date_fields__]
+        if len(date_fields) > 1:
+            raise ValueError(f"url template {template} has more than one date field")
+        self._date_field: Optional[str] = date_fields[0] if date_fields else None
+        self._keyword_fields = [field for field in self._fields if field != self._date_field]
+
+    @property
+    def template(self) -> str:
+        return self._template
+
+    @property
+    def keyword_fields(self) -> List[str]:
+        return list(self._keyword_fields)
+
+    @property
+    def date_field(self) -> Optional[str]:
+        return self._date_field
+
+    def expand(self, start: Optional[datetime] = None,
+               end: Optional[datetime] = None,
+               **axes: Sequence[str]) -> Iterator[str]:
+        """ Yields the url of every combination of keyword values and dates
+
+        Urls are generated lazily, keyword values vary slowest, dates fastest.
+
+        Args:
+            start, end: date range of the date field
+            axes: values of each keyword field
+        """
+        missing = [field for field in self._keyword_fields if field not in axes]
+        if missing:
+            raise ValueError(f"no values for the fields {missing} of {self._template}")
+        if self._date_field is not None:
+            if start is None or end is None:
+                raise ValueError(f"url template {self._template} needs a date range")
+            date_format, date_range = self.__date_fields__[self._date_field]
+            dates: Sequence[Optional[str]] = [date.strftime(date_format)
+                                              for date in date_range(start, end)]
+        else:
+            dates = [None]
+
+        for values in product(*[axes[field] for field in self._keyword_fields]):
+            fields: Dict[str, str] = dict(zip(self._keyword_fields, values))
+            for date in dates:
+                if date is not None:
+                    fields[self._date_field] = date
+                yield self._template.format(**fields)
+
+    def index_pattern(self) -> Pattern:
+        """ Regex capturing the first keyword field from the links of an index page
+
+        Index pages usually link to one page per keyword value whose url starts like the
+        template, e.g. /aqi/shenzhen.html for /aqi/{city}-{yyyymm}.html.
+        """
+        literal, field_name, _, _ = next(iter(self._formatter.parse(self._template)))
+        if not field_name or field_name in self.__date_fields__:
+            raise ValueError(f"url template {self._template} does not start with a keyword field")
+        # the host may be left out of the links
+        path_prefix = re.sub(r"^\w+://[^/]+", "", literal)
+        return re.compile(re.escape(path_prefix) + r"([A-Za-z0-9_]+)")
+
+    def learn_keywords(self, links: Sequence[str]) -> List[str]:
+        """ Values of the first keyword field found in links, in order of appearance """
+        pattern = self.index_pattern()
+        seen: Set[str] = set()
+        keywords = []
+        for link in links:
+            matched = pattern.search(link)
+            if matched is not None and matched.group(1) not in seen:
+                seen.add(matched.group(1))
+                keywords.append(matched.group(1))
+        return keywords
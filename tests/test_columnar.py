@@ -0,0 +1,50 @@
+from datetime import datetime
+
+import numpy as np
+
+from spider.app.models.data_models import ParseRecord
+from spider.app.utils.columnar import ColumnarBuffer, to_document_values
+
+
+def weather_row(city, date, aqi, quality):
+    return ParseRecord(name="row", value={
+        'city': ParseRecord(name='city', value=city),
+        'date': ParseRecord(name='date', value=date),
+        'AQI': ParseRecord(name='AQI', value=aqi),
+        'quality': ParseRecord(name='quality', value=quality),
+    })
+
+
+def filled_buffer():
+    buffer = ColumnarBuffer()
+    buffer.append_records([
+        weather_row("shenzhen", "2021年3月1日", " 42\r\n", "优"),
+        weather_row("beijing", "2021年3月1日", "120", "轻度污染"),
+        weather_row("shenzhen", "2021年3月2日", "", "良"),
+        weather_row("shenzhen", "2021年4月1日", "55", "良"),
+    ])
+    return buffer
+
+
+def test_groups_by_city_and_month():
+    groups = dict(filled_buffer().groups(by=['city', 'date']))
+
+    assert list(groups) == [("beijing", "2021-03"), ("shenzhen", "2021-03"),
+                            ("shenzhen", "2021-04")]
+    march = groups[("shenzhen", "2021-03")]
+    assert march['quality'].tolist() == ["优", "良"]
+    np.testing.assert_array_equal(march['AQI'], [42.0, np.nan])
+    assert to_document_values(march['date']) == [datetime(2021, 3, 1), datetime(2021, 3, 2)]
+    assert groups[("beijing", "2021-03")]['AQI'].tolist() == [120.0]
+
+
+def test_groups_cover_every_row_once():
+    buffer = filled_buffer()
+    groups = list(buffer.groups(by=['city', 'date']))
+
+    assert sum(len(columns['city']) for _, columns in groups) == len(buffer)
+    assert all(not np.isnat(columns['date']).any() for _, columns in groups)
+
+
+def test_groups_of_an_empty_buffer():
+    assert list(ColumnarBuffer().groups(by=['city'])) == []
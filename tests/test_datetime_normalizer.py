@@ -0,0 +1,14 @@
+from datetime import datetime
+
+from spider.app.utils.datetime_normalizer import DatetimeNormalizer
+
+
+def test_month_day_is_checked_against_the_year_of_now():
+    normalizer = DatetimeNormalizer()
+
+    assert normalizer.normalize('2月29日', now=datetime(2021, 6, 1)) is None
+    assert normalizer.normalize('2021年2月29日', now=datetime(2021, 6, 1)) is None
+    # the memoized offset is resolved again against a leap year
+    assert normalizer.normalize('2月29日', now=datetime(2020, 6, 1)) == datetime(2020, 2, 29)
+    assert normalizer.normalize('2月28日 23:59', now=datetime(2021, 6, 1)) == \
+        datetime(2021, 2, 28, 23, 59)
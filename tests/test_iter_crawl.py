@@ -0,0 +1,53 @@
+import asyncio
+
+from spider.app.core.crawling import CrawlerContextFactory
+from spider.app.core.parser import ParserContextFactory
+from spider.app.models.request_models import ParseRule
+
+START_URL = "http://example.com"
+LINK_RULES = [ParseRule(field_name='link', rule='//a', rule_type='xpath')]
+
+
+class FakeSpider(object):
+    """ Serves a tree of pages, each linking to three children down to depth 3 """
+
+    def __init__(self, request_client, url_to_request=""):
+        self._url = url_to_request
+
+    async def fetch(self):
+        await asyncio.sleep(0)
+        children = ([f"{self._url}/{index}" for index in range(3)]
+                    if self._url.count('/') < 5 else [])
+        links = "".join(f'<a href="{child}">{child}</a>' for child in children)
+        return self._url, f"<html><body>{links}</body></html>"
+
+
+def create_crawler():
+    crawler = CrawlerContextFactory.create(
+        'bfs_crawler', start_url='', spider_class=FakeSpider, request_client=None,
+        parser_context=ParserContextFactory.create('link_parser', base_url=''),
+        max_concurrency=4)
+    crawler.start_url = START_URL
+    return crawler
+
+
+def test_iter_crawl_yields_every_page():
+    async def crawl():
+        return [page.url async for page in create_crawler().iter_crawl(
+            rules=LINK_RULES, max_depth=3, buffer_size=1)]
+
+    urls = asyncio.run(crawl())
+    assert len(urls) == 40
+    assert len(set(urls)) == 40
+
+
+def test_iter_crawl_closes_early_with_a_full_buffer():
+    async def crawl_first_page():
+        pages = create_crawler().iter_crawl(rules=LINK_RULES, max_depth=3, buffer_size=1)
+        first = await pages.__anext__()
+        # let the crawl fill the buffer before closing
+        await asyncio.sleep(0.05)
+        await asyncio.wait_for(pages.aclose(), timeout=5)
+        return first
+
+    assert asyncio.run(crawl_first_page()).url == START_URL
@@ -0,0 +1,29 @@
+import pytest
+
+from spider.app.core.parse_driver import ParseDriver
+from spider.app.core.parser import ListItemParser
+from spider.app.models.request_models import ParseRule
+
+TABLE = ("<table><tr><td class='name'>a</td><td>1</td></tr>"
+         "<tr><td class='name'>b</td><td>2</td></tr></table>")
+
+
+def parse_values(rules):
+    records = ListItemParser(ParseDriver).parse(TABLE, rules)
+    return [{name: field.value for name, field in record.value.items()} for record in records]
+
+
+def test_row_fields_use_the_container_backend():
+    assert parse_values([
+        ParseRule(field_name='row', rule_type='css_selector', rule='tr', is_container=True),
+        ParseRule(field_name='name', rule_type='css_selector', rule='td.name'),
+        ParseRule(field_name='count', rule_type='regex', rule=r'\d'),
+    ]) == [{'name': 'a', 'count': '1'}, {'name': 'b', 'count': '2'}]
+
+
+def test_row_fields_of_another_backend_are_rejected():
+    with pytest.raises(ValueError, match='selector backend of the container'):
+        parse_values([
+            ParseRule(field_name='row', rule_type='xpath', rule='//tr', is_container=True),
+            ParseRule(field_name='name', rule_type='css_selector', rule='td.name'),
+        ])
@@ -0,0 +1,64 @@
+import re
+from pathlib import Path
+
+import pytest
+from lxml import html
+
+from spider.app.core.selector_matcher import SelectorMatcher, compile_simple_xpath
+
+SERVICE_CONFIGS = Path(__file__).resolve().parent.parent / "spider" / "app" / "service_configs"
+
+DOCUMENT = html.fromstring("""
+<html><body>
+  <div id="content">
+    <h1>AQI history</h1>
+    <div><div></div><dl><dd><a href="/aqi/shenzhen.html">shenzhen</a></dd></dl></div>
+  </div>
+  <div id="mnav"><div><a>1</a><a>2</a><a>3</a></div></div>
+  <div class="post"><p>A</p></div>
+  <div class="article"><p>B</p></div>
+  <div id="a" class="k"><span>C</span></div>
+  <div id="a" class="other"><span>D</span></div>
+  <h3><a href="/news/1">news 1</a></h3>
+  <div class="result">
+    <span class="c-font-normal c-color-text">abstract</span>
+    <span class="c-color-gray2 c-font-normal">3小时前</span>
+    <span class="c-font-normal">neither</span>
+  </div>
+  <div id="ptab-0"><div><div><div>domestic</div><div><span>2021-03-01</span></div></div></div></div>
+  <table><tr><td>1</td><td>2</td><td>3</td></tr><tr><td>4</td><td>5</td></tr></table>
+</body></html>
+""")
+
+
+def config_rules():
+    rules = set()
+    for config in sorted(SERVICE_CONFIGS.glob("*.yml")):
+        for matched in re.finditer(r"^\s*rule:\s*(//.+?)\s*$", config.read_text(encoding="utf-8"),
+                                   re.MULTILINE):
+            rules.add(matched.group(1))
+    return sorted(rules)
+
+
+COMPOUND_RULES = [
+    "//div[contains(@class,'post') or contains(@class,'article')]/p",
+    "//div[@id='a' and @class='k']/span",
+    "//span[contains(@class, 'c-font-normal') and contains(@class, 'c-color-text')]",
+    "//div[@id=\"a\" and @class='k']/span",
+]
+
+
+def xpath_texts(elements):
+    return [element.text_content() for element in elements]
+
+
+@pytest.mark.parametrize("rule", config_rules() + COMPOUND_RULES)
+def test_matcher_selects_like_xpath(rule):
+    matcher = SelectorMatcher([('xpath', rule)])
+    matched, = matcher.match(DOCUMENT, lambda _, expression: DOCUMENT.xpath(expression))
+    assert xpath_texts(matched) == xpath_texts(DOCUMENT.xpath(rule))
+
+
+@pytest.mark.parametrize("rule", COMPOUND_RULES)
+def test_compound_predicates_fall_back_to_xpath(rule):
+    assert compile_simple_xpath(rule) is None